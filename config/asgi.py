@@ -9,8 +9,30 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
+from django.urls import reverse
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+
+class Application(ASGIHandler):
+    """
+    Django's ASGI handler, except that /api/events/ requests don't get a thread each.
+
+    Django runs the sync code of a request (middleware, signals, ORM calls) in a thread of
+    its own, kept until the request ends, so every waiting /api/events/ client would hold
+    an idle thread (~220 KB). Those requests share one thread per process instead: they
+    only run a few short queries before and after waiting on asyncio.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'].removeprefix(scope.get('root_path', '')) == events_path:
+            await self.handle(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+
+django.setup(set_prefix=False)
+events_path = reverse('events')
+application = Application()
@@ -83,8 +83,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "textsync.middleware.RequestMetricsMiddleware",  # First, so timings cover the whole stack
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",  # Must be before CommonMiddleware
+    "textsync.middleware.SyncCompressionMiddleware",  # Compresses sync API responses (see API_COMPRESSION)
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -116,13 +118,61 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+# DB_ENGINE=sqlite (default) or postgresql. PostgreSQL lets several gunicorn workers write
+# concurrently; it needs `pip install "psycopg[binary,pool]"`. Move existing data with
+# `python manage.py copy_from_sqlite` (see DEPLOYMENT.md). Tests run on the configured backend.
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
+
+# SQLITE_TUNING=True runs these on every new SQLite connection. WAL lets sync API readers
+# proceed while the admin or load_birou_shortcuts writes; IMMEDIATE transactions take the
+# write lock up front so busy_timeout applies instead of failing with "database is locked"
+# mid-transaction. Keep the WAL small with `python manage.py sqlite_maintenance` (cron).
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", "20000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_BYTES", str(128 * 1024 * 1024))),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": "MEMORY",
+}
+SQLITE_OPTIONS = {
+    "init_command": ";".join(f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()),
+    "transaction_mode": "IMMEDIATE",
 }
 
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("DB_NAME", "autotext"),
+            "USER": os.getenv("DB_USER", "autotext"),
+            "PASSWORD": os.getenv("DB_PASSWORD", ""),
+            "HOST": os.getenv("DB_HOST", "localhost"),
+            "PORT": os.getenv("DB_PORT", "5432"),
+            # Persistent connections: reused across requests by each worker thread
+            "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
+    }
+    if os.getenv("DB_POOL", "False") == "True":
+        # psycopg 3 connection pool per worker process; replaces persistent connections
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "4")),
+            "timeout": int(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+        }
+    }
+    if os.getenv("SQLITE_TUNING", "False") == "True":
+        DATABASES["default"]["OPTIONS"] = SQLITE_OPTIONS
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -162,6 +212,11 @@ CORS_ALLOW_HEADERS = [
     "x-requested-with",
 ]
 CORS_ALLOW_CREDENTIALS = True
+# Sync metadata headers the extension reads from API responses
+CORS_EXPOSE_HEADERS = [
+    "etag",
+    "x-sync-cursor",
+]
 
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
@@ -171,16 +226,107 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # Sliding-window counters in the shared "throttle" cache (see textsync.throttling)
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.AnonRateThrottle",
-        "rest_framework.throttling.UserRateThrottle",
+        "textsync.throttling.AnonSlidingWindowThrottle",
+        "textsync.throttling.UserSlidingWindowThrottle",
     ],
     "DEFAULT_THROTTLE_RATES": {
-        "anon": "100/hour",  # Anonymous users: 100 requests per hour
-        "user": "1000/hour",  # Authenticated users: 1000 requests per hour
+        "anon": os.getenv("THROTTLE_RATE_ANON", "100/hour"),  # Anonymous users: 100 requests per hour
+        "user": os.getenv("THROTTLE_RATE_USER", "1000/hour"),  # Authenticated users: 1000 requests per hour
+        "login": os.getenv("THROTTLE_RATE_LOGIN", "10/minute"),  # Per IP and per username (login_view only)
     },
+    # Behind nginx: the client IP is the last X-Forwarded-For entry (earlier ones can be forged)
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", "1")),
 }
 
+# Caches.
+# "default" holds cached sync reads (see textsync.caching): CACHE_BACKEND=locmem (default, one per
+# worker process), file (CACHE_LOCATION directory, shared by the workers of one host) or
+# redis (CACHE_LOCATION=redis://..., pip install redis; shared by all hosts).
+# Throttle counters must be shared by all worker processes: a file-based cache
+# by default (one host), Redis with THROTTLE_REDIS_URL=redis://... (pip install redis).
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+
+if CACHE_BACKEND == "redis":
+    DEFAULT_CACHE = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", "redis://localhost:6379/0"),
+        "KEY_PREFIX": "autotext",
+    }
+elif CACHE_BACKEND == "file":
+    DEFAULT_CACHE = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", BASE_DIR / "cache" / "default"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "10000"))},
+    }
+else:
+    DEFAULT_CACHE = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "1000"))},
+    }
+
+CACHES = {
+    "default": DEFAULT_CACHE,
+    "throttle": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("THROTTLE_REDIS_URL"),
+            "KEY_PREFIX": "autotext",
+        }
+        if os.getenv("THROTTLE_REDIS_URL") else
+        {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("THROTTLE_CACHE_DIR", BASE_DIR / "cache" / "throttle"),
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    ),
+}
+
+# Lifetime of cached sync reads in a shared cache (entries are versioned per set, so this
+# only bounds memory). With locmem they expire after CACHE_LOCAL_TIMEOUT: a change made
+# through one worker reaches the other workers' caches within that many seconds.
+CACHE_TIMEOUT = int(os.getenv("CACHE_TIMEOUT", str(60 * 60 * 24)))
+CACHE_LOCAL_TIMEOUT = int(os.getenv("CACHE_LOCAL_TIMEOUT", "60"))
+
+# Per-process cache for API token lookups (see textsync.authentication.TokenCache).
+# A deleted token / deactivated user is rejected immediately by the worker that made the change.
+# With a shared cache (CACHE_BACKEND=file or redis) the other workers see a revocation marker on
+# their next request; with locmem they keep accepting the token for up to TOKEN_CACHE_TTL seconds.
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "60"))
+TOKEN_CACHE_SIZE = 1000
+
+# Sync API compression (brotli if installed, else gzip).
+# Set API_COMPRESSION=False when the reverse proxy already compresses application/json.
+API_COMPRESSION = os.getenv("API_COMPRESSION", "True") == "True"
+API_COMPRESSION_PATHS = ["/api/shortcuts/", "/api/sets/"]
+
+# Large shortcut lists: ?limit= pages are capped at SHORTCUT_PAGE_MAX_SIZE rows,
+# ?format=ndjson streams rows read from the database SHORTCUT_STREAM_CHUNK_SIZE at a time.
+SHORTCUT_PAGE_MAX_SIZE = int(os.getenv("SHORTCUT_PAGE_MAX_SIZE", "5000"))
+SHORTCUT_STREAM_CHUNK_SIZE = int(os.getenv("SHORTCUT_STREAM_CHUNK_SIZE", "2000"))
+# /api/shortcuts/search/ results per page when no ?limit= is given
+SHORTCUT_SEARCH_PAGE_SIZE = int(os.getenv("SHORTCUT_SEARCH_PAGE_SIZE", "20"))
+
+# Delta sync change log: `manage.py prune_changes` (daily cron) deletes entries older than
+# SYNC_CHANGE_RETENTION_DAYS. Clients whose cursor is older are told to do a full sync.
+SYNC_CHANGE_RETENTION_DAYS = int(os.getenv("SYNC_CHANGE_RETENTION_DAYS", "90"))
+
+# Change notifications (/api/events/, served under ASGI - see textsync.events).
+# The change log is read every EVENTS_POLL_INTERVAL seconds per process; SSE streams send a
+# keep-alive comment every EVENTS_HEARTBEAT seconds and close after EVENTS_STREAM_TIMEOUT
+# (clients reconnect); long-polls answer 204 after EVENTS_LONGPOLL_TIMEOUT.
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "2"))
+EVENTS_HEARTBEAT = int(os.getenv("EVENTS_HEARTBEAT", "20"))
+EVENTS_STREAM_TIMEOUT = int(os.getenv("EVENTS_STREAM_TIMEOUT", "300"))
+EVENTS_LONGPOLL_TIMEOUT = int(os.getenv("EVENTS_LONGPOLL_TIMEOUT", "25"))
+# Open /api/events/ connections per user and worker process (more get a 429)
+EVENTS_MAX_CONNECTIONS_PER_USER = int(os.getenv("EVENTS_MAX_CONNECTIONS_PER_USER", "5"))
+
+# Request metrics (served at /api/metrics/ to staff users) and slow-request logging
+REQUEST_METRICS = os.getenv("REQUEST_METRICS", "True") == "True"
+SLOW_REQUEST_THRESHOLD_MS = int(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+
 # Logging Configuration
 LOGGING = {
     "version": 1,
@@ -230,6 +376,11 @@ LOGGING = {
             "level": "ERROR",
             "propagate": False,
         },
+        "textsync": {
+            "handlers": ["file", "console"],
+            "level": "WARNING",
+            "propagate": False,
+        },
     },
 }
 
@@ -25,11 +25,11 @@ async function syncShortcuts() {
   console.log("AutoText Background: syncShortcuts() called");
 
   try {
-    let { auth_token, active_sets, api_url, last_sync, shortcuts } = await chrome.storage.local.get([
+    let { auth_token, active_sets, api_url, sync_cursor, shortcuts } = await chrome.storage.local.get([
       "auth_token",
       "active_sets",
       "api_url",
-      "last_sync",
+      "sync_cursor",
       "shortcuts"
     ]);
 
@@ -37,7 +37,7 @@ async function syncShortcuts() {
     console.log("AutoText: Storage retrieved:", {
       has_token: !!auth_token,
       sets_count: active_sets ? active_sets.length : 0,
-      has_last_sync: !!last_sync
+      has_sync_cursor: !!sync_cursor
     });
 
     // Check if user is authenticated
@@ -47,12 +47,12 @@ async function syncShortcuts() {
       return;
     }
 
-    // Force full sync if storage is empty (even if last_sync exists)
+    // Force full sync if storage is empty (even if a sync cursor exists)
     const shortcutsCount = shortcuts ? Object.keys(shortcuts).length : 0;
-    if (shortcutsCount === 0 && last_sync) {
-      console.log("AutoText: Storage is empty but last_sync exists, forcing full sync...");
-      await chrome.storage.local.remove('last_sync');
-      last_sync = null;
+    if (shortcutsCount === 0 && sync_cursor) {
+      console.log("AutoText: Storage is empty but sync_cursor exists, forcing full sync...");
+      await chrome.storage.local.remove('sync_cursor');
+      sync_cursor = null;
     }
 
     // Get active sets (default to 'birou' if none selected)
@@ -62,20 +62,50 @@ async function syncShortcuts() {
     // Build API URL with sets query parameter
     const baseUrl = api_url || `${CONFIG.API_URL}/shortcuts/`;
     const setsParam = sets.join(',');
+    const headers = { Authorization: `Token ${auth_token}` };
+
+    // Delta sync: only fetch changes since the cursor the server gave us last time
+    if (sync_cursor) {
+      console.log("AutoText: Syncing (delta)");
+      const url = `${baseUrl}delta/?sets=${encodeURIComponent(setsParam)}&since=${encodeURIComponent(sync_cursor)}&resolved=1`;
+      const res = await fetch(url, { headers });
+
+      if (res.status === 401) {
+        console.error("AutoText: Authentication failed - token expired or invalid");
+        await handleAuthenticationFailure();
+        return;
+      }
 
-    // Delta sync: only fetch changes since last sync
-    let url = `${baseUrl}?sets=${encodeURIComponent(setsParam)}`;
-    const isDeltaSync = !!last_sync;
-    if (last_sync) {
-      const lastSyncDate = new Date(last_sync).toISOString();
-      url += `&updated_after=${encodeURIComponent(lastSyncDate)}`;
-    }
+      if (res.status === 400) {
+        // Server doesn't recognise our cursor (e.g. database restored) - fall back to full sync
+        console.log("AutoText: Sync cursor rejected, forcing full sync...");
+        await chrome.storage.local.remove('sync_cursor');
+        return syncShortcuts();
+      }
 
-    console.log(`AutoText: Syncing (${isDeltaSync ? 'delta' : 'full'})`);
+      if (!res.ok) {
+        const errorText = await res.text();
+        console.error("AutoText: Failed to sync shortcuts:", res.status, res.statusText);
+        console.error("AutoText: Error details:", errorText);
+        return;
+      }
 
-    const res = await fetch(url, {
-      headers: { Authorization: `Token ${auth_token}` }
-    });
+      const delta = await res.json();
+      const shortcutsMap = applyDelta(shortcuts || {}, delta);
+
+      await chrome.storage.local.set({
+        shortcuts: shortcutsMap,
+        sync_cursor: delta.cursor
+      });
+
+      console.log(`AutoText: Delta sync - ${Object.keys(delta.upserts).length} changed, ${delta.deleted.length} removed. Total shortcuts: ${Object.keys(shortcutsMap).length}`);
+      return;
+    }
+
+    // Full sync: the server resolves duplicate keys (personal > general) and sends one map
+    console.log("AutoText: Syncing (full)");
+    const url = `${baseUrl}?sets=${encodeURIComponent(setsParam)}&resolved=1`;
+    const res = await fetch(url, { headers });
 
     // Handle authentication errors
     if (res.status === 401) {
@@ -91,31 +121,14 @@ async function syncShortcuts() {
       return;
     }
 
-    const serverShortcuts = await res.json();
-    console.log(`AutoText: Received ${serverShortcuts.length} shortcuts from server`);
-
-    // If delta sync and we have existing shortcuts, merge with them
-    let shortcutsMap;
-    if (last_sync && serverShortcuts.length > 0) {
-      // Delta sync - merge with existing shortcuts
-      const { shortcuts: existingShortcuts } = await chrome.storage.local.get('shortcuts');
-      const existingMap = existingShortcuts || {};
-
-      // Update existing map with new/changed shortcuts
-      const newShortcutsMap = mergeShortcutsWithPriority(serverShortcuts);
-      shortcutsMap = { ...existingMap, ...newShortcutsMap };
-
-      console.log(`AutoText: Delta sync - merged ${serverShortcuts.length} changes with existing shortcuts`);
-    } else {
-      // Full sync - replace all shortcuts
-      shortcutsMap = mergeShortcutsWithPriority(serverShortcuts);
-      console.log(`AutoText: Full sync - loaded ${Object.keys(shortcutsMap).length} shortcuts`);
-    }
+    // Full sync - replace all shortcuts
+    const shortcutsMap = await res.json();
+    console.log(`AutoText: Full sync - loaded ${Object.keys(shortcutsMap).length} shortcuts`);
 
-    // Store indexed shortcuts and sync timestamp
+    // Store indexed shortcuts and the server's sync cursor
     await chrome.storage.local.set({
       shortcuts: shortcutsMap,
-      last_sync: Date.now()
+      sync_cursor: res.headers.get('X-Sync-Cursor')
     });
 
     console.log(`AutoText: Sync complete. Total shortcuts: ${Object.keys(shortcutsMap).length}`);
@@ -124,6 +137,117 @@ async function syncShortcuts() {
   }
 }
 
+// Change notifications: hold a long-poll on /api/events/ and sync only when one of
+// our sets changed. The server answers after ~25s without changes (204), so the
+// loop simply asks again. The watchdog alarm restarts the loop if the worker was stopped.
+let watchingChanges = false;
+
+// When /api/events/ fails (or keeps answering 400) the watchdog doesn't retry every minute:
+// it waits 1, 2, 4, ... up to 30 minutes, 5 minutes for servers without /api/events/, or
+// longer if the server sends Retry-After. Kept in storage so a restarted service worker
+// keeps waiting. Meanwhile the periodic delta sync (every PERIODIC_SYNC_MINUTES) keeps the
+// shortcuts current; it is skipped while the long-poll answers.
+const EVENTS_RETRY_MAX_MINUTES = 30;
+const EVENTS_UNSUPPORTED_RETRY_MINUTES = 5;
+const PERIODIC_SYNC_MINUTES = 5;
+
+async function eventsFailed(res) {
+  const { events_failures } = await chrome.storage.local.get("events_failures");
+  const failures = (events_failures || 0) + 1;
+  let minutes = Math.min(2 ** (failures - 1), EVENTS_RETRY_MAX_MINUTES);
+  if (res && res.status === 404) minutes = EVENTS_UNSUPPORTED_RETRY_MINUTES;
+  const retryAfter = Number(res && res.headers.get('Retry-After'));
+  if (retryAfter > 0) minutes = Math.max(minutes, retryAfter / 60);
+
+  await chrome.storage.local.set({
+    events_failures: failures,
+    events_retry_at: Date.now() + minutes * 60000
+  });
+  console.log(`AutoText: Change notifications unavailable (${res ? res.status : 'network error'}), retrying in ${minutes} min`);
+}
+
+async function watchChanges() {
+  if (watchingChanges) return;
+  watchingChanges = true;
+
+  try {
+    const { events_retry_at } = await chrome.storage.local.get("events_retry_at");
+    if (events_retry_at && Date.now() < events_retry_at) return;
+
+    while (true) {
+      const { auth_token, active_sets, api_url, sync_cursor } = await chrome.storage.local.get([
+        "auth_token",
+        "active_sets",
+        "api_url",
+        "sync_cursor"
+      ]);
+      if (!auth_token || !sync_cursor) return;
+
+      const sets = active_sets || ['birou'];
+      const baseUrl = api_url || `${CONFIG.API_URL}/shortcuts/`;
+      const eventsUrl = new URL('../events/', baseUrl);
+      eventsUrl.searchParams.set('sets', sets.join(','));
+      eventsUrl.searchParams.set('since', sync_cursor);
+
+      const res = await fetch(eventsUrl, { headers: { Authorization: `Token ${auth_token}` } });
+
+      if (res.status === 200 || res.status === 204) {
+        await chrome.storage.local.set({ events_ok_at: Date.now() });
+        await chrome.storage.local.remove(["events_failures", "events_retry_at"]);
+      }
+      if (res.status === 204) continue;  // Nothing changed, wait again
+
+      // 400 with "resync": cursor unknown or expired, syncShortcuts falls back to a full sync.
+      // Any other 400 (e.g. an unknown set) won't go away by asking again: back off.
+      const resync = res.status === 400 && (await res.json().catch(() => ({}))).resync;
+      if (res.status === 200 || resync) {
+        // Sets changed
+        await syncShortcuts();
+        const { sync_cursor: newCursor } = await chrome.storage.local.get("sync_cursor");
+        if (newCursor === sync_cursor) {
+          await eventsFailed(res);  // Sync failed; don't spin
+          return;
+        }
+        continue;
+      }
+
+      if (res.status === 401) {
+        await handleAuthenticationFailure();
+        return;
+      }
+
+      // Server without /api/events/ or temporarily unavailable: sync now, retry after the backoff
+      await eventsFailed(res);
+      await syncShortcuts();
+      return;
+    }
+  } catch (error) {
+    console.error("AutoText: Error while waiting for changes:", error);
+    await eventsFailed(null);
+  } finally {
+    watchingChanges = false;
+  }
+}
+
+/**
+ * Apply a resolved delta response ({ upserts: {key: shortcut}, deleted: [ids] })
+ * to the stored shortcuts map. The server re-resolves every key touched since
+ * the cursor, so each touched key is dropped and replaced by its new winner.
+ */
+function applyDelta(existingMap, delta) {
+  const changedIds = new Set(delta.deleted);
+  Object.values(delta.upserts).forEach(shortcut => changedIds.add(shortcut.id));
+
+  const map = {};
+  Object.entries(existingMap).forEach(([key, shortcut]) => {
+    if (!changedIds.has(shortcut.id) && !(key in delta.upserts)) {
+      map[key] = shortcut;
+    }
+  });
+
+  return { ...map, ...delta.upserts };
+}
+
 /**
  * Handle authentication failure (401)
  * Clear auth token and notify user to login again
@@ -157,56 +281,6 @@ function notifyUserToLogin() {
   });
 }
 
-/**
- * Merge shortcuts with conflict resolution
- * Rule: Personal sets take priority over general sets
- *
- * Example:
- *   - shortcut1: key='b', sets=['birou'], set_types=['general']
- *   - shortcut2: key='b', sets=['cosmin'], set_types=['personal']
- *   Result: Use shortcut2 (personal > general)
- */
-function mergeShortcutsWithPriority(shortcuts) {
-  const map = {};
-
-  shortcuts.forEach(shortcut => {
-    const key = shortcut.key;
-
-    // Check if this shortcut belongs to a personal set
-    const hasPersonal = shortcut.set_types && shortcut.set_types.includes('personal');
-
-    // If key doesn't exist yet, add it
-    if (!map[key]) {
-      map[key] = {
-        value: shortcut.value,
-        html_value: shortcut.html_value,
-        id: shortcut.id,
-        sets: shortcut.set_names || [],
-        is_personal: hasPersonal
-      };
-    } else {
-      // Key already exists - check priority
-      const existingIsPersonal = map[key].is_personal;
-
-      // If current shortcut is personal and existing isn't, replace it
-      if (hasPersonal && !existingIsPersonal) {
-        console.log(`AutoText: Replacing '${key}' with personal version`);
-        map[key] = {
-          value: shortcut.value,
-          html_value: shortcut.html_value,
-          id: shortcut.id,
-          sets: shortcut.set_names || [],
-          is_personal: hasPersonal
-        };
-      }
-      // If both are personal or both are general, keep the first one
-      // (API should not return duplicates at same priority level, but just in case)
-    }
-  });
-
-  return map;
-}
-
 // Initialize event listeners (called on startup and when service worker wakes up)
 function initializeListeners() {
   console.log("AutoText: Initializing event listeners...");
@@ -214,29 +288,38 @@ function initializeListeners() {
   // Ensure keepalive is running
   startKeepAlive();
 
-  // Periodic sync every 5 minutes (300000 ms)
-  chrome.alarms.create("syncShortcuts", { periodInMinutes: 5 });
+  // Periodic delta sync, the fallback while change notifications are unavailable
+  chrome.alarms.create("syncShortcuts", { periodInMinutes: PERIODIC_SYNC_MINUTES });
+  // Watchdog: restarts watchChanges() (which waits out its backoff after failures)
+  chrome.alarms.create("watchChanges", { periodInMinutes: 1 });
 }
 
 // Sync on extension startup
 chrome.runtime.onStartup.addListener(() => {
   console.log("AutoText: Extension started, syncing shortcuts...");
   initializeListeners();
-  syncShortcuts();
+  syncShortcuts().then(watchChanges);
 });
 
 // Sync on extension installation/update
 chrome.runtime.onInstalled.addListener(() => {
   console.log("AutoText: Extension installed/updated, syncing shortcuts...");
   initializeListeners();
-  syncShortcuts();
+  syncShortcuts().then(watchChanges);
 });
 
 // Alarm listener (must be at top level, not inside function)
-chrome.alarms.onAlarm.addListener((alarm) => {
+chrome.alarms.onAlarm.addListener(async (alarm) => {
   if (alarm.name === "syncShortcuts") {
+    const { events_ok_at } = await chrome.storage.local.get("events_ok_at");
+    if (events_ok_at && Date.now() - events_ok_at < PERIODIC_SYNC_MINUTES * 60000) return;
     console.log("AutoText: Periodic sync triggered");
     syncShortcuts();
+  } else if (alarm.name === "watchChanges") {
+    if (!watchingChanges) {
+      console.log("AutoText: Watchdog - restarting change notifications");
+      watchChanges();
+    }
   }
 });
 
@@ -249,6 +332,7 @@ chrome.runtime.onMessage.addListener((req, sender, sendResponse) => {
     syncShortcuts().then(() => {
       console.log("AutoText Background: Sync completed, sending response");
       sendResponse({ status: "done" });
+      watchChanges();
     }).catch(error => {
       console.error("AutoText Background: Sync failed:", error);
       sendResponse({ status: "error", message: error.message });
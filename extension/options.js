@@ -336,9 +336,9 @@ async function saveAndSync() {
 
     console.log('Sets saved to storage');
 
-    // Clear last_sync to force full sync (not delta)
-    await chrome.storage.local.remove('last_sync');
-    console.log('Cleared last_sync - forcing full sync');
+    // Clear sync_cursor to force full sync (not delta)
+    await chrome.storage.local.remove(['sync_cursor', 'last_sync']);
+    console.log('Cleared sync_cursor - forcing full sync');
 
     // Trigger sync
     await triggerBackgroundSync();
@@ -1,9 +1,42 @@
 from django import forms
 from django.contrib import admin
-from django.db.models import Q
-from django.utils.html import format_html
+from django.db.models import Aggregate, Count, F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Concat
+from django.utils.html import format_html, format_html_join
 from tinymce.widgets import TinyMCE
+from .caching import SETS_NAMESPACE, CachedValue
 from .models import Shortcut, ShortcutSet, ExpiringToken
+from .search import matching_filter
+
+ShortcutSets = Shortcut.sets.through
+SetVisibleTo = ShortcutSet.visible_to.through
+
+# Joins names in the changelist subqueries; set names and usernames can't contain a newline
+SEPARATOR = '\n'
+
+
+class GroupConcat(Aggregate):
+    """Values of a group joined by a separator: GROUP_CONCAT on SQLite, STRING_AGG on PostgreSQL"""
+    function = 'GROUP_CONCAT'
+    template = '%(function)s(%(expressions)s)'
+    output_field = TextField()
+
+    def __init__(self, expression, separator=SEPARATOR, **extra):
+        super().__init__(expression, Value(separator), **extra)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='STRING_AGG', **extra_context)
+
+
+def joined_per_row(through, field, expression):
+    """Correlated subquery: GroupConcat of expression over the through rows whose field is the outer pk"""
+    return Subquery(
+        through.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(joined=GroupConcat(expression))
+        .values('joined')
+    )
 
 
 @admin.register(ShortcutSet)
@@ -29,16 +62,16 @@ class ShortcutSetAdmin(admin.ModelAdmin):
     )
 
     def get_shortcut_count(self, obj):
-        return obj.shortcuts.count()
+        return obj.shortcut_count
 
     get_shortcut_count.short_description = "Shortcuts"
+    get_shortcut_count.admin_order_field = "shortcut_count"
 
     def get_visible_to(self, obj):
         """Display users who can see this set"""
-        users = obj.visible_to.all()
-        if not users:
+        if not obj.visible_to_names:
             return "-"
-        return ", ".join([u.username for u in users])
+        return ", ".join(sorted(obj.visible_to_names.split(SEPARATOR)))
 
     get_visible_to.short_description = "Shared With"
 
@@ -51,7 +84,18 @@ class ShortcutSetAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         """Filter queryset: staff users see their own sets + sets shared with them, superusers see all"""
-        qs = super().get_queryset(request)
+        # Counts/names as per-row subqueries: a join would be multiplied by the visible_to join below
+        shortcut_count = Subquery(
+            ShortcutSets.objects.filter(shortcutset_id=OuterRef('pk'))
+            .order_by()
+            .values('shortcutset_id')
+            .annotate(count=Count('*'))
+            .values('count')
+        )
+        qs = super().get_queryset(request).select_related('owner').annotate(
+            shortcut_count=Coalesce(shortcut_count, 0),
+            visible_to_names=joined_per_row(SetVisibleTo, 'shortcutset_id', F('user__username')),
+        )
         if request.user.is_superuser:
             return qs
         # Staff users see: sets they own OR sets they're in visible_to
@@ -82,20 +126,28 @@ class ShortcutSetFilter(admin.SimpleListFilter):
     parameter_name = 'set'
 
     def lookups(self, request, model_admin):
-        """Return list of sets available to current user"""
-        if request.user.is_superuser:
-            sets = ShortcutSet.objects.all()
-        else:
-            sets = ShortcutSet.objects.filter(
-                Q(owner=request.user) | Q(visible_to=request.user)
-            ).distinct()
-
-        return [(s.id, f"{s.name} ({s.get_set_type_display()})") for s in sets.order_by('set_type', 'name')]
+        """Return list of sets available to current user (cached until a set changes, like sync.set_access)"""
+        user = request.user
+        cached = CachedValue('admin-sets', [SETS_NAMESPACE], user.pk, int(user.is_superuser))
+        choices = cached.get()
+        if choices is None:
+            if user.is_superuser:
+                sets = ShortcutSet.objects.all()
+            else:
+                sets = ShortcutSet.objects.filter(Q(owner=user) | Q(visible_to=user)).distinct()
+            types = dict(ShortcutSet.SET_TYPES)
+            choices = [
+                (set_id, f"{name} ({types.get(set_type, set_type)})")
+                for set_id, name, set_type in sets.order_by('set_type', 'name').values_list('id', 'name', 'set_type')
+            ]
+            cached.set(choices)
+        return choices
 
     def queryset(self, request, queryset):
         """Filter queryset by selected set"""
         if self.value():
-            return queryset.filter(sets__id=self.value()).distinct()
+            # (shortcut, set) pairs are unique, so this join can't duplicate rows
+            return queryset.filter(sets__id=self.value())
         return queryset
 
 
@@ -104,7 +156,8 @@ class ShortcutAdmin(admin.ModelAdmin):
     form = ShortcutAdminForm
     list_display = ["key", "content_type", "value_preview", "owner", "get_sets", "updated_at", "updated_by"]
     list_filter = [ShortcutSetFilter, "content_type", "owner", "updated_at"]
-    search_fields = ["key", "value", "sets__name"]
+    search_fields = ["key", "value", "sets__name"]  # Shows the search box; see get_search_results
+    search_help_text = "Words match the start of words in the key, text or HTML text, or part of a set name."
     readonly_fields = ["updated_at"]
     filter_horizontal = ["sets"]  # Nice UI for ManyToMany selection
 
@@ -164,24 +217,28 @@ class ShortcutAdmin(admin.ModelAdmin):
 
     def get_sets(self, obj):
         """Display which sets this shortcut belongs to with color coding"""
-        sets = obj.sets.all()
-        if not sets:
+        if not obj.set_labels:
             return format_html('<em style="color: #999;">No sets</em>')
 
+        # "set_type:name" labels, sorted like ShortcutSet.Meta.ordering
+        sets = sorted(label.split(':', 1) for label in obj.set_labels.split(SEPARATOR))
+
         # Color code by set type
         set_badges = []
-        for s in sets:
-            if s.set_type == 'general':
+        for set_type, name in sets:
+            if set_type == 'general':
                 color = '#4CAF50'  # Green for general
                 icon = '🏢'
             else:
                 color = '#2196F3'  # Blue for personal
                 icon = '👤'
+            set_badges.append((color, icon, name))
 
-            badge = f'<span style="background: {color}; color: white; padding: 2px 8px; border-radius: 3px; margin-right: 4px; font-size: 11px;">{icon} {s.name}</span>'
-            set_badges.append(badge)
-
-        return format_html(''.join(set_badges))
+        return format_html_join(
+            '',
+            '<span style="background: {}; color: white; padding: 2px 8px; border-radius: 3px; margin-right: 4px; font-size: 11px;">{} {}</span>',
+            set_badges,
+        )
 
     get_sets.short_description = "Sets"
 
@@ -189,14 +246,26 @@ class ShortcutAdmin(admin.ModelAdmin):
         """Filter queryset: staff users see only their own shortcuts, superusers see all"""
         qs = super().get_queryset(request)
 
-        # Prefetch sets for better performance
-        qs = qs.prefetch_related('sets', 'sets__owner')
+        # Set badges come from one subquery column instead of a query per row
+        qs = qs.select_related('owner', 'updated_by').annotate(
+            set_labels=joined_per_row(
+                ShortcutSets, 'shortcut_id', Concat('shortcutset__set_type', Value(':'), 'shortcutset__name'),
+            ),
+        )
 
         # Filter by user permissions
         if request.user.is_superuser:
             return qs.order_by('key')
         return qs.filter(owner=request.user).order_by('key')
 
+    def get_search_results(self, request, queryset, search_term):
+        """Full-text index (see search.py) instead of LIKE '%term%' scans; set names still match as substrings"""
+        matches = matching_filter(search_term)
+        if matches is None:
+            return queryset, False
+        in_sets = ShortcutSets.objects.filter(shortcutset__name__icontains=search_term.strip()).values('shortcut_id')
+        return queryset.filter(matches | Q(pk__in=in_sets)), False
+
     def save_model(self, request, obj, form, change):
         """Auto-assign owner and updated_by to current user"""
         # Set owner to current user if not set (for new objects or objects without owner)
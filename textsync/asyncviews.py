@@ -0,0 +1,92 @@
+"""
+Async handlers for DRF views (DRF itself only dispatches synchronously).
+
+Views using AsyncAPIViewMixin may define `async def` handlers (get, list, retrieve, ...).
+A route whose handlers are all async gets a coroutine view function, so under an ASGI
+server (config/asgi.py) the request waits on the event loop instead of a worker;
+under WSGI Django runs it with async_to_sync and it behaves like a sync view.
+
+Authentication, permissions and throttling are DRF's own checks (view.initial), run in a
+single sync_to_async call, and errors go through the regular exception handler, so
+responses (401/403/429, Retry-After, WWW-Authenticate) are the same as for the sync views.
+"""
+
+from functools import update_wrapper
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.views.decorators.csrf import csrf_exempt
+
+
+class AsyncAPIViewMixin:
+    """Mix into APIView / GenericViewSet subclasses before the DRF base class"""
+
+    @classmethod
+    def as_view(cls, *args, **initkwargs):
+        view = super().as_view(*args, **initkwargs)
+        actions = getattr(view, 'actions', None)
+        if actions is None or not cls.is_async_route(actions):
+            # Plain APIView: Django's View.as_view already made it async if all handlers are
+            return view
+
+        # ViewSetMixin.as_view always returns a sync function; its dispatch returns a coroutine here
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        update_wrapper(async_view, view)
+        return csrf_exempt(async_view)
+
+    @classmethod
+    def is_async_route(cls, actions=None):
+        """Whether every handler of the route (the viewset actions, or the APIView's methods) is async"""
+        if actions is None:
+            return cls.view_is_async
+        return all(iscoroutinefunction(getattr(cls, action)) for action in actions.values())
+
+    def dispatch(self, request, *args, **kwargs):
+        # Async routes handle every method here (sync ones like OPTIONS run in a thread)
+        if self.is_async_route(getattr(self, 'action_map', None)):
+            return self.adispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """APIView.dispatch with the handler awaited"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication, permissions and throttles may hit the database/cache: one thread hop
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_object(self, queryset):
+        """GenericAPIView.get_object for an async handler, on an already built queryset"""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            # Same message as get_object_or_404, so the 404 body matches the sync views
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(self.request, obj)
+        return obj
@@ -1,8 +1,107 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
 from rest_framework import authentication, exceptions
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.utils import timezone
+from .caching import bump_namespaces, is_shared, namespace_versions
 from .models import ExpiringToken
 
 
+def token_namespace(key):
+    # Hashed: the key is a credential and cache keys aren't secret
+    return f"token:{hashlib.sha256(key.encode()).hexdigest()[:32]}"
+
+
+def user_namespace(user_id):
+    return f"user:{user_id}"
+
+
+class TokenCache:
+    """
+    Per-process LRU cache: token key -> (deadline, user field values, token field values, versions).
+
+    Entries live at most `ttl` seconds and never past the token's own expires_at.
+    Deletion of a token or any save of its user evicts it (see signals.py). With a shared
+    cache the eviction also bumps the token's and user's namespaces (caching.py), which
+    every worker checks on each hit (one cache read instead of the token query), so other
+    workers drop the entry right away. With the per-process LocMemCache they only pick
+    the change up within `ttl`.
+    """
+
+    def __init__(self, max_size=1000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return fresh (user, token) instances for a cached key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            deadline, user_values, token_values, versions = entry
+            if time.time() >= deadline:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+
+        if versions is not None and namespace_versions(versions) != versions:
+            self.discard(key)  # Revoked by another worker
+            return None
+
+        # Rebuild instances per request so concurrent requests never share model objects
+        user = User.from_db('default', list(user_values), list(user_values.values()))
+        token = ExpiringToken.from_db('default', list(token_values), list(token_values.values()))
+        user.auth_token = token
+        return user, token
+
+    def set(self, token):
+        """Cache a token fetched with select_related('user')"""
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        deadline = min(time.time() + self.ttl, token.expires_at.timestamp())
+        user_values = {f.attname: getattr(token.user, f.attname) for f in User._meta.concrete_fields}
+        token_values = {f.attname: getattr(token, f.attname) for f in ExpiringToken._meta.concrete_fields}
+        # Revocations commit with a second bump (bump_namespaces), so only one racing this line waits for the ttl
+        versions = namespace_versions([token_namespace(token.key), user_namespace(token.user_id)]) if is_shared() else None
+        with self._lock:
+            self._entries[token.key] = (deadline, user_values, token_values, versions)
+            self._entries.move_to_end(token.key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.discard(key)
+        if is_shared():
+            bump_namespaces([token_namespace(key)])
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [k for k, (_, user_values, _, _) in self._entries.items() if user_values['id'] == user_id]:
+                del self._entries[key]
+        if is_shared():
+            bump_namespaces([user_namespace(user_id)])
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'TOKEN_CACHE_SIZE', 1000),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 60),
+)
+
+
 class ExpiringTokenAuthentication(authentication.BaseAuthentication):
     """
     Custom token authentication with expiration.
@@ -34,6 +133,11 @@ class ExpiringTokenAuthentication(authentication.BaseAuthentication):
         return self.authenticate_credentials(token)
 
     def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            # Cached entries are only stored for active users and never outlive expires_at
+            return cached
+
         try:
             token = self.model.objects.select_related('user').get(key=key)
         except self.model.DoesNotExist:
@@ -46,6 +150,7 @@ class ExpiringTokenAuthentication(authentication.BaseAuthentication):
         if token.is_expired():
             raise exceptions.AuthenticationFailed('Token has expired.')
 
+        token_cache.set(token)
         return (token.user, token)
 
     def authenticate_header(self, request):
@@ -0,0 +1,206 @@
+"""
+Per-set shortcut bundles, materialised on write.
+
+Each set has a ShortcutSetBundle: its shortcut_rows() (ordered by key, id) rendered to JSON
+once and stored gzip-compressed with a SHA-256 content hash. Whole-list sync responses are
+built from the bundles of the requested sets (bundle_json, bundle_rows) instead of reading
+and serializing every shortcut again.
+
+Writes bump the set versions (signals.bump_sets), which makes their bundles stale, and
+schedule a rebuild: the sets changed by a transaction are rebuilt once each when it
+commits, in the committing thread, so a bulk admin action on a thousand shortcuts of a
+set rebuilds that set once. Reads never write: while a requested set has no bundle of
+its current version (not built yet, or its rebuild failed), they read the database
+(sync.set_rows). `manage.py rebuild_bundles` builds them all, e.g. after migrating.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import weakref
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Shortcut, ShortcutSet, ShortcutSetBundle
+from .sync import render_json, set_rows, shortcut_rows
+
+logger = logging.getLogger('textsync.bundles')
+
+
+def build_bundle(set_id):
+    """Render and store the bundle of one set; returns it, or None if the set doesn't exist"""
+    # Version first: a change committed while the rows are read leaves the bundle stale, never wrong
+    version = ShortcutSet.objects.filter(pk=set_id).values_list('version', flat=True).first()
+    if version is None:
+        return None
+    rows = shortcut_rows(Shortcut.objects.filter(sets=set_id).order_by('key', 'id'))
+    body = render_json(rows)
+    bundle = ShortcutSetBundle(
+        shortcut_set_id=set_id,
+        version=version,
+        content_hash=hashlib.sha256(body).hexdigest(),
+        data=gzip.compress(body, mtime=0),
+        size=len(body),
+        row_count=len(rows),
+    )
+    bundle._rows = rows
+    store_bundle(bundle)
+    return bundle
+
+
+def store_bundle(bundle):
+    """Save a freshly built bundle unless one built from a newer version was stored meanwhile"""
+    stored = ShortcutSetBundle.objects.filter(pk=bundle.pk).values_list('content_hash', flat=True).first()
+    if stored is None:
+        try:
+            with transaction.atomic():
+                bundle.save(force_insert=True)
+        except IntegrityError:
+            pass  # Built concurrently by another request or worker
+        return
+
+    fields = {'version': bundle.version, 'built_at': timezone.now()}
+    if stored != bundle.content_hash:
+        # Only a version bump when the content didn't change (e.g. a save without edits)
+        fields.update(content_hash=bundle.content_hash, data=bundle.data, size=bundle.size,
+                      row_count=bundle.row_count)
+    ShortcutSetBundle.objects.filter(pk=bundle.pk, version__lte=bundle.version).update(**fields)
+
+
+def current_bundles(set_ids):
+    """Bundles of the given sets (in set_ids order), or None if any set has no up-to-date one"""
+    bundles = {
+        bundle.pk: bundle
+        for bundle in ShortcutSetBundle.objects.filter(
+            shortcut_set__in=set_ids, version=F('shortcut_set__version')
+        )
+    }
+    if len(bundles) < len(set(set_ids)):
+        return None
+    return [bundles[set_id] for set_id in set_ids]
+
+
+def bundle_body(bundle):
+    return gzip.decompress(bundle.data)
+
+
+def rows_of(bundle):
+    rows = getattr(bundle, '_rows', None)
+    if rows is None:
+        rows = json.loads(bundle_body(bundle))
+    return rows
+
+
+def sorted_keys(keys):
+    """
+    Distinct keys in the order the database sorts the key column: code point order on
+    SQLite (BINARY collation of UTF-8), the database collation on PostgreSQL (one query).
+    """
+    keys = sorted(set(keys))
+    if connection.vendor == 'postgresql' and len(keys) > 1:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT k FROM unnest(%s::varchar[]) AS k ORDER BY k', [keys])
+            keys = [key for key, in cursor.fetchall()]
+    return keys
+
+
+def merge_rows(bundles):
+    """
+    Rows of several bundles, ordered by (key, id) like the database listings. A shortcut in
+    several of the sets has the same row in each bundle (set names list all its sets), so it
+    is listed once.
+    """
+    if len(bundles) == 1:
+        return rows_of(bundles[0])
+    rows = {}
+    for bundle in bundles:
+        for row in rows_of(bundle):
+            rows.setdefault(row['id'], row)
+    position = {key: i for i, key in enumerate(sorted_keys(row['key'] for row in rows.values()))}
+    return sorted(rows.values(), key=lambda row: (position[row['key']], row['id']))
+
+
+def bundle_rows(set_ids):
+    """shortcut_rows() of every shortcut in any of the sets, ordered by (key, id), from their bundles"""
+    bundles = current_bundles(set_ids)
+    if bundles is None:
+        return set_rows(set_ids)
+    return merge_rows(bundles)
+
+
+def bundle_json(set_ids):
+    """render_json(bundle_rows(set_ids)); a single set's stored JSON is used as is"""
+    bundles = current_bundles(set_ids)
+    if bundles is not None and len(bundles) == 1:
+        return bundle_body(bundles[0])
+    return render_json(set_rows(set_ids) if bundles is None else merge_rows(bundles))
+
+
+class RebuildBatch:
+    """
+    Sets changed by one transaction, handed to the rebuilder once it commits.
+    `done` marks it as committed: captureOnCommitCallbacks(execute=True) runs the callbacks
+    of a test "transaction" but keeps them referenced.
+    """
+
+    def __init__(self, rebuilder):
+        self.rebuilder = rebuilder
+        self.set_ids = set()
+        self.done = False
+
+    def committed(self):
+        self.done = True
+        self.rebuilder.run(self.set_ids)
+
+
+class BundleRebuilder:
+    """
+    Rebuilds the bundles of sets changed by committed transactions, each set once per
+    transaction, in the committing thread (right away for changes outside a transaction).
+    """
+
+    def __init__(self):
+        self._batches = threading.local()  # Connection alias: weak reference to its open RebuildBatch
+
+    def schedule(self, set_ids):
+        """Rebuild set_ids after the current transaction commits (right away outside one)"""
+        set_ids = set(set_ids)
+        if not set_ids:
+            return
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            self.run(set_ids)
+            return
+        batch = self.open_batch(connection)
+        if batch is None:
+            batch = RebuildBatch(self)
+            transaction.on_commit(batch.committed, using=connection.alias)
+            setattr(self._batches, connection.alias, weakref.ref(batch))
+        batch.set_ids |= set_ids
+
+    def open_batch(self, connection):
+        """
+        The batch registered by an earlier change of the current transaction, if any.
+        Only its on_commit callback holds on to it: when the transaction (or the savepoint
+        it was registered in) rolls back, Django drops the callback and the batch with it.
+        """
+        ref = getattr(self._batches, connection.alias, None)
+        batch = ref() if ref is not None else None
+        if batch is None or batch.done:
+            return None
+        return batch
+
+    def run(self, set_ids):
+        for set_id in sorted(set_ids):
+            try:
+                build_bundle(set_id)
+            except Exception:
+                # Reads use the database until a later change (or rebuild_bundles) rebuilds it
+                logger.exception("Rebuilding the bundle of set %s failed", set_id)
+
+
+rebuilder = BundleRebuilder()
@@ -0,0 +1,221 @@
+"""
+Versioned cache for sync reads (the "default" cache, see CACHES in settings).
+
+Cached values live in namespaces: "set:<id>" for everything built from one set's content
+(its shortcuts, their set names and owners, the set itself) and "sets" for what depends on
+which sets exist and who may see them. Each namespace has a version number kept in the
+cache, and a value's key contains the versions of all its namespaces, so bumping a namespace
+(bump_namespaces, called by the signal handlers on every write) makes every value built from
+it unreachable at once. Nothing is deleted; old entries expire or are evicted.
+
+    cached = CachedValue('shortcuts', set_namespaces(set_ids), 'resolved')
+    data = cached.get()  # None on a miss
+    if data is None:
+        data = build()   # read after get(): a write meanwhile bumps the versions
+        cached.set(data)
+
+Lookups are counted per kind: in this worker's /api/metrics/ right away, and in the cache
+every STATS_FLUSH_INTERVAL seconds, where `python manage.py cache_stats` reads them.
+"""
+
+import hashlib
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .metrics import registry
+
+SETS_NAMESPACE = 'sets'
+NAMESPACE_KEY = 'textsync:ns:{}'
+STATS_KEY = 'textsync:stats:{}:{}'
+STATS_SINCE_KEY = 'textsync:stats:since'
+STATS_FLUSH_INTERVAL = 10
+
+# Kinds of cached values (cache_stats reports one line per kind)
+KINDS = {
+    'access': 'Set name -> id maps per user (sync.set_access)',
+    'admin-sets': 'Set filter choices per staff user (admin)',
+    'set': 'Serialized sets (ShortcutSetSerializer)',
+    'shortcuts': 'Rendered full shortcut lists per set selection and layout',
+    'snapshot': 'Rendered snapshots per set versions (ETag)',
+}
+
+
+def is_shared():
+    """Whether all worker processes use the same cache (anything but the per-process LocMemCache)"""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def default_timeout():
+    """
+    Entry lifetime. Versions only change in the cache of the process that made the change,
+    so with a per-process cache entries must expire soon for other workers to see it.
+    """
+    return settings.CACHE_TIMEOUT if is_shared() else settings.CACHE_LOCAL_TIMEOUT
+
+
+def set_namespace(set_id):
+    return f"set:{set_id}"
+
+
+def set_namespaces(set_ids):
+    return [set_namespace(set_id) for set_id in set_ids]
+
+
+def namespace_versions(namespaces):
+    """
+    {namespace: version} in one cache read.
+    Missing versions are seeded from the clock, so an evicted counter never revives old entries.
+    """
+    keys = {NAMESPACE_KEY.format(namespace): namespace for namespace in namespaces}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    for key, namespace in keys.items():
+        if namespace not in versions:
+            version = int(time.time() * 1000)
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[namespace] = version
+    return versions
+
+
+def bump_namespaces(namespaces):
+    """
+    Invalidate everything cached in the given namespaces. Inside a transaction they are
+    bumped again on commit: other requests may have cached the old rows in between.
+    """
+    namespaces = set(namespaces)
+    if not namespaces:
+        return
+    increment_versions(namespaces)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: increment_versions(namespaces))
+
+
+def increment_versions(namespaces):
+    for namespace in namespaces:
+        key = NAMESPACE_KEY.format(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), None)
+
+
+class CachedValue:
+    """A value of some kind, keyed by the versions of its namespaces and any extra parts"""
+
+    def __init__(self, kind, namespaces=(), *parts, timeout=None):
+        self.kind = kind
+        self.namespaces = sorted(set(namespaces))
+        self.parts = parts
+        self.timeout = timeout
+        self.key = None
+
+    def make_key(self, versions):
+        raw = '|'.join([
+            ','.join(f"{namespace}={versions[namespace]}" for namespace in self.namespaces),
+            *map(str, self.parts),
+        ])
+        self.key = f"textsync:{self.kind}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+    def get(self):
+        """The cached value or None. Fixes the key set() stores under."""
+        return get_many([self])[0]
+
+    def set(self, value):
+        set_many({self: value})
+
+    async def aget(self):
+        return await sync_to_async(self.get)()
+
+    async def aset(self, value):
+        await sync_to_async(self.set)(value)
+
+
+def get_many(values):
+    """Cached values (None for misses) of CachedValue objects, in two cache reads however many"""
+    versions = namespace_versions({namespace for value in values for namespace in value.namespaces})
+    for value in values:
+        value.make_key(versions)
+    found = cache.get_many([value.key for value in values])
+    results = [found.get(value.key) for value in values]
+    for value, result in zip(values, results):
+        stats.record(value.kind, result is not None)
+    return results
+
+
+def set_many(items):
+    """Store {CachedValue: value}, under the keys read by get()/get_many() if they were"""
+    unkeyed = [value for value in items if value.key is None]
+    if unkeyed:
+        versions = namespace_versions({namespace for value in unkeyed for namespace in value.namespaces})
+        for value in unkeyed:
+            value.make_key(versions)
+
+    by_timeout = {}
+    for value, data in items.items():
+        by_timeout.setdefault(value.timeout or default_timeout(), {})[value.key] = data
+    for timeout, data in by_timeout.items():
+        cache.set_many(data, timeout)
+
+
+class CacheStats:
+    """
+    Hits and misses per kind. Counted in the metrics registry on every lookup and added to
+    counters in the cache in batches (one incr per kind and result per flush interval).
+    The file cache has no atomic incr, so its totals can miss a few concurrent flushes.
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, kind, hit):
+        result = 'hit' if hit else 'miss'
+        registry.record_cache_lookup(kind, result)
+        with self._lock:
+            self.pending[kind, result] = self.pending.get((kind, result), 0) + 1
+            if time.monotonic() - self.flushed_at < self.flush_interval:
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self.pending, self.flushed_at = self.pending, {}, time.monotonic()
+        if not pending:
+            return
+        cache.add(STATS_SINCE_KEY, timezone.now().isoformat(), None)
+        for (kind, result), count in pending.items():
+            key = STATS_KEY.format(kind, result)
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                if not cache.add(key, count, None):
+                    cache.incr(key, count)
+
+    def read(self):
+        """({kind: (hits, misses)}, ISO time counting started or None) from the cache"""
+        keys = [STATS_KEY.format(kind, result) for kind in KINDS for result in ('hit', 'miss')]
+        values = cache.get_many(keys + [STATS_SINCE_KEY])
+        counts = {
+            kind: (values.get(STATS_KEY.format(kind, 'hit'), 0), values.get(STATS_KEY.format(kind, 'miss'), 0))
+            for kind in KINDS
+        }
+        return counts, values.get(STATS_SINCE_KEY)
+
+    def reset(self):
+        with self._lock:
+            self.pending = {}
+        cache.delete_many(
+            [STATS_KEY.format(kind, result) for kind in KINDS for result in ('hit', 'miss')] + [STATS_SINCE_KEY]
+        )
+
+
+stats = CacheStats(STATS_FLUSH_INTERVAL)
@@ -0,0 +1,153 @@
+"""
+Change notifications for /api/events/ (see views.events_view).
+
+One ChangeBroker per process tails the ShortcutChange log and fans new entries out
+to the waiting clients of that process, so clients learn "sets X, Y changed at cursor N"
+and fetch /api/shortcuts/delta/ only when something changed.
+
+The broker wakes up immediately when this process commits a change (notify(), called
+from signals.record_changes) and otherwise reads the log every EVENTS_POLL_INTERVAL
+seconds, which picks up changes committed by other processes (gunicorn workers, the
+admin, management commands). That is one small query per interval per process,
+however many clients are connected, and needs nothing but the database.
+A user may hold at most `max_per_user` subscriptions per process.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import ShortcutChange
+from .sync import acurrent_cursor
+
+logger = logging.getLogger('textsync.events')
+
+
+class TooManyConnections(Exception):
+    pass
+
+
+class Subscription:
+    """One waiting client: the set ids it follows and a queue of (cursor, changed set ids)"""
+
+    def __init__(self, set_ids, user_id=None):
+        self.set_ids = frozenset(set_ids)
+        self.user_id = user_id
+        self.queue = asyncio.Queue()
+
+
+class ChangeBroker:
+    def __init__(self, poll_interval=2.0, max_per_user=None):
+        self.poll_interval = poll_interval
+        self.max_per_user = max_per_user
+        self.subscriptions = set()
+        self.per_user = Counter()
+        self.loop = None
+        self.wakeup = None
+        self.starting = None
+        self.task = None
+        self.last_id = 0
+        self._lock = threading.Lock()
+
+    def notify(self):
+        """Check the log now instead of at the next poll. Safe to call from any thread."""
+        with self._lock:
+            loop, wakeup = self.loop, self.wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def at_limit(self, user_id):
+        """Whether user_id already holds max_per_user subscriptions in this process"""
+        return bool(self.max_per_user) and self.per_user[user_id] >= self.max_per_user
+
+    async def subscribe(self, set_ids, user_id=None):
+        """
+        Start following set_ids; changes committed after this call are delivered to the subscription.
+        Raises TooManyConnections if user_id already has max_per_user subscriptions in this process.
+        """
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # First subscriber (or a new event loop, e.g. in tests): start over on this loop
+            with self._lock:
+                self.loop, self.wakeup = loop, asyncio.Event()
+            self.subscriptions, self.task, self.starting = set(), None, asyncio.Lock()
+            self.per_user = Counter()
+
+        async with self.starting:
+            if self.task is None:
+                self.last_id = await acurrent_cursor()
+                # Own empty context: the task outlives the request that started it (and its metrics)
+                self.task = contextvars.Context().run(loop.create_task, self.run())
+
+        # No await from the check to add(): concurrent requests can't both take the last slot
+        if user_id is not None and self.at_limit(user_id):
+            raise TooManyConnections
+        subscription = Subscription(set_ids, user_id)
+        self.subscriptions.add(subscription)
+        if user_id is not None:
+            self.per_user[user_id] += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.discard(subscription)
+            if subscription.user_id is not None:
+                self.per_user[subscription.user_id] -= 1
+                if not self.per_user[subscription.user_id]:
+                    del self.per_user[subscription.user_id]
+
+    async def run(self):
+        """Read new log entries and fan them out until nobody is subscribed"""
+        try:
+            while self.subscriptions:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                if not self.subscriptions:
+                    break
+                try:
+                    await self.publish_new_changes()
+                except Exception:
+                    # Keep serving the connected clients; the next poll retries
+                    logger.exception("Reading the change log failed")
+        finally:
+            self.task = None
+
+    async def publish_new_changes(self):
+        # One row per changed set, however many shortcuts changed
+        rows = [
+            row async for row in ShortcutChange.objects.filter(id__gt=self.last_id)
+            .order_by().values_list('shortcut_set_id').annotate(last_id=Max('id'))
+        ]
+        if not rows:
+            return
+        self.last_id = max(last_id for _, last_id in rows)
+        changed = {set_id for set_id, _ in rows}
+        for subscription in list(self.subscriptions):
+            set_ids = subscription.set_ids & changed
+            if set_ids:
+                subscription.queue.put_nowait((self.last_id, set_ids))
+
+
+async def changed_set_ids(set_ids, since):
+    """(latest cursor, set ids changed after since) from the log, for clients catching up"""
+    rows = [
+        row async for row in ShortcutChange.objects.filter(id__gt=since, shortcut_set_id__in=set_ids)
+        .order_by().values_list('shortcut_set_id').distinct()
+    ]
+    if not rows:
+        return since, set()
+    return await acurrent_cursor(), {set_id for set_id, in rows}
+
+
+broker = ChangeBroker(
+    poll_interval=getattr(settings, 'EVENTS_POLL_INTERVAL', 2.0),
+    max_per_user=getattr(settings, 'EVENTS_MAX_CONNECTIONS_PER_USER', 5),
+)
@@ -0,0 +1,282 @@
+"""
+Streaming readers and writers for shortcut import/export.
+
+Readers yield one {"key", "value", "html_value", "content_type"} dict per shortcut
+while reading the file incrementally; writers consume such dicts one at a time.
+Neither side ever holds a whole file in memory.
+
+Formats:
+- json: an array of shortcut objects (Django fixtures with "model"/"fields" are accepted too)
+- ndjson: one shortcut object per line
+- csv: key,value,html_value,content_type columns with a header row
+- espanso: an espanso match file ("matches:" with trigger/replace or trigger/html)
+"""
+
+import csv
+import json
+
+from django.utils.html import strip_tags
+
+try:
+    import yaml
+except ImportError:  # Optional: pip install pyyaml (espanso format only)
+    yaml = None
+
+FORMATS = ('json', 'ndjson', 'csv', 'espanso')
+
+EXTENSIONS = {
+    '.json': 'json',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.csv': 'csv',
+    '.yml': 'espanso',
+    '.yaml': 'espanso',
+}
+
+CSV_COLUMNS = ['key', 'value', 'html_value', 'content_type']
+
+
+def format_for_path(path):
+    """Format implied by a file extension, or None"""
+    for extension, fmt in EXTENSIONS.items():
+        if str(path).lower().endswith(extension):
+            return fmt
+    return None
+
+
+def require_yaml():
+    if yaml is None:
+        raise ValueError("The espanso format needs PyYAML: pip install pyyaml")
+
+
+# Readers
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array, decoding one element at a time"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+
+    def more():
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def next_char():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not more():
+                return ''
+
+    if next_char() != '[':
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    if next_char() == ']':
+        return
+
+    while True:
+        next_char()
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+                # A value ending exactly at the buffer end may continue in the next chunk
+                if end < len(buffer) or eof:
+                    break
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f"Invalid JSON: {e}") from None
+            more()
+        pos = end
+        yield element
+
+        separator = next_char()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f"Invalid JSON: expected ',' or ']' but found {separator or 'end of file'!r}")
+        pos += 1
+
+
+def shortcut_from_record(record):
+    """Shortcut dict from an exported record or a Django fixture entry; None for other models"""
+    if 'fields' in record and 'model' in record:
+        if record['model'].lower() != 'textsync.shortcut':
+            return None
+        record = record['fields']
+    return {field: record[field] for field in CSV_COLUMNS if field in record}
+
+
+def read_json(f):
+    for record in iter_json_array(f):
+        shortcut = shortcut_from_record(record)
+        if shortcut is not None:
+            yield shortcut
+
+
+def read_ndjson(f):
+    for line_number, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}") from None
+        shortcut = shortcut_from_record(record)
+        if shortcut is not None:
+            yield shortcut
+
+
+def read_csv(f):
+    reader = csv.DictReader(f)
+    if not reader.fieldnames or 'key' not in reader.fieldnames:
+        raise ValueError(f"CSV needs a header row with at least a 'key' column ({', '.join(CSV_COLUMNS)})")
+    for row in reader:
+        shortcut = {field: row[field] for field in CSV_COLUMNS if row.get(field) is not None}
+        if not shortcut.get('content_type'):
+            shortcut.pop('content_type', None)
+        yield shortcut
+
+
+def iter_espanso_matches(f):
+    """
+    Yield the entries of the top-level "matches" list one by one.
+    Uses PyYAML's composer per entry instead of yaml.safe_load of the whole document.
+    """
+    require_yaml()
+    loader = yaml.SafeLoader(f)
+    try:
+        loader.get_event()  # StreamStart
+        if not loader.check_event(yaml.DocumentStartEvent):
+            return
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise ValueError("Expected an espanso match file (a mapping with 'matches')")
+        loader.get_event()
+
+        while not loader.check_event(yaml.MappingEndEvent):
+            name = loader.construct_document(loader.compose_node(None, None))
+            if name == 'matches' and loader.check_event(yaml.SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    yield loader.construct_document(loader.compose_node(None, None))
+                loader.get_event()
+            else:
+                loader.compose_node(None, None)  # Skip global_vars, imports, ...
+    except yaml.YAMLError as e:
+        raise ValueError(f"Invalid YAML: {e}") from None
+    finally:
+        loader.dispose()
+
+
+def read_espanso(f, trigger_prefix=''):
+    """
+    Shortcuts from espanso matches. Matches with "triggers" give one shortcut per trigger;
+    matches without replace/html (forms, images, ...) are skipped.
+    """
+    for match in iter_espanso_matches(f):
+        if not isinstance(match, dict):
+            continue
+        triggers = match.get('triggers') or [match.get('trigger')]
+
+        if match.get('html'):
+            shortcut = {
+                'value': strip_tags(match['html']),
+                'html_value': match['html'],
+                'content_type': 'html',
+            }
+        elif match.get('replace') is not None:
+            shortcut = {'value': str(match['replace']), 'html_value': None, 'content_type': 'text'}
+        else:
+            continue
+
+        for trigger in triggers:
+            if trigger:
+                yield {'key': str(trigger).removeprefix(trigger_prefix), **shortcut}
+
+
+def read_shortcuts(f, fmt, trigger_prefix=''):
+    """Iterate shortcut dicts from a text file object in the given format"""
+    if fmt == 'json':
+        return read_json(f)
+    if fmt == 'ndjson':
+        return read_ndjson(f)
+    if fmt == 'csv':
+        return read_csv(f)
+    if fmt == 'espanso':
+        return read_espanso(f, trigger_prefix)
+    raise ValueError(f"Unknown format: {fmt}")
+
+
+# Writers
+
+def dump_json(shortcut):
+    return json.dumps(shortcut, ensure_ascii=False)
+
+
+def write_json(f, shortcuts):
+    count = 0
+    f.write('[')
+    for shortcut in shortcuts:
+        f.write(',\n' if count else '\n')
+        f.write(dump_json(shortcut))
+        count += 1
+    f.write('\n]\n' if count else ']\n')
+    return count
+
+
+def write_ndjson(f, shortcuts):
+    count = 0
+    for shortcut in shortcuts:
+        f.write(dump_json(shortcut) + '\n')
+        count += 1
+    return count
+
+
+def write_csv(f, shortcuts):
+    writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    count = 0
+    for shortcut in shortcuts:
+        writer.writerow(shortcut)
+        count += 1
+    return count
+
+
+def write_espanso(f, shortcuts, trigger_prefix=''):
+    """
+    espanso match file. HTML shortcuts are written as "html" matches, everything else
+    as "replace" (espanso allows only one of them, so the plain value of HTML shortcuts is dropped).
+    """
+    require_yaml()
+    count = 0
+    f.write('matches:\n')
+    for shortcut in shortcuts:
+        match = {'trigger': trigger_prefix + shortcut['key']}
+        if shortcut.get('content_type') == 'html' and shortcut.get('html_value'):
+            match['html'] = shortcut['html_value']
+        else:
+            match['replace'] = shortcut['value']
+        f.write(yaml.safe_dump([match], allow_unicode=True, sort_keys=False, width=1000))
+        count += 1
+    return count
+
+
+def write_shortcuts(f, fmt, shortcuts, trigger_prefix=''):
+    """Write shortcut dicts to a text file object; returns how many were written"""
+    if fmt == 'json':
+        return write_json(f, shortcuts)
+    if fmt == 'ndjson':
+        return write_ndjson(f, shortcuts)
+    if fmt == 'csv':
+        return write_csv(f, shortcuts)
+    if fmt == 'espanso':
+        return write_espanso(f, shortcuts, trigger_prefix)
+    raise ValueError(f"Unknown format: {fmt}")
@@ -0,0 +1,125 @@
+"""
+Bulk shortcut import into a set.
+
+Incoming shortcuts are read in batches, each diffed against the set's existing
+keys with one query and written with bulk_create / bulk_update and a
+through-table bulk_create, all inside one transaction. Bulk operations don't send model signals, so the
+ShortcutChange log, set versions and search index are updated here (see signals.record_changes).
+"""
+
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Shortcut
+from .search import index_shortcuts
+from .signals import memberships, record_changes
+from .sync import lock_change_log
+
+ShortcutSets = Shortcut.sets.through
+
+IMPORT_FIELDS = ('value', 'html_value', 'content_type')
+
+
+def normalize_item(item):
+    """Validate one incoming shortcut dict; returns (key, {field: value}) with only the given fields"""
+    key = (item.get('key') or '').strip()
+    if not key:
+        raise ValueError(f"Shortcut without key: {item!r}")
+    if len(key) > Shortcut._meta.get_field('key').max_length:
+        raise ValueError(f"Key too long: {key!r}")
+
+    fields = {field: item[field] for field in IMPORT_FIELDS if field in item}
+    fields.setdefault('value', '')
+    if fields.get('html_value') == '':
+        fields['html_value'] = None
+    if 'content_type' in fields and fields['content_type'] not in dict(Shortcut.CONTENT_TYPES):
+        raise ValueError(f"Unknown content_type for {key!r}: {fields['content_type']!r}")
+    return key, fields
+
+
+def import_shortcuts(shortcut_set, items, owner=None, updated_by=None, prune=False, batch_size=1000):
+    """
+    Upsert shortcuts into shortcut_set, matching on key within the set.
+
+    items: iterable of dicts with "key", "value" and optionally "html_value", "content_type".
+    It is consumed batch_size items at a time (one query to diff each batch against the set),
+    so a streaming reader keeps memory bounded. A repeated key keeps its last occurrence.
+    New shortcuts get owner/updated_by.
+    With prune=True, shortcuts of the set whose key isn't in items (or that repeat a key)
+    are removed from the set, and deleted if they aren't in any other set.
+
+    Everything runs in one transaction: an invalid item (ValueError) rolls the whole import back.
+    Returns {"created", "updated", "unchanged", "removed"} counts.
+    """
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0, 'removed': 0}
+    seen_ids = set()
+    items = iter(items)
+
+    with transaction.atomic():
+        lock_change_log()  # Before the first shortcut row is written (see sync.lock_change_log)
+        while batch := list(islice(items, batch_size)):
+            incoming = dict(normalize_item(item) for item in batch)
+            changed_ids, unchanged_ids = import_batch(shortcut_set, incoming, owner, updated_by, counts, batch_size)
+            if prune:
+                seen_ids.update(changed_ids)
+                seen_ids.update(unchanged_ids)
+
+            # Updated shortcuts may also be in other sets: log every membership
+            record_changes(memberships(changed_ids))
+            index_shortcuts(changed_ids, batch_size)
+
+        if prune:
+            stale_ids = [
+                shortcut_id for shortcut_id in shortcut_set.shortcuts.values_list('id', flat=True).iterator()
+                if shortcut_id not in seen_ids
+            ]
+            # Few rows in practice, so the regular m2m/delete signals log these.
+            # Shortcuts that are also in other sets are only unlinked from this one.
+            for start in range(0, len(stale_ids), batch_size):
+                chunk = stale_ids[start:start + batch_size]
+                shortcut_set.shortcuts.remove(*chunk)
+                Shortcut.objects.filter(id__in=chunk, sets=None).delete()
+            counts['removed'] = len(stale_ids)
+
+    return counts
+
+
+def import_batch(shortcut_set, incoming, owner, updated_by, counts, batch_size):
+    """Apply one {key: fields} batch; returns (created/updated ids, unchanged ids)"""
+    # Lowest id wins when a key is in the set more than once
+    existing = {}
+    for shortcut in (
+        Shortcut.objects.filter(sets=shortcut_set, key__in=list(incoming))
+        .order_by('-id')
+        .only('id', 'key', *IMPORT_FIELDS)
+    ):
+        existing[shortcut.key] = shortcut
+
+    now = timezone.now()
+    to_create, to_update, unchanged = [], [], []
+    for key, fields in incoming.items():
+        shortcut = existing.get(key)
+        if shortcut is None:
+            to_create.append(Shortcut(key=key, owner=owner, updated_by=updated_by, **fields))
+        elif any(getattr(shortcut, field) != value for field, value in fields.items()):
+            for field, value in fields.items():
+                setattr(shortcut, field, value)
+            shortcut.updated_at = now  # bulk_update doesn't apply auto_now
+            shortcut.updated_by = updated_by
+            to_update.append(shortcut)
+        else:
+            unchanged.append(shortcut)
+
+    created = Shortcut.objects.bulk_create(to_create, batch_size=batch_size)
+    ShortcutSets.objects.bulk_create(
+        [ShortcutSets(shortcut_id=shortcut.id, shortcutset_id=shortcut_set.id) for shortcut in created],
+        batch_size=batch_size,
+    )
+    Shortcut.objects.bulk_update(to_update, [*IMPORT_FIELDS, 'updated_at', 'updated_by'], batch_size=batch_size)
+
+    counts['created'] += len(created)
+    counts['updated'] += len(to_update)
+    counts['unchanged'] += len(unchanged)
+    return [shortcut.id for shortcut in created + to_update], [shortcut.id for shortcut in unchanged]
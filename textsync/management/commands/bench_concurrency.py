@@ -0,0 +1,310 @@
+"""
+Management command to compare concurrent-client throughput under WSGI and ASGI.
+
+Seeds a user with a general and a personal set, starts the project under
+gunicorn (config.wsgi, sync workers) and uvicorn (config.asgi) with the same
+number of worker processes, and drives each with N concurrent HTTP clients for
+a fixed time per scenario. Reports requests/s and p50/p99 latency per server,
+scenario and concurrency level.
+
+With --slow-clients, that many extra connections trickle their request headers
+in byte by byte during every run, like clients on a bad mobile link.
+
+The seeded rows are committed (the servers are separate processes) and deleted
+at the end. Run it against a development or staging database.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from textsync.models import ExpiringToken, Shortcut, ShortcutSet
+
+SCENARIOS = {
+    'verify': '/api/auth/verify/',
+    'sets': '/api/sets/',
+    'resolved': '/api/shortcuts/?sets={sets}&resolved=1',
+    'rows': '/api/shortcuts/?sets={sets}',
+}
+
+SERVERS = {
+    'wsgi': lambda workers, port: [
+        sys.executable, '-m', 'gunicorn', 'config.wsgi:application',
+        '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+    ],
+    'asgi': lambda workers, port: [
+        sys.executable, '-m', 'uvicorn', 'config.asgi:application',
+        '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port), '--no-access-log',
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent clients against the API under gunicorn (WSGI) and uvicorn (ASGI)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--servers",
+            type=str,
+            default="wsgi,asgi",
+            help="Servers to compare: wsgi, asgi (default: wsgi,asgi)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=3,
+            help="Worker processes per server (default: 3, as in DEPLOYMENT.md)",
+        )
+        parser.add_argument(
+            "--scenarios",
+            type=str,
+            default="verify,sets,resolved",
+            help=f"Comma-separated scenarios: {', '.join(SCENARIOS)} (default: verify,sets,resolved)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=str,
+            default="1,10,50",
+            help="Comma-separated numbers of concurrent clients (default: 1,10,50)",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=5.0,
+            help="Seconds per scenario and concurrency level (default: 5)",
+        )
+        parser.add_argument(
+            "--slow-clients",
+            type=int,
+            default=0,
+            help="Extra connections sending their request headers slowly during each run (default: 0)",
+        )
+        parser.add_argument(
+            "--shortcuts",
+            type=int,
+            default=1000,
+            help="Shortcuts in the seeded general set (default: 1000)",
+        )
+        parser.add_argument(
+            "--port",
+            type=int,
+            default=8790,
+            help="Port for the servers, started one at a time (default: 8790)",
+        )
+        parser.add_argument(
+            "--json",
+            type=str,
+            help="Also write the results to this JSON file (for comparing runs)",
+        )
+
+    def handle(self, *args, **options):
+        servers = [name.strip() for name in options["servers"].split(",") if name.strip()]
+        scenarios = [name.strip() for name in options["scenarios"].split(",") if name.strip()]
+        for name in servers:
+            if name not in SERVERS:
+                raise CommandError(f"Unknown server: {name} (choose from {', '.join(SERVERS)})")
+        for name in scenarios:
+            if name not in SCENARIOS:
+                raise CommandError(f"Unknown scenario: {name} (choose from {', '.join(SCENARIOS)})")
+        try:
+            levels = [int(n) for n in options["concurrency"].split(",")]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma-separated list of numbers")
+
+        self.stdout.write(f"\n🌱 Seeding {options['shortcuts']} shortcuts...")
+        token, sets = self.seed(options["shortcuts"])
+        results = {}
+        try:
+            for server in servers:
+                self.stdout.write(f"\n🚀 {server}: starting {options['workers']} worker(s)...")
+                with self.running(server, options["workers"], options["port"]):
+                    for scenario in scenarios:
+                        path = SCENARIOS[scenario].format(sets=sets)
+                        for level in levels:
+                            result = asyncio.run(self.load(
+                                options["port"], path, token, level, options["duration"], options["slow_clients"]
+                            ))
+                            results.setdefault(server, {}).setdefault(scenario, {})[str(level)] = result
+                            self.stdout.write(
+                                f"   {scenario:<10} c={level:<5} {result['rps']:>9.1f} req/s  "
+                                f"p50 {result['p50_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  "
+                                + ", ".join(f"{code}x{n}" for code, n in result["statuses"].items())
+                            )
+        finally:
+            self.cleanup()
+
+        self.report(results, scenarios, levels)
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as f:
+                json.dump({"options": {k: options[k] for k in ("workers", "duration", "slow_clients", "shortcuts")},
+                           "results": results}, f, indent=2)
+            self.stdout.write(f"📄 Results written to {options['json']}")
+
+        self.stdout.write(self.style.SUCCESS("✅ Done (seeded data deleted)"))
+
+    # Seeding
+
+    def seed(self, shortcut_count):
+        """Create the bench user and sets; returns (token key, ?sets= value)"""
+        run = timezone.now().strftime("%H%M%S")
+        user = User.objects.create_user(username=f"bench-{run}")
+        token = ExpiringToken.objects.create(user=user, expires_at=timezone.now() + timedelta(days=1))
+        general = ShortcutSet.objects.create(name=f"bench-{run}-birou", set_type="general")
+        personal = ShortcutSet.objects.create(name=f"bench-{run}-personal", set_type="personal", owner=user)
+
+        through = Shortcut.sets.through
+        shortcuts = Shortcut.objects.bulk_create(
+            (Shortcut(key=f"k{i}", value=f"Text generat automat pentru k{i}. " * (1 + i % 4))
+             for i in range(shortcut_count)),
+            batch_size=2000,
+        )
+        through.objects.bulk_create(
+            (through(shortcut_id=s.id, shortcutset_id=general.id) for s in shortcuts), batch_size=5000
+        )
+        overrides = Shortcut.objects.bulk_create(
+            Shortcut(key=f"k{i}", value=f"Personal k{i}", owner=user) for i in range(0, min(shortcut_count, 50), 5)
+        )
+        through.objects.bulk_create(through(shortcut_id=s.id, shortcutset_id=personal.id) for s in overrides)
+
+        self.seeded = (user, [general, personal])
+        return token.key, f"{general.name},{personal.name}"
+
+    def cleanup(self):
+        user, sets = self.seeded
+        Shortcut.objects.filter(sets__in=sets).delete()
+        ShortcutSet.objects.filter(id__in=[s.id for s in sets]).delete()
+        user.delete()
+
+    # Servers
+
+    @contextmanager
+    def running(self, server, workers, port):
+        env = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "config.settings"),
+            # Throttling would answer most benchmark requests with 429
+            "THROTTLE_RATE_ANON": "1000000/second",
+            "THROTTLE_RATE_USER": "1000000/second",
+        }
+        process = subprocess.Popen(
+            SERVERS[server](workers, port), cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.wait_for_port(port, process)
+            yield
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=20)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def wait_for_port(self, port, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"Server exited with code {process.returncode} (is it installed?)")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                time.sleep(1)  # Let every worker finish importing Django
+                return
+            except OSError:
+                time.sleep(0.2)
+        process.kill()
+        raise CommandError(f"Server didn't start listening on port {port} within {timeout}s")
+
+    # Load
+
+    def request_bytes(self, path, token):
+        host = next((h.lstrip(".") for h in settings.ALLOWED_HOSTS if h != "*"), "localhost")
+        return (
+            f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAuthorization: Token {token}\r\n"
+            "X-Forwarded-Proto: https\r\nAccept: application/json\r\nConnection: close\r\n\r\n"
+        ).encode()
+
+    async def load(self, port, path, token, concurrency, duration, slow_clients):
+        request = self.request_bytes(path, token)
+        latencies, statuses = [], {}
+        deadline = time.monotonic() + duration
+
+        async def client():
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                    writer.write(request)
+                    await writer.drain()
+                    response = await reader.read()
+                    writer.close()
+                    status = response[9:12].decode() or "reset"
+                except OSError:
+                    status = "error"
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        async def slow_client():
+            while time.monotonic() < deadline:
+                try:
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                    for i in range(len(request)):
+                        if time.monotonic() >= deadline:
+                            break
+                        writer.write(request[i:i + 1])
+                        await writer.drain()
+                        await asyncio.sleep(0.1)
+                    writer.close()
+                except OSError:
+                    await asyncio.sleep(0.1)
+
+        slow = [asyncio.create_task(slow_client()) for _ in range(slow_clients)]
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        for task in slow:
+            task.cancel()
+        await asyncio.gather(*slow, return_exceptions=True)
+
+        ok = statuses.get("200", 0)
+        return {
+            "requests": len(latencies),
+            "rps": round(ok / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies), 1) if latencies else 0,
+            "p99_ms": round(self.percentile(latencies, 99), 1) if latencies else 0,
+            "statuses": dict(sorted(statuses.items())),
+        }
+
+    def percentile(self, values, pct):
+        """Nearest-rank percentile"""
+        ordered = sorted(values)
+        index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+        return ordered[index]
+
+    def report(self, results, scenarios, levels):
+        servers = list(results)
+        self.stdout.write(
+            f"\n{'scenario':<10} {'clients':>7} "
+            + " ".join(f"{server + ' req/s':>12} {server + ' p99':>10}" for server in servers)
+        )
+        for scenario in scenarios:
+            for level in levels:
+                cells = []
+                for server in servers:
+                    r = results[server][scenario][str(level)]
+                    cells.append(f"{r['rps']:>12.1f} {r['p99_ms']:>10.1f}")
+                self.stdout.write(f"{scenario:<10} {level:>7} " + " ".join(cells))
+        self.stdout.write("")
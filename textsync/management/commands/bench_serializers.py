@@ -0,0 +1,93 @@
+"""
+Management command to benchmark the shortcut list serialization paths.
+Compares ShortcutSerializer + JSONRenderer with the values()-based fast path
+used by ShortcutViewSet.list. Seeded data is rolled back afterwards.
+"""
+
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from textsync.models import Shortcut, ShortcutSet
+from textsync.serializers import ShortcutSerializer
+from textsync.sync import render_json, shortcut_rows, with_sync_relations
+
+
+class Command(BaseCommand):
+    help = "Benchmark ShortcutSerializer against the fast list serialization path"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=str,
+            default="1000,10000,100000",
+            help="Comma-separated shortcut counts to benchmark (default: 1000,10000,100000)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Runs per size and path; the best run is reported (default: 3)",
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options["sizes"].split(",")]
+
+        self.stdout.write(f"\n⏱️  Benchmarking shortcut list serialization ({options['repeat']} runs each)\n")
+        self.stdout.write(f"{'rows':>8} {'serializer rows/s':>18} {'fast path rows/s':>17} {'speedup':>8}")
+
+        for size in sizes:
+            with transaction.atomic():
+                queryset = self.seed(size)
+
+                serializer_time, serializer_body = self.best_of(options["repeat"], lambda: JSONRenderer().render(
+                    ShortcutSerializer(with_sync_relations(queryset), many=True).data
+                ))
+                fast_time, fast_body = self.best_of(options["repeat"], lambda: render_json(shortcut_rows(queryset)))
+
+                transaction.set_rollback(True)
+
+            if serializer_body != fast_body:
+                self.stdout.write(self.style.ERROR(f"❌ Output differs at {size} rows!"))
+
+            self.stdout.write(
+                f"{size:>8} {size / serializer_time:>18,.0f} {size / fast_time:>17,.0f} "
+                f"{serializer_time / fast_time:>7.1f}x"
+            )
+
+        self.stdout.write(self.style.SUCCESS("\n✅ Done (seeded data rolled back)"))
+
+    def best_of(self, repeat, func):
+        best, result = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def seed(self, size):
+        """Create `size` shortcuts split over a general and a personal set; every 10th is in both"""
+        owner, _ = User.objects.get_or_create(username="bench-owner")
+        general = ShortcutSet.objects.create(name="bench-general", set_type="general", owner=owner)
+        personal = ShortcutSet.objects.create(name="bench-personal", set_type="personal", owner=owner)
+
+        shortcuts = Shortcut.objects.bulk_create(
+            Shortcut(
+                key=f"b{i}",
+                value=f"Benchmark shortcut {i} – ăîșț",
+                html_value=f"<p>Benchmark shortcut <b>{i}</b></p>" if i % 2 else None,
+                owner=owner,
+            )
+            for i in range(size)
+        )
+
+        through = Shortcut.sets.through
+        links = [through(shortcut_id=s.id, shortcutset_id=general.id) for s in shortcuts]
+        links += [through(shortcut_id=s.id, shortcutset_id=personal.id) for s in shortcuts[::10]]
+        through.objects.bulk_create(links, batch_size=5000)
+
+        return Shortcut.objects.filter(sets__in=[general, personal]).distinct().order_by("key", "id")
@@ -0,0 +1,304 @@
+"""
+Management command to load-test the sync API in-process.
+
+Seeds synthetic users, sets and shortcuts, drives the API through Django's test
+client and reports p50/p99 latency, queries per request and response bytes for
+auth, set listing, full syncs, snapshots and delta syncs. With --memory the
+peak Python allocation per request is reported too (streamed bodies are
+consumed chunk by chunk, as a client would).
+
+Everything is seeded inside a transaction that is rolled back at the end
+(unless --keep). Run it against a development or staging database.
+"""
+
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.views import APIView
+
+from textsync.models import ExpiringToken, Shortcut, ShortcutSet
+
+BENCH_PASSWORD = "bench-password"
+
+
+class Command(BaseCommand):
+    help = "Seed synthetic data and benchmark the sync API (latency, queries, bytes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shortcuts",
+            type=int,
+            default=1000,
+            help="Shortcuts in the shared general set (default: 1000)",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=10,
+            help="Synthetic users, each with a personal set (default: 10)",
+        )
+        parser.add_argument(
+            "--personal",
+            type=int,
+            default=5,
+            help="Shortcuts per personal set; half of them override general keys (default: 5)",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=50,
+            help="Requests per scenario (default: 50)",
+        )
+        parser.add_argument(
+            "--changes",
+            type=int,
+            default=10,
+            help="Shortcuts edited/deleted before the delta scenario (default: 10)",
+        )
+        parser.add_argument(
+            "--accept-encoding",
+            type=str,
+            default="",
+            help="Accept-Encoding header for API requests, e.g. 'gzip' or 'br' (default: none)",
+        )
+        parser.add_argument(
+            "--memory",
+            action="store_true",
+            help="Also report peak memory allocated per request (tracemalloc, slows requests down)",
+        )
+        parser.add_argument(
+            "--with-throttling",
+            action="store_true",
+            help="Keep DRF throttling enabled (it will reject most requests at default rates)",
+        )
+        parser.add_argument(
+            "--json",
+            type=str,
+            help="Also write the results to this JSON file (for comparing runs)",
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Commit the seeded data instead of rolling it back",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"\n🌱 Seeding {options['shortcuts']} general shortcuts, {options['users']} users "
+            f"x {options['personal']} personal shortcuts...\n"
+        )
+
+        self.trace_memory = options["memory"]
+
+        with transaction.atomic():
+            start = time.perf_counter()
+            users = self.seed(options["shortcuts"], options["users"], options["personal"])
+            self.stdout.write(f"   Seeded in {time.perf_counter() - start:.1f}s\n")
+
+            if options["with_throttling"]:
+                results = self.run_scenarios(users, options)
+            else:
+                with mock.patch.object(APIView, "get_throttles", lambda view: []):
+                    results = self.run_scenarios(users, options)
+
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+        self.report(results)
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as f:
+                json.dump({"options": {k: options[k] for k in ("shortcuts", "users", "personal", "requests", "changes",
+                                                                "accept_encoding")},
+                           "results": results}, f, indent=2)
+            self.stdout.write(f"📄 Results written to {options['json']}")
+
+        if options["keep"]:
+            self.stdout.write(self.style.WARNING("⚠️  Seeded data kept (--keep)"))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Done (seeded data rolled back)"))
+
+    # Seeding
+
+    def seed(self, shortcut_count, user_count, personal_count):
+        """Create the data set; returns [(username, token key, set names)]"""
+        run = timezone.now().strftime("%H%M%S")
+        password = make_password(BENCH_PASSWORD)  # Hash once, PBKDF2 per user would dominate seeding
+
+        users = User.objects.bulk_create(
+            User(username=f"bench-{run}-{i}", password=password) for i in range(user_count)
+        )
+        expires_at = timezone.now() + timedelta(days=180)
+        tokens = ExpiringToken.objects.bulk_create(
+            ExpiringToken(key=ExpiringToken.generate_key(), user=user, expires_at=expires_at) for user in users
+        )
+
+        general = ShortcutSet.objects.create(name=f"bench-{run}-birou", set_type="general")
+        personal_sets = ShortcutSet.objects.bulk_create(
+            ShortcutSet(name=f"bench-{run}-{user.username}", set_type="personal", owner=user) for user in users
+        )
+
+        through = Shortcut.sets.through
+        general_shortcuts = Shortcut.objects.bulk_create(
+            (self.make_shortcut(f"k{i}", i) for i in range(shortcut_count)), batch_size=2000
+        )
+        through.objects.bulk_create(
+            (through(shortcut_id=s.id, shortcutset_id=general.id) for s in general_shortcuts), batch_size=5000
+        )
+
+        # Half of each personal set overrides general keys, the other half is unique to the user
+        personal = []
+        for user, personal_set in zip(users, personal_sets):
+            for i in range(personal_count):
+                key = f"k{i}" if i % 2 == 0 else f"{user.username}-{i}"
+                personal.append((personal_set, self.make_shortcut(key, i, owner=user)))
+        created = Shortcut.objects.bulk_create((s for _, s in personal), batch_size=2000)
+        through.objects.bulk_create(
+            (through(shortcut_id=s.id, shortcutset_id=ps.id) for (ps, _), s in zip(personal, created)),
+            batch_size=5000,
+        )
+
+        self.general_set = general
+        self.general_shortcut_ids = [s.id for s in general_shortcuts]
+        return [
+            (user.username, token.key, f"{general.name},{personal_set.name}")
+            for user, token, personal_set in zip(users, tokens, personal_sets)
+        ]
+
+    def make_shortcut(self, key, i, owner=None):
+        value = f"Text generat automat pentru {key} #{i}. " * (1 + i % 4)
+        return Shortcut(
+            key=key,
+            content_type="html" if i % 3 == 0 else "text",
+            value=value,
+            html_value=f"<p>{value}</p>" if i % 3 == 0 else None,
+            owner=owner,
+        )
+
+    # Scenarios
+
+    def run_scenarios(self, users, options):
+        n = options["requests"]
+        host = next((h.lstrip(".") for h in settings.ALLOWED_HOSTS if h != "*"), "localhost")
+        client = Client(SERVER_NAME=host)
+        encoding = options["accept_encoding"]
+
+        def pick():
+            return random.choice(users)
+
+        def get(path, user, **headers):
+            username, token, sets = user
+            if encoding:
+                headers["HTTP_ACCEPT_ENCODING"] = encoding
+            return client.get(path.format(sets=sets), secure=True, HTTP_AUTHORIZATION=f"Token {token}", **headers)
+
+        results = {}
+        results["auth login"] = self.measure(n, lambda: client.post(
+            "/api/auth/login/", {"username": pick()[0], "password": BENCH_PASSWORD},
+            content_type="application/json", secure=True,
+        ))
+        results["auth verify"] = self.measure(n, lambda: get("/api/auth/verify/", pick()))
+        results["sets list"] = self.measure(n, lambda: get("/api/sets/", pick()))
+        results["full sync (rows)"] = self.measure(n, lambda: get("/api/shortcuts/?sets={sets}", pick()))
+        results["full sync (resolved)"] = self.measure(n, lambda: get("/api/shortcuts/?sets={sets}&resolved=1", pick()))
+        results["full sync (columnar)"] = self.measure(n, lambda: get("/api/shortcuts/?sets={sets}&layout=columnar", pick()))
+        results["full sync (ndjson)"] = self.measure(n, lambda: get("/api/shortcuts/?sets={sets}&format=ndjson", pick()))
+        results["page (limit=500)"] = self.measure(n, lambda: get("/api/shortcuts/?sets={sets}&limit=500", pick()))
+        results["snapshot"] = self.measure(n, lambda: get("/api/shortcuts/snapshot/?sets={sets}", pick()))
+
+        etags = {user[1]: get("/api/shortcuts/snapshot/?sets={sets}", user)["ETag"] for user in users[:n]}
+        snapshot_users = [user for user in users if user[1] in etags]
+        results["snapshot 304"] = self.measure(n, lambda: self.conditional(get, random.choice(snapshot_users), etags))
+
+        cursor = get("/api/shortcuts/?sets={sets}&resolved=1", users[0])["X-Sync-Cursor"]
+        results["delta (no changes)"] = self.measure(
+            n, lambda: get(f"/api/shortcuts/delta/?sets={{sets}}&since={cursor}&resolved=1", pick())
+        )
+
+        self.apply_changes(options["changes"])
+        results["delta (after changes)"] = self.measure(
+            n, lambda: get(f"/api/shortcuts/delta/?sets={{sets}}&since={cursor}&resolved=1", pick())
+        )
+        return results
+
+    def conditional(self, get, user, etags):
+        return get("/api/shortcuts/snapshot/?sets={sets}", user, HTTP_IF_NONE_MATCH=etags[user[1]])
+
+    def apply_changes(self, count):
+        """Edit and delete general shortcuts through the ORM so the change log is fed by signals"""
+        ids = random.sample(self.general_shortcut_ids, min(count, len(self.general_shortcut_ids)))
+        for i, shortcut in enumerate(Shortcut.objects.filter(id__in=ids)):
+            if i % 2:
+                shortcut.delete()
+            else:
+                shortcut.value += " (editat)"
+                shortcut.save()
+
+    def measure(self, count, request):
+        latencies, queries, sizes, peaks, statuses = [], [], [], [], {}
+        if self.trace_memory:
+            tracemalloc.start()
+        for _ in range(count):
+            if self.trace_memory:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = request()
+                if response.streaming:
+                    size = sum(len(chunk) for chunk in response.streaming_content)
+                else:
+                    size = len(response.content)
+                latencies.append((time.perf_counter() - start) * 1000)
+            if self.trace_memory:
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            queries.append(len(ctx.captured_queries))
+            sizes.append(size)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if self.trace_memory:
+            tracemalloc.stop()
+
+        result = {
+            "requests": count,
+            "p50_ms": round(self.percentile(latencies, 50), 2),
+            "p99_ms": round(self.percentile(latencies, 99), 2),
+            "queries_per_request": round(statistics.mean(queries), 1),
+            "bytes_per_response": round(statistics.mean(sizes)),
+            "statuses": {str(code): n for code, n in sorted(statuses.items())},
+        }
+        if peaks:
+            result["peak_kb"] = round(max(peaks) / 1024)
+        return result
+
+    def percentile(self, values, pct):
+        """Nearest-rank percentile"""
+        ordered = sorted(values)
+        index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+        return ordered[index]
+
+    def report(self, results):
+        memory = self.trace_memory
+        self.stdout.write(
+            f"\n{'scenario':<24} {'p50 ms':>9} {'p99 ms':>9} {'queries':>8} {'bytes':>11}"
+            + (f" {'peak KB':>9}" if memory else "") + "  statuses"
+        )
+        for name, r in results.items():
+            statuses = ", ".join(f"{code}x{n}" for code, n in r["statuses"].items())
+            self.stdout.write(
+                f"{name:<24} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['queries_per_request']:>8.1f} "
+                f"{r['bytes_per_response']:>11,}" + (f" {r['peak_kb']:>9,}" if memory else "") + f"  {statuses}"
+            )
+        self.stdout.write("")
@@ -0,0 +1,74 @@
+"""
+Management command to report how well the sync cache (textsync/caching.py) works.
+Prints hits, misses and hit ratio per kind of cached value, as counted by all worker
+processes since the counters were last reset (workers add their counts every few seconds).
+
+The counters live in the "default" cache, so they cover every worker only when it is
+shared (CACHE_BACKEND=file or redis). With locmem each worker counts on its own: use
+/api/metrics/ (textsync_cache_lookups_total) instead.
+
+    python manage.py cache_stats
+    python manage.py cache_stats --reset   # start a new measurement
+"""
+
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from textsync.caching import KINDS, is_shared, stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the sync cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters after printing them",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the counters as JSON (for monitoring scripts)",
+        )
+
+    def handle(self, *args, **options):
+        counts, since = stats.read()
+
+        if options["json"]:
+            self.stdout.write(json.dumps({
+                "backend": settings.CACHES["default"]["BACKEND"],
+                "shared": is_shared(),
+                "since": since,
+                "kinds": {kind: {"hits": hits, "misses": misses} for kind, (hits, misses) in counts.items()},
+            }, indent=2))
+        else:
+            self.report(counts, since)
+
+        if options["reset"]:
+            stats.reset()
+            self.stdout.write(self.style.SUCCESS("✅ Counters reset"))
+
+    def report(self, counts, since):
+        self.stdout.write(f"\n📊 Cache: {settings.CACHES['default']['BACKEND']}")
+        if not is_shared():
+            self.stdout.write(self.style.WARNING(
+                "⚠️  LocMemCache is per process: these counters don't include the workers. "
+                "Use /api/metrics/ or CACHE_BACKEND=file/redis"
+            ))
+        self.stdout.write(f"   Counting since: {since or 'no lookups recorded yet'}\n")
+
+        self.stdout.write(f"   {'kind':<12} {'hits':>10} {'misses':>10} {'hit ratio':>10}  description")
+        total_hits = total_misses = 0
+        for kind, (hits, misses) in counts.items():
+            total_hits += hits
+            total_misses += misses
+            self.stdout.write(f"   {kind:<12} {hits:>10} {misses:>10} {self.ratio(hits, misses):>10}  {KINDS[kind]}")
+        self.stdout.write(
+            f"   {'total':<12} {total_hits:>10} {total_misses:>10} {self.ratio(total_hits, total_misses):>10}\n"
+        )
+
+    def ratio(self, hits, misses):
+        return f"{hits / (hits + misses):.1%}" if hits + misses else "-"
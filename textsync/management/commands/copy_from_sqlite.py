@@ -0,0 +1,190 @@
+"""
+Management command to copy all data from an existing SQLite database into the
+configured (normally PostgreSQL) database.
+
+Run `python manage.py migrate` against the new database first. Content types and
+permissions are created by migrate, so rows pointing at them are remapped by
+natural key instead of being copied. Rows are written with bulk_create, so no
+signals fire and the ShortcutChange log / set versions are copied as they are;
+the full-text search index is rebuilt at the end.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from textsync.search import rebuild_index
+
+SOURCE_ALIAS = "sqlite_source"
+
+# Created by migrate on the target; references to them are remapped by natural key
+REMAPPED = ("contenttypes.ContentType", "auth.Permission")
+
+
+@contextmanager
+def keep_timestamps(fields):
+    """Switch off auto_now/auto_now_add so bulk_create writes the copied timestamps"""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields if hasattr(field, "auto_now")]
+    for field, _, _ in saved:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = "Copy all data from a SQLite database into the configured database (e.g. PostgreSQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            type=str,
+            default=str(settings.BASE_DIR / "db.sqlite3"),
+            help="Path of the SQLite database to copy from (default: db.sqlite3)",
+        )
+        parser.add_argument(
+            "--database",
+            type=str,
+            default=DEFAULT_DB_ALIAS,
+            help="Target database alias (default: default)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Rows read and inserted per batch (default: 2000)",
+        )
+
+    def handle(self, *args, **options):
+        source_path = Path(options["source"])
+        target = options["database"]
+        batch_size = options["batch_size"]
+
+        if not source_path.exists():
+            raise CommandError(f"SQLite database not found: {source_path}")
+        if connections[target].settings_dict["NAME"] == str(source_path):
+            raise CommandError("Source and target are the same database")
+
+        connections.settings[SOURCE_ALIAS] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: {"ENGINE": "django.db.backends.sqlite3", "NAME": str(source_path)},
+        })[DEFAULT_DB_ALIAS]
+
+        self.stdout.write(
+            f"\n📦 Copying {source_path} -> {target} ({connections[target].vendor})\n"
+        )
+
+        models = self.copy_order()
+        not_empty = [m._meta.label for m in models if m.objects.using(target).exists()]
+        if not_empty:
+            raise CommandError(
+                f"Target database already has data in: {', '.join(not_empty)}. "
+                "Run `python manage.py flush` on it first."
+            )
+
+        remap = {
+            ContentType: self.content_type_map(target),
+            Permission: self.permission_map(target),
+        }
+
+        with transaction.atomic(using=target):
+            for model in models:
+                copied, skipped = self.copy_model(model, target, remap, batch_size)
+                line = f"  {model._meta.label:<35} {copied:>8} rows"
+                if skipped:
+                    self.stdout.write(self.style.WARNING(f"{line} ({skipped} skipped: unknown content type/permission)"))
+                else:
+                    self.stdout.write(line)
+
+            # Explicit primary keys were inserted: move the id sequences past them (PostgreSQL)
+            connection = connections[target]
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                    cursor.execute(sql)
+
+            indexed = rebuild_index(batch_size, using=target)
+            self.stdout.write(f"  {'search index':<35} {'-' if indexed is None else indexed:>8} rows")
+
+        connections[SOURCE_ALIAS].close()
+        self.stdout.write(self.style.SUCCESS("\n✅ Done! Point DB_ENGINE at the new database and restart gunicorn."))
+
+    def copy_order(self):
+        """Every model except the remapped ones, ordered so FK targets are copied first"""
+        pending = [
+            model for model in apps.get_models(include_auto_created=True)
+            if model._meta.label not in REMAPPED and not model._meta.proxy and model._meta.managed
+        ]
+        ordered, done = [], set(REMAPPED)
+        while pending:
+            ready = [
+                model for model in pending
+                if all(
+                    field.related_model._meta.label in done or field.related_model is model
+                    for field in model._meta.concrete_fields if field.is_relation
+                )
+            ]
+            if not ready:
+                raise CommandError(f"Circular foreign keys between: {', '.join(m._meta.label for m in pending)}")
+            for model in ready:
+                ordered.append(model)
+                done.add(model._meta.label)
+                pending.remove(model)
+        return ordered
+
+    def content_type_map(self, target):
+        """source content type id -> target content type id, matched on (app_label, model)"""
+        target_ids = {
+            (app_label, model): ct_id
+            for ct_id, app_label, model in ContentType.objects.using(target).values_list("id", "app_label", "model")
+        }
+        return {
+            ct_id: target_ids.get((app_label, model))
+            for ct_id, app_label, model in ContentType.objects.using(SOURCE_ALIAS).values_list("id", "app_label", "model")
+        }
+
+    def permission_map(self, target):
+        """source permission id -> target permission id, matched on (app_label, model, codename)"""
+        fields = ("content_type__app_label", "content_type__model", "codename", "id")
+        target_ids = {row[:3]: row[3] for row in Permission.objects.using(target).values_list(*fields)}
+        return {row[3]: target_ids.get(row[:3]) for row in Permission.objects.using(SOURCE_ALIAS).values_list(*fields)}
+
+    def copy_model(self, model, target, remap, batch_size):
+        """Copy one table in batches; returns (copied, skipped)"""
+        fields = model._meta.concrete_fields
+        attnames = [field.attname for field in fields]
+        remapped = [
+            (i, remap[field.related_model], field.null)
+            for i, field in enumerate(fields)
+            if field.is_relation and field.related_model in remap
+        ]
+
+        rows = model.objects.using(SOURCE_ALIAS).order_by("pk").values_list(*attnames).iterator(chunk_size=batch_size)
+        copied = skipped = 0
+        batch = []
+        with keep_timestamps(fields):
+            for row in rows:
+                if remapped:
+                    row = list(row)
+                    for i, mapping, nullable in remapped:
+                        if row[i] is not None:
+                            row[i] = mapping.get(row[i])
+                    if any(row[i] is None and not nullable for i, _, nullable in remapped):
+                        skipped += 1
+                        continue
+                batch.append(model(**dict(zip(attnames, row))))
+                if len(batch) >= batch_size:
+                    model.objects.using(target).bulk_create(batch)
+                    copied += len(batch)
+                    batch = []
+            if batch:
+                model.objects.using(target).bulk_create(batch)
+                copied += len(batch)
+        return copied, skipped
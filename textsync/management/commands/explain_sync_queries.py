@@ -0,0 +1,132 @@
+"""
+Management command to show the query plans of the sync API queries.
+Runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) on the queries behind the shortcut
+list, keyset pages, delta and snapshot endpoints, and flags full table scans
+and sorts so index coverage can be checked on SQLite and PostgreSQL.
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from textsync.models import Shortcut, ShortcutChange, ShortcutSet
+from textsync.sync import (
+    SHORTCUT_VALUES, accessible_sets, current_cursor, requested_set_ids, set_name_rows,
+)
+
+# Plan fragments worth a second look. On tiny tables PostgreSQL prefers sequential
+# scans regardless of indexes, so check plans against realistic data.
+SUSPICIOUS = {
+    "sqlite": ("SCAN ", "USE TEMP B-TREE"),
+    "postgresql": ("Seq Scan", "Sort"),
+}
+
+
+class Command(BaseCommand):
+    help = "Show query plans (EXPLAIN) for the sync API queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=str,
+            help="Username whose accessible sets are used (default: the first superuser)",
+        )
+        parser.add_argument(
+            "--sets",
+            type=str,
+            help="Comma-separated set names, as in ?sets= (default: all sets the user can access)",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="PostgreSQL only: run the queries (EXPLAIN ANALYZE) and show actual timings",
+        )
+        parser.add_argument(
+            "--sql",
+            action="store_true",
+            help="Also print the SQL of every query",
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["user"])
+        set_ids = requested_set_ids(user, options["sets"])
+        if set_ids is None:
+            raise CommandError(f"Unknown or inaccessible set in --sets={options['sets']!r}")
+        if not set_ids:
+            raise CommandError(f"User '{user.username}' has no accessible sets")
+
+        explain_options = {}
+        if options["analyze"]:
+            if connection.vendor != "postgresql":
+                raise CommandError("--analyze is only supported on PostgreSQL")
+            explain_options["analyze"] = True
+
+        self.stdout.write(
+            f"\n🔍 Query plans on {connection.vendor} for user '{user.username}', set ids {set_ids}\n"
+        )
+
+        warnings = 0
+        for name, queryset in self.sync_queries(user, set_ids):
+            warnings += self.explain(name, queryset, options["sql"], explain_options)
+
+        if warnings:
+            self.stdout.write(self.style.WARNING(
+                f"\n⚠️  {warnings} plan line(s) with full scans or sorts - check them against realistic data"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS("\n✅ All sync queries use indexes"))
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"User '{username}' not found")
+        user = User.objects.filter(is_superuser=True).order_by("id").first()
+        if user is None:
+            raise CommandError("No superuser found, pass --user")
+        return user
+
+    def sync_queries(self, user, set_ids):
+        """(name, queryset) pairs with the same shapes ShortcutViewSet and sync.py run"""
+        shortcuts = Shortcut.objects.filter(sets__in=set_ids).distinct().order_by("key", "id")
+        first = shortcuts.values_list("key", "id").first() or ("", 0)
+        cursor = current_cursor()
+
+        return [
+            ("accessible sets (sync.set_access)", accessible_sets(user).values_list("id", "name")),
+            ("full sync rows", shortcuts.values_list(*SHORTCUT_VALUES)),
+            ("full sync set names", set_name_rows(shortcuts.values("id"))),
+            ("keyset page (?limit=&after=)", shortcuts.filter(
+                Q(key__gt=first[0]) | Q(key=first[0], id__gt=first[1])
+            ).values_list("key", "id")[:501]),
+            ("legacy ?updated_after=", shortcuts.filter(
+                updated_at__gt=timezone.now() - timedelta(days=1)
+            ).values_list(*SHORTCUT_VALUES)),
+            ("sync cursor", ShortcutChange.objects.order_by("-id").values_list("id", flat=True)[:1]),
+            ("delta changes", ShortcutChange.objects.filter(
+                shortcut_set__in=set_ids, id__gt=max(cursor - 100, 0), id__lte=cursor
+            ).order_by().values_list("shortcut_id", flat=True)),
+            ("snapshot set versions", ShortcutSet.objects.filter(pk__in=set_ids)
+                .only("id", "name", "version").order_by()),
+        ]
+
+    def explain(self, name, queryset, show_sql, explain_options):
+        """Print one plan; returns the number of suspicious plan lines"""
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n🔎 {name}"))
+        if show_sql:
+            self.stdout.write(f"   {queryset.query}")
+
+        suspicious = SUSPICIOUS.get(connection.vendor, ())
+        warnings = 0
+        for line in queryset.explain(**explain_options).splitlines():
+            if any(fragment in line for fragment in suspicious):
+                warnings += 1
+                self.stdout.write(self.style.WARNING(f"   {line}"))
+            else:
+                self.stdout.write(f"   {line}")
+        return warnings
@@ -1,12 +1,17 @@
 """
 Management command to fix NULL owners for ShortcutSets and Shortcuts.
 Assigns a default owner to all objects without owner.
+Each model is fixed with a single UPDATE, all inside one transaction.
 """
 
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from django.db import transaction
 
+from textsync.caching import bump_namespaces, set_namespaces
 from textsync.models import Shortcut, ShortcutSet
+from textsync.signals import memberships, record_changes
+from textsync.sync import invalidate_set_access, lock_change_log, shortcut_set_names
 
 
 class Command(BaseCommand):
@@ -42,57 +47,71 @@ class Command(BaseCommand):
                 self.stdout.write(f"   - {u.username}")
             return
 
-        # Fix ShortcutSets
-        sets_without_owner = ShortcutSet.objects.filter(owner__isnull=True)
-        sets_count = sets_without_owner.count()
+        with transaction.atomic():
+            if not dry_run:
+                lock_change_log()  # Before the first set row is written (see sync.lock_change_log)
 
-        if sets_count > 0:
-            self.stdout.write(
-                self.style.WARNING(f"\n⚠️  Found {sets_count} ShortcutSet(s) without owner:")
-            )
-            for s in sets_without_owner:
-                self.stdout.write(f"  - {s.name} ({s.get_set_type_display()})")
+            # Fix ShortcutSets
+            sets_without_owner = ShortcutSet.objects.filter(owner__isnull=True)
+            sets_count = sets_without_owner.count()
 
-            if not dry_run:
-                updated = sets_without_owner.update(owner=owner)
+            if sets_count > 0:
                 self.stdout.write(
-                    self.style.SUCCESS(f"✅ Updated {updated} ShortcutSet(s)")
+                    self.style.WARNING(f"\n⚠️  Found {sets_count} ShortcutSet(s) without owner:")
                 )
+                for s in sets_without_owner:
+                    self.stdout.write(f"  - {s.name} ({s.get_set_type_display()})")
+
+                if not dry_run:
+                    set_ids = list(sets_without_owner.values_list('id', flat=True))
+                    updated = sets_without_owner.update(owner=owner)
+                    # update() sends no signals; owners decide which sets staff can sync
+                    # and are part of the cached serialized sets
+                    transaction.on_commit(invalidate_set_access)
+                    bump_namespaces(set_namespaces(set_ids))
+                    self.stdout.write(
+                        self.style.SUCCESS(f"✅ Updated {updated} ShortcutSet(s)")
+                    )
+                else:
+                    self.stdout.write(
+                        self.style.WARNING(f"🔍 DRY RUN - Would update {sets_count} ShortcutSet(s)")
+                    )
             else:
-                self.stdout.write(
-                    self.style.WARNING(f"🔍 DRY RUN - Would update {sets_count} ShortcutSet(s)")
-                )
-        else:
-            self.stdout.write(self.style.SUCCESS("✅ All ShortcutSets have owners!"))
-
-        # Fix Shortcuts
-        shortcuts_without_owner = Shortcut.objects.filter(owner__isnull=True)
-        shortcuts_count = shortcuts_without_owner.count()
+                self.stdout.write(self.style.SUCCESS("✅ All ShortcutSets have owners!"))
 
-        if shortcuts_count > 0:
-            self.stdout.write(
-                self.style.WARNING(f"\n⚠️  Found {shortcuts_count} Shortcut(s) without owner")
-            )
+            # Fix Shortcuts
+            shortcuts_without_owner = Shortcut.objects.filter(owner__isnull=True)
+            shortcuts_count = shortcuts_without_owner.count()
 
-            # Show sample
-            sample = shortcuts_without_owner[:5]
-            for sc in sample:
-                sets_str = ", ".join([s.name for s in sc.sets.all()]) or "no sets"
-                self.stdout.write(f"  - {sc.key} (in: {sets_str})")
-            if shortcuts_count > 5:
-                self.stdout.write(f"  ... and {shortcuts_count - 5} more")
-
-            if not dry_run:
-                updated = shortcuts_without_owner.update(owner=owner)
+            if shortcuts_count > 0:
                 self.stdout.write(
-                    self.style.SUCCESS(f"✅ Updated {updated} Shortcut(s)")
+                    self.style.WARNING(f"\n⚠️  Found {shortcuts_count} Shortcut(s) without owner")
                 )
+
+                # Show sample
+                sample = list(shortcuts_without_owner.order_by('id').values_list('id', 'key')[:5])
+                set_names = shortcut_set_names([shortcut_id for shortcut_id, _ in sample])
+                for shortcut_id, key in sample:
+                    sets_str = ", ".join(set_names.get(shortcut_id, ([], []))[0]) or "no sets"
+                    self.stdout.write(f"  - {key} (in: {sets_str})")
+                if shortcuts_count > 5:
+                    self.stdout.write(f"  ... and {shortcuts_count - 5} more")
+
+                if not dry_run:
+                    rows = memberships(shortcuts_without_owner.values('id'))
+                    updated = shortcuts_without_owner.update(owner=owner)
+                    # Owners are part of the shortcut rows: log them for delta clients, which
+                    # also refreshes the cached lists and bundles of their sets
+                    record_changes(rows)
+                    self.stdout.write(
+                        self.style.SUCCESS(f"✅ Updated {updated} Shortcut(s)")
+                    )
+                else:
+                    self.stdout.write(
+                        self.style.WARNING(f"🔍 DRY RUN - Would update {shortcuts_count} Shortcut(s)")
+                    )
             else:
-                self.stdout.write(
-                    self.style.WARNING(f"🔍 DRY RUN - Would update {shortcuts_count} Shortcut(s)")
-                )
-        else:
-            self.stdout.write(self.style.SUCCESS("\n✅ All Shortcuts have owners!"))
+                self.stdout.write(self.style.SUCCESS("\n✅ All Shortcuts have owners!"))
 
         if dry_run:
             self.stdout.write(
@@ -1,12 +1,19 @@
 """
 Management command to link shortcuts to sets based on their intended set.
 This fixes shortcuts that exist but aren't linked to any sets.
+
+Links are inserted in batches straight into the through table inside one
+transaction, so no per-shortcut queries or m2m signals (the change log is written here).
 """
 
 from django.core.management.base import BaseCommand
-from django.db.models import Count
+from django.db import transaction
 
 from textsync.models import Shortcut, ShortcutSet
+from textsync.signals import record_changes
+from textsync.sync import lock_change_log
+
+ShortcutSets = Shortcut.sets.through
 
 
 class Command(BaseCommand):
@@ -24,17 +31,22 @@ class Command(BaseCommand):
             default="Birou",
             help="Set name to link shortcuts to (default: Birou)",
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Shortcuts linked per batch (default: 1000)",
+        )
 
     def handle(self, *args, **options):
         dry_run = options["dry_run"]
         set_name = options["set_name"]
+        batch_size = options["batch_size"]
 
         self.stdout.write(f"\n🔍 Checking for shortcuts without sets...\n")
 
         # Find shortcuts that have no sets
-        unlinked_shortcuts = Shortcut.objects.annotate(
-            set_count=Count('sets')
-        ).filter(set_count=0)
+        unlinked_shortcuts = Shortcut.objects.filter(sets=None).order_by('id')
 
         unlinked_count = unlinked_shortcuts.count()
 
@@ -59,7 +71,7 @@ class Command(BaseCommand):
 
         # Show sample of shortcuts to be linked
         self.stdout.write("Sample shortcuts to be linked:")
-        for sc in unlinked_shortcuts[:5]:
+        for sc in unlinked_shortcuts.select_related('owner')[:5]:
             owner_str = f" (owner: {sc.owner.username})" if sc.owner else " (no owner)"
             preview = sc.value[:40] if sc.value else (sc.html_value[:40] if sc.html_value else "")
             self.stdout.write(f"  - {sc.key} → {preview}...{owner_str}")
@@ -72,11 +84,19 @@ class Command(BaseCommand):
             self.stdout.write(f"   Would link {unlinked_count} shortcuts to '{target_set.name}' set")
             return
 
-        # Link shortcuts to set
+        # Link shortcuts to set: each batch is the next unlinked ids (linked ones drop out of the filter)
         linked_count = 0
-        for shortcut in unlinked_shortcuts:
-            shortcut.sets.add(target_set)
-            linked_count += 1
+        with transaction.atomic():
+            lock_change_log()  # Before the first membership row is written (see sync.lock_change_log)
+            while batch := list(unlinked_shortcuts.values_list('id', 'key')[:batch_size]):
+                ShortcutSets.objects.bulk_create(
+                    [ShortcutSets(shortcut_id=shortcut_id, shortcutset_id=target_set.id) for shortcut_id, _ in batch],
+                    batch_size=batch_size,
+                )
+                # The shortcuts had no other sets, so target_set is their only membership
+                record_changes((shortcut_id, key, target_set.id) for shortcut_id, key in batch)
+                linked_count += len(batch)
+                self.stdout.write(f"   {linked_count}/{unlinked_count} linked...")
 
         self.stdout.write(
             self.style.SUCCESS(f"\n✅ Successfully linked {linked_count} shortcuts to '{target_set.name}' set")
@@ -1,15 +1,20 @@
 """
 Management command to load shortcuts from fixture into Birou set.
 Automatically finds the Birou set by name, regardless of ID.
+
+The fixture is diffed against the set by key and applied in bulk inside one
+transaction (see textsync.importer): re-running it only writes what changed.
 """
 
 import json
 import os
+import time
 
 from django.core.management.base import BaseCommand
-from django.utils import timezone
+from django.db import transaction
 
-from textsync.models import Shortcut, ShortcutSet
+from textsync.importer import import_shortcuts
+from textsync.models import ShortcutSet
 
 
 class Command(BaseCommand):
@@ -19,7 +24,18 @@ class Command(BaseCommand):
         parser.add_argument(
             "--force",
             action="store_true",
-            help="Delete existing shortcuts without confirmation",
+            help="Also remove shortcuts from the set that are not in the fixture",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Show what would be done without making changes",
+        )
+        parser.add_argument(
+            "--fixture",
+            type=str,
+            default=os.path.join(os.path.dirname(__file__), "../../fixtures/birou_shortcuts.json"),
+            help="Fixture to load (default: textsync/fixtures/birou_shortcuts.json)",
         )
 
     def handle(self, *args, **options):
@@ -33,9 +49,7 @@ class Command(BaseCommand):
             return
 
         # Load fixture
-        fixture_path = os.path.join(
-            os.path.dirname(__file__), "../../fixtures/birou_shortcuts.json"
-        )
+        fixture_path = options["fixture"]
 
         if not os.path.exists(fixture_path):
             self.stdout.write(self.style.ERROR(f"❌ Fixture not found: {fixture_path}"))
@@ -44,48 +58,38 @@ class Command(BaseCommand):
         with open(fixture_path, "r", encoding="utf-8") as f:
             data = json.load(f)
 
-        # Delete existing shortcuts in birou set (optional)
-        old_count = birou_set.shortcuts.count()
-        if old_count > 0:
-            if options["force"]:
-                birou_set.shortcuts.all().delete()
-                self.stdout.write(f"🗑️  Deleted {old_count} old shortcuts")
-            else:
-                self.stdout.write(
-                    self.style.WARNING(
-                        f"⚠️  Birou set already has {old_count} shortcuts. "
-                        f"Use --force to delete them first."
-                    )
-                )
-                return
-
-        # Load shortcuts
-        created = 0
-        for item in data:
-            if item["model"] != "textsync.Shortcut":
-                continue
-
-            fields = item["fields"]
-
-            # Create or update shortcut
-            shortcut, is_new = Shortcut.objects.update_or_create(
-                key=fields["key"],
-                defaults={
-                    "value": fields["value"],
-                    "html_value": fields["html_value"],
-                    "updated_at": timezone.now(),
-                },
-            )
-
-            # Add to birou set
-            shortcut.sets.add(birou_set)
+        items = [
+            {
+                "key": item["fields"]["key"],
+                "value": item["fields"]["value"],
+                "html_value": item["fields"].get("html_value"),
+            }
+            for item in data
+            if item["model"] == "textsync.Shortcut"
+        ]
+
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                counts = import_shortcuts(birou_set, items, prune=options["force"])
+                if options["dry_run"]:
+                    transaction.set_rollback(True)
+        except ValueError as e:
+            self.stdout.write(self.style.ERROR(f"❌ Invalid fixture: {e}"))
+            return
+        elapsed = time.perf_counter() - start
 
-            if is_new:
-                created += 1
+        summary = (
+            f"{counts['created']} new, {counts['updated']} updated, {counts['unchanged']} unchanged, "
+            f"{counts['removed']} removed"
+        )
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"🔍 DRY RUN - Would load: {summary}"))
+            return
 
         self.stdout.write(
             self.style.SUCCESS(
-                f"✅ Loaded {created} new shortcuts into 'birou' set (ID {birou_set.id})"
+                f"✅ Loaded {len(items)} shortcuts into 'birou' set (ID {birou_set.id}) in {elapsed:.2f}s: {summary}"
             )
         )
         self.stdout.write(f"   Total shortcuts in birou: {birou_set.shortcuts.count()}")
@@ -0,0 +1,52 @@
+"""
+Management command to delete old entries from the delta sync change log (ShortcutChange).
+The log gets one row per shortcut and set on every change, so it grows forever otherwise.
+Clients whose sync cursor is older than the pruned entries get a "resync" answer from
+/api/shortcuts/delta/ and /api/events/ and do a full sync.
+
+Example cron entry (every night at 03:30):
+    30 3 * * * cd /var/www/autotext && .venv/bin/python manage.py prune_changes
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from textsync.models import ShortcutChange
+from textsync.sync import prune_changes, prune_point
+
+
+class Command(BaseCommand):
+    help = "Delete delta sync change log entries older than SYNC_CHANGE_RETENTION_DAYS"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.SYNC_CHANGE_RETENTION_DAYS,
+            help=f"Keep entries from the last N days (default: {settings.SYNC_CHANGE_RETENTION_DAYS})",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the entries that would be deleted",
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 1:
+            raise CommandError("--days must be at least 1")
+        before = timezone.now() - timedelta(days=options["days"])
+        self.stdout.write(f"\n🧹 Pruning change log entries older than {options['days']} days ({before:%Y-%m-%d %H:%M})...\n")
+
+        if options["dry_run"]:
+            last_id = prune_point(before)
+            count = ShortcutChange.objects.filter(id__lte=last_id).count() if last_id else 0
+            self.stdout.write(self.style.WARNING(f"🔍 DRY RUN - Would delete {count} entries"))
+            return
+
+        deleted, horizon = prune_changes(before)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Deleted {deleted} entries; clients with cursors before #{horizon} will do a full sync"
+        ))
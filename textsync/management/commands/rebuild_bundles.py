@@ -0,0 +1,43 @@
+"""
+Management command to build the per-set shortcut bundles (see textsync/bundles.py).
+Bundles are rebuilt when a change commits; until a set has one, reads use the database.
+Run this after migrating, after changes made outside Django (raw SQL, a restored backup,
+loaddata) or if a rebuild failed (logged by textsync.bundles).
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from textsync.bundles import build_bundle
+from textsync.models import ShortcutSet
+
+
+class Command(BaseCommand):
+    help = "Rebuild the pre-rendered shortcut bundle of every set"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sets",
+            type=str,
+            help="Comma-separated set names (default: all sets)",
+        )
+
+    def handle(self, *args, **options):
+        sets = ShortcutSet.objects.order_by("set_type", "name")
+        if options["sets"]:
+            sets = sets.filter(name__in=[name.strip() for name in options["sets"].split(",")])
+
+        self.stdout.write("\n📦 Rebuilding shortcut bundles...\n")
+        start = time.perf_counter()
+        count = 0
+        for set_id, name in sets.values_list("id", "name"):
+            bundle = build_bundle(set_id)
+            if bundle is None:
+                continue  # Deleted meanwhile
+            count += 1
+            self.stdout.write(
+                f"   {name}: {bundle.row_count} shortcuts, {bundle.size / 1024:.0f} KB JSON, "
+                f"{len(bundle.data) / 1024:.0f} KB stored, {bundle.content_hash[:12]}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt {count} bundle(s) in {time.perf_counter() - start:.2f}s"))
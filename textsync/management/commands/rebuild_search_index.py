@@ -0,0 +1,30 @@
+"""
+Management command to rebuild the full-text search index (see textsync/search.py).
+Only needed if shortcuts were changed outside Django (raw SQL, a restored backup).
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from textsync.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for shortcuts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Shortcuts indexed per batch (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("\n🔍 Rebuilding search index...\n")
+        start = time.perf_counter()
+        count = rebuild_index(options["batch_size"])
+        if count is None:
+            raise CommandError("This database has no search index: run migrate (SQLite and PostgreSQL only)")
+        self.stdout.write(self.style.SUCCESS(f"✅ Indexed {count} shortcuts in {time.perf_counter() - start:.2f}s"))
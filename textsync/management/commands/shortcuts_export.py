@@ -0,0 +1,72 @@
+"""
+Management command to export a set to JSON, NDJSON, CSV or an espanso match file.
+Shortcuts are read with .iterator() and written one by one, so memory stays flat
+however large the set is (see textsync.formats).
+"""
+
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from textsync.formats import CSV_COLUMNS, FORMATS, format_for_path, write_shortcuts
+from textsync.models import Shortcut, ShortcutSet
+
+
+class Command(BaseCommand):
+    help = "Export a set to a JSON, NDJSON, CSV or espanso YAML file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("set", type=str, help="Set name (case-insensitive)")
+        parser.add_argument("file", type=str, help="Output file, or - for stdout")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="File format (default: from the file extension)",
+        )
+        parser.add_argument(
+            "--trigger-prefix",
+            type=str,
+            default="",
+            help="espanso: prefix added to keys to form triggers, e.g. ':' (default: none)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Rows fetched from the database per batch (default: 2000)",
+        )
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or format_for_path(options["file"])
+        if fmt is None:
+            raise CommandError("Can't tell the format from the file name, pass --format")
+
+        shortcut_set = ShortcutSet.objects.filter(name__iexact=options["set"]).first()
+        if shortcut_set is None:
+            raise CommandError(f"Set '{options['set']}' not found")
+
+        # Progress goes to stderr when the export itself goes to stdout
+        log = self.stderr if options["file"] == "-" else self.stdout
+        log.write(f"\n📤 Exporting '{shortcut_set.name}' to {options['file']} ({fmt})...\n")
+
+        shortcuts = (
+            Shortcut.objects.filter(sets=shortcut_set)
+            .order_by("key", "id")
+            .values(*CSV_COLUMNS)
+            .iterator(chunk_size=options["batch_size"])
+        )
+
+        start = time.perf_counter()
+        try:
+            with self.open(options["file"]) as f:
+                count = write_shortcuts(f, fmt, shortcuts, options["trigger_prefix"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Export failed: {e}")
+
+        log.write(self.style.SUCCESS(f"✅ Exported {count} shortcuts in {time.perf_counter() - start:.2f}s"))
+
+    def open(self, path):
+        if path == "-":
+            return open(sys.stdout.fileno(), "w", encoding="utf-8", newline="", closefd=False)
+        return open(path, "w", encoding="utf-8", newline="")
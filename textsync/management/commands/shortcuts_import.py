@@ -0,0 +1,118 @@
+"""
+Management command to import shortcuts into any set from JSON, NDJSON, CSV or an
+espanso match file. The file is read incrementally and written in batches inside
+one transaction (see textsync.formats and textsync.importer).
+"""
+
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from textsync.formats import FORMATS, format_for_path, read_shortcuts
+from textsync.importer import import_shortcuts
+from textsync.models import ShortcutSet
+
+
+class Command(BaseCommand):
+    help = "Import shortcuts into a set from a JSON, NDJSON, CSV or espanso YAML file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("set", type=str, help="Set name (case-insensitive)")
+        parser.add_argument("file", type=str, help="File to import, or - for stdin")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="File format (default: from the file extension)",
+        )
+        parser.add_argument(
+            "--create-set",
+            choices=["general", "personal"],
+            help="Create the set with this type if it doesn't exist",
+        )
+        parser.add_argument(
+            "--owner",
+            type=str,
+            help="Username that owns new shortcuts (and a set created with --create-set)",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Remove shortcuts from the set that are not in the file",
+        )
+        parser.add_argument(
+            "--trigger-prefix",
+            type=str,
+            default="",
+            help="espanso: prefix stripped from triggers to get keys, e.g. ':' (default: none)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Shortcuts read and written per batch (default: 1000)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Show what would be done without making changes",
+        )
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or format_for_path(options["file"])
+        if fmt is None:
+            raise CommandError("Can't tell the format from the file name, pass --format")
+
+        owner = None
+        if options["owner"]:
+            try:
+                owner = User.objects.get(username=options["owner"])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['owner']}' not found")
+
+        self.stdout.write(f"\n📥 Importing {options['file']} ({fmt}) into '{options['set']}'...\n")
+
+        start = time.perf_counter()
+        try:
+            with self.open(options["file"]) as f, transaction.atomic():
+                shortcut_set = self.get_set(options["set"], options["create_set"], owner)
+                counts = import_shortcuts(
+                    shortcut_set,
+                    read_shortcuts(f, fmt, options["trigger_prefix"]),
+                    owner=owner,
+                    prune=options["prune"],
+                    batch_size=options["batch_size"],
+                )
+                if options["dry_run"]:
+                    transaction.set_rollback(True)
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Import failed, nothing was changed: {e}")
+        elapsed = time.perf_counter() - start
+
+        summary = (
+            f"{counts['created']} new, {counts['updated']} updated, {counts['unchanged']} unchanged, "
+            f"{counts['removed']} removed"
+        )
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"🔍 DRY RUN - Would import: {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ Imported in {elapsed:.2f}s: {summary}"))
+
+    def open(self, path):
+        if path == "-":
+            return open(sys.stdin.fileno(), "r", encoding="utf-8", newline="", closefd=False)
+        return open(path, "r", encoding="utf-8", newline="")
+
+    def get_set(self, name, create_type, owner):
+        shortcut_set = ShortcutSet.objects.filter(name__iexact=name).first()
+        if shortcut_set is not None:
+            return shortcut_set
+        if not create_type:
+            raise CommandError(f"Set '{name}' not found. Create it in the admin or pass --create-set")
+        if create_type == "personal" and owner is None:
+            raise CommandError("A personal set needs --owner")
+        shortcut_set = ShortcutSet.objects.create(name=name, set_type=create_type, owner=owner)
+        self.stdout.write(f"✅ Created {create_type} set '{name}'")
+        return shortcut_set
@@ -0,0 +1,82 @@
+"""
+Management command for periodic SQLite maintenance.
+Refreshes planner statistics (ANALYZE / PRAGMA optimize) and checkpoints the WAL
+so the -wal file doesn't grow without bound under SQLITE_TUNING.
+
+Example cron entry (every night at 03:00):
+    0 3 * * * cd /var/www/autotext && .venv/bin/python manage.py sqlite_maintenance
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+CHECKPOINT_MODES = ("PASSIVE", "FULL", "RESTART", "TRUNCATE")
+
+
+class Command(BaseCommand):
+    help = "Run ANALYZE and a WAL checkpoint on the SQLite database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--checkpoint",
+            type=str.upper,
+            choices=CHECKPOINT_MODES,
+            default="PASSIVE",
+            help="wal_checkpoint mode; PASSIVE never blocks readers or writers, "
+                 "TRUNCATE also shrinks the -wal file but waits for them (default: PASSIVE)",
+        )
+        parser.add_argument(
+            "--full-analyze",
+            action="store_true",
+            help="Run a full ANALYZE instead of PRAGMA optimize (which only analyzes tables that need it)",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError(f"Database is {connection.vendor}, not SQLite - nothing to do")
+
+        path = connection.settings_dict["NAME"]
+        self.stdout.write(f"\n🔧 SQLite maintenance: {path}\n")
+
+        with connection.cursor() as cursor:
+            journal_mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+            page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+            page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+            freelist = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            self.stdout.write(
+                f"   journal_mode={journal_mode}, size={page_size * page_count / 1024 / 1024:.1f} MB, "
+                f"free pages={freelist}"
+            )
+
+            if options["full_analyze"]:
+                cursor.execute("ANALYZE")
+                self.stdout.write(self.style.SUCCESS("✅ ANALYZE done"))
+            else:
+                cursor.execute("PRAGMA optimize")
+                self.stdout.write(self.style.SUCCESS("✅ PRAGMA optimize done"))
+
+            if journal_mode.lower() != "wal":
+                self.stdout.write(self.style.WARNING(
+                    "⚠️  Not in WAL mode (set SQLITE_TUNING=True) - skipping checkpoint"
+                ))
+                return
+
+            wal_path = f"{path}-wal"
+            wal_before = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+            busy, log_frames, checkpointed = cursor.execute(
+                f"PRAGMA wal_checkpoint({options['checkpoint']})"
+            ).fetchone()
+            wal_after = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+
+        if busy:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  Checkpoint ({options['checkpoint']}) could not finish: database busy, "
+                f"{checkpointed}/{log_frames} frames copied - run again later"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Checkpoint ({options['checkpoint']}): {checkpointed}/{log_frames} frames copied, "
+                f"WAL {wal_before / 1024:.0f} KB -> {wal_after / 1024:.0f} KB"
+            ))
@@ -0,0 +1,133 @@
+"""
+In-process request metrics exposed in the Prometheus text format.
+
+RequestMetricsMiddleware records one observation per request; views can add
+named phases (e.g. serialization) with `phase(request, 'serialize')`.
+Each gunicorn worker keeps its own registry, so a scrape shows the worker that
+answered it - sum over scrapes or label by instance when aggregating.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{format_labels(labels)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * len(self.buckets) + [0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{format_labels(labels + (('le', format_value(bound)),))} {count}")
+            lines.append(f"{self.name}_bucket{format_labels(labels + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(series[-2])}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter('textsync_requests_total', 'Requests by view and status code.')
+        self.duration = Histogram(
+            'textsync_request_duration_seconds', 'Wall time per request.', DURATION_BUCKETS)
+        self.db_queries = Histogram(
+            'textsync_db_queries', 'SQL queries per request.', QUERY_BUCKETS)
+        self.db_duration = Histogram(
+            'textsync_db_duration_seconds', 'Total SQL time per request.', DURATION_BUCKETS)
+        self.phase_duration = Histogram(
+            'textsync_phase_duration_seconds', 'Time spent in named phases (serialize, ...) per request.',
+            DURATION_BUCKETS)
+        self.response_bytes = Histogram(
+            'textsync_response_bytes', 'Response body size (after compression).', BYTES_BUCKETS)
+        self.cache_lookups = Counter(
+            'textsync_cache_lookups_total', 'Cache lookups by kind and result (hit/miss), see caching.py.')
+
+    def record(self, view, status, duration, queries, db_duration, phases, size):
+        with self._lock:
+            self.requests.inc(view=view, status=status)
+            self.duration.observe(duration, view=view)
+            self.db_queries.observe(queries, view=view)
+            self.db_duration.observe(db_duration, view=view)
+            for name, seconds in phases.items():
+                self.phase_duration.observe(seconds, view=view, phase=name)
+            if size is not None:
+                self.response_bytes.observe(size, view=view)
+
+    def record_cache_lookup(self, kind, result):
+        with self._lock:
+            self.cache_lookups.inc(kind=kind, result=result)
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.duration, self.db_queries, self.db_duration,
+                           self.phase_duration, self.response_bytes, self.cache_lookups):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def phase(request, name):
+    """Time a block and attribute it to `name` for the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = getattr(request, '_metrics_phases', None)
+        if phases is not None:
+            phases[name] = phases.get(name, 0) + time.perf_counter() - start
@@ -0,0 +1,262 @@
+"""
+Middleware for the sync API.
+
+Both middlewares work under WSGI and ASGI: with an async view below them they
+stay async, so a waiting /api/events/ client never ties up a thread.
+"""
+
+import contextvars
+import logging
+import time
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from .metrics import registry
+
+try:
+    import brotli
+except ImportError:  # Optional: pip install brotli
+    brotli = None
+
+logger = logging.getLogger('textsync.metrics')
+
+
+def accepted_encodings(header):
+    """Parse an Accept-Encoding header into the set of codings with q > 0"""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def brotli_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in sequence:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def abrotli_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    async for chunk in sequence:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def agzip_sequence(sequence):
+    """Async counterpart of django.utils.text.compress_sequence (flushes after every chunk)"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in sequence:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class SyncCompressionMiddleware:
+    """
+    Compress sync API responses in-process: brotli when installed and accepted, gzip otherwise.
+
+    Only paths under API_COMPRESSION_PATHS are touched (the shortcut/set payloads, not the
+    auth endpoints that return tokens). Disable with API_COMPRESSION=False when a reverse
+    proxy already compresses application/json.
+    """
+
+    min_length = 200
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'API_COMPRESSION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.paths = tuple(getattr(settings, 'API_COMPRESSION_PATHS', ('/api/shortcuts/', '/api/sets/')))
+        self.brotli_quality = getattr(settings, 'API_COMPRESSION_BROTLI_QUALITY', 5)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if not request.path.startswith(self.paths) or response.has_header('Content-Encoding'):
+            return response
+        if not response.streaming and len(response.content) < self.min_length:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+        else:
+            return response
+
+        if response.streaming and response.is_async:
+            if encoding == 'br':
+                response.streaming_content = abrotli_sequence(response.streaming_content, self.brotli_quality)
+            else:
+                response.streaming_content = agzip_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        elif response.streaming:
+            if encoding == 'br':
+                response.streaming_content = brotli_sequence(response.streaming_content, self.brotli_quality)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=self.brotli_quality)
+            else:
+                compressed = compress_string(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The compressed bytes are a different representation: weaken a strong ETag (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+# Query count/time of the current request. A context variable rather than a
+# per-connection execute_wrapper() block, so queries the async ORM runs in
+# sync_to_async threads (which copy the context) are counted too.
+request_db_stats = contextvars.ContextVar('request_db_stats', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    db = request_db_stats.get()
+    if db is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        db['queries'] += 1
+        db['time'] += time.perf_counter() - start
+
+
+def install_query_counter(sender=None, connection=None, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+class RequestMetricsMiddleware:
+    """
+    Record wall time, SQL query count/time, named phases and response bytes per view
+    into the in-process metrics registry (served at /api/metrics/), and log requests
+    slower than SLOW_REQUEST_THRESHOLD_MS.
+
+    Should be first in MIDDLEWARE so timings cover the whole stack and byte counts
+    reflect compression.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 1000) / 1000
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+        # Count queries on every connection, including ones opened later by other threads
+        connection_created.connect(install_query_counter, dispatch_uid='textsync.count_queries')
+        for db_connection in connections.all(initialized_only=True):
+            install_query_counter(connection=db_connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        install_query_counter(connection=connection)
+        db = self.start(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_db_stats.set(None)
+        return self.finish(request, response, time.perf_counter() - start, db)
+
+    async def __acall__(self, request):
+        db = self.start(request)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_db_stats.set(None)
+        return self.finish(request, response, time.perf_counter() - start, db)
+
+    def start(self, request):
+        request._metrics_phases = {}
+        request._metrics_view = None
+        db = {'queries': 0, 'time': 0.0}
+        request_db_stats.set(db)
+        return db
+
+    def finish(self, request, response, duration, db):
+        phases = request._metrics_phases
+        view = request._metrics_view or 'unresolved'
+        size = None if response.streaming else len(response.content)
+        registry.record(view, response.status_code, duration, db['queries'], db['time'], phases, size)
+
+        # Long-polls (/api/events/) are slow on purpose
+        if duration > self.slow_threshold and not getattr(request, 'long_poll', False):
+            phase_str = ' '.join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in phases.items())
+            logger.warning(
+                f"Slow request: {request.method} {request.path} view={view} status={response.status_code} "
+                f"total={duration * 1000:.0f}ms db={db['time'] * 1000:.0f}ms/{db['queries']}q "
+                f"{phase_str} bytes={size}"
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # DRF viewsets: "ShortcutViewSet.list"; @api_view functions: "login_view";
+        # everything else (admin, ...): the URL name, e.g. "admin:textsync_shortcut_changelist"
+        cls = getattr(view_func, 'cls', None)
+        actions = getattr(view_func, 'actions', None)
+        if cls is not None and actions:
+            action = actions.get(request.method.lower(), request.method.lower())
+            request._metrics_view = f"{cls.__name__}.{action}"
+        elif cls is not None:
+            request._metrics_view = cls.__name__
+        elif request.resolver_match is not None:
+            request._metrics_view = request.resolver_match.view_name or view_func.__name__
+        else:
+            request._metrics_view = view_func.__name__
+        return None
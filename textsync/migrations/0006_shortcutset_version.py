@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('textsync', '0005_shortcut_content_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shortcutset',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Bumped whenever the synced content of this set changes. Used for snapshot ETags.'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('textsync', '0006_shortcutset_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShortcutChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shortcut_id', models.BigIntegerField()),
+                ('key', models.CharField(max_length=50)),
+                ('action', models.CharField(choices=[('update', 'Created/Updated'), ('remove', 'Removed from set'), ('delete', 'Deleted')], default='update', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('shortcut_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='textsync.shortcutset')),
+            ],
+            options={
+                'verbose_name': 'Shortcut Change',
+                'verbose_name_plural': 'Shortcut Changes',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('textsync', '0007_shortcutchange'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shortcutchange',
+            index=models.Index(fields=['shortcut_set', 'id'], name='textsync_change_set_cursor'),
+        ),
+    ]
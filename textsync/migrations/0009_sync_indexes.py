@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('textsync', '0008_shortcutchange_set_cursor_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shortcutset',
+            index=models.Index(fields=['set_type', 'name'], name='textsync_set_type_name'),
+        ),
+        migrations.AddIndex(
+            model_name='shortcut',
+            index=models.Index(fields=['key', 'id'], name='textsync_shortcut_key_id'),
+        ),
+        migrations.AddIndex(
+            model_name='shortcut',
+            index=models.Index(fields=['updated_at'], name='textsync_shortcut_updated'),
+        ),
+        # The auto-created sets through table can't declare Meta.indexes. Its unique index is
+        # (shortcut_id, shortcutset_id); sets__in filters start from the set, so add the reverse.
+        migrations.RunSQL(
+            sql='CREATE INDEX textsync_shortcut_sets_set_sc ON textsync_shortcut_sets (shortcutset_id, shortcut_id)',
+            reverse_sql='DROP INDEX textsync_shortcut_sets_set_sc',
+        ),
+    ]
@@ -0,0 +1,70 @@
+import html
+
+from django.db import migrations
+from django.utils.html import strip_tags
+
+# See textsync/search.py
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE textsync_shortcut_fts USING fts5("
+    "key, value, html_text, tokenize = 'unicode61 remove_diacritics 2')"
+)
+SQLITE_INSERT = "INSERT INTO textsync_shortcut_fts (rowid, key, value, html_text) VALUES (%s, %s, %s, %s)"
+
+POSTGRESQL_CREATE = [
+    # No foreign key to textsync_shortcut: it would make `manage.py flush` (TRUNCATE) fail.
+    # Rows of deleted shortcuts are removed by the post_delete signal. bigint like Shortcut.id.
+    "CREATE TABLE textsync_shortcut_search (shortcut_id bigint PRIMARY KEY, document tsvector NOT NULL)",
+    "CREATE INDEX textsync_shortcut_search_document ON textsync_shortcut_search USING GIN (document)",
+]
+POSTGRESQL_INSERT = (
+    "INSERT INTO textsync_shortcut_search (shortcut_id, document) VALUES "
+    "(%s, setweight(to_tsvector('simple', %s::text), 'A') || "
+    "setweight(to_tsvector('simple', %s::text || ' ' || %s::text), 'B'))"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in ('sqlite', 'postgresql'):
+        return
+    Shortcut = apps.get_model('textsync', 'Shortcut')
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            for sql in POSTGRESQL_CREATE:
+                cursor.execute(sql)
+        else:
+            cursor.execute(SQLITE_CREATE)
+
+        last_id = 0
+        while rows := list(
+            Shortcut.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'key', 'value', 'html_value')[:1000]
+        ):
+            cursor.executemany(
+                POSTGRESQL_INSERT if vendor == 'postgresql' else SQLITE_INSERT,
+                [
+                    (shortcut_id, key, value or '', html.unescape(strip_tags(html_value)) if html_value else '')
+                    for shortcut_id, key, value, html_value in rows
+                ],
+            )
+            last_id = rows[-1][0]
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            cursor.execute("DROP TABLE IF EXISTS textsync_shortcut_search")
+        elif vendor == 'sqlite':
+            cursor.execute("DROP TABLE IF EXISTS textsync_shortcut_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('textsync', '0009_sync_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
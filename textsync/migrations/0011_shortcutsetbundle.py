@@ -0,0 +1,29 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('textsync', '0010_shortcut_search_index'),
+    ]
+
+    operations = [
+        # Empty at first: bundles are built by `manage.py rebuild_bundles` and on every change
+        migrations.CreateModel(
+            name='ShortcutSetBundle',
+            fields=[
+                ('shortcut_set', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='bundle', serialize=False, to='textsync.shortcutset')),
+                ('version', models.PositiveIntegerField(help_text='ShortcutSet.version the bundle was built from.')),
+                ('content_hash', models.CharField(help_text='SHA-256 of the uncompressed JSON.', max_length=64)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(help_text='Uncompressed size in bytes.')),
+                ('row_count', models.PositiveIntegerField()),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Shortcut Set Bundle',
+                'verbose_name_plural': 'Shortcut Set Bundles',
+            },
+        ),
+    ]
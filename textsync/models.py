@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import F
 from django.utils import timezone
 from datetime import timedelta
 import binascii
@@ -56,15 +57,37 @@ class ShortcutSet(models.Model):
                                         related_name='visible_sets',
                                         help_text='Staff users who can see this set (in addition to the owner). Only superusers can set this.')
     created_at = models.DateTimeField(auto_now_add=True)
+    version = models.PositiveIntegerField(default=0, editable=False,
+                                          help_text='Bumped whenever the synced content of this set changes. Used for snapshot ETags.')
 
     class Meta:
         ordering = ['set_type', 'name']
         verbose_name = 'Shortcut Set'
         verbose_name_plural = 'Shortcut Sets'
+        indexes = [
+            # accessible_sets() filters on set_type; listings are ordered by (set_type, name)
+            models.Index(fields=['set_type', 'name'], name='textsync_set_type_name'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.get_set_type_display()})"
 
+    def save(self, *args, **kwargs):
+        # version is only changed through bump_versions(); never write back a stale in-memory copy
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'version'
+            ]
+        return super().save(*args, **kwargs)
+
+    @classmethod
+    def bump_versions(cls, set_ids):
+        """Atomically increment the version of the given sets"""
+        set_ids = set(set_ids)
+        if set_ids:
+            cls.objects.filter(pk__in=set_ids).update(version=F('version') + 1)
+
 
 class Shortcut(models.Model):
     """Represents a text expansion shortcut"""
@@ -90,8 +113,70 @@ class Shortcut(models.Model):
         ordering = ['key']
         verbose_name = 'Shortcut'
         verbose_name_plural = 'Shortcuts'
+        indexes = [
+            # Sync lists are ordered and keyset-paginated by (key, id)
+            models.Index(fields=['key', 'id'], name='textsync_shortcut_key_id'),
+            # Legacy ?updated_after= delta sync
+            models.Index(fields=['updated_at'], name='textsync_shortcut_updated'),
+        ]
 
     def __str__(self):
-        sets_str = ", ".join([s.name for s in self.sets.all()]) if self.sets.exists() else "no sets"
+        # No set names: this is rendered in admin dropdowns and log entries, one query per row
         preview = self.value[:30] if self.value else (self.html_value[:30] if self.html_value else "no content")
-        return f"{self.key} → {preview} ({sets_str})"
+        return f"{self.key} → {preview}"
+
+
+class ShortcutChange(models.Model):
+    """
+    Change log used for delta sync.
+    One row per (shortcut, set) whenever a shortcut changes, is deleted or leaves a set.
+    Rows for deleted shortcuts act as tombstones. The id is the sync cursor.
+    """
+
+    ACTIONS = [
+        ('update', 'Created/Updated'),
+        ('remove', 'Removed from set'),
+        ('delete', 'Deleted'),
+    ]
+
+    shortcut_id = models.BigIntegerField()  # Not a FK - must outlive the shortcut
+    key = models.CharField(max_length=50)
+    shortcut_set = models.ForeignKey(ShortcutSet, on_delete=models.CASCADE, related_name='changes')
+    action = models.CharField(max_length=10, choices=ACTIONS, default='update')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # "changes after cursor N for these sets" is a range scan per set
+            models.Index(fields=['shortcut_set', 'id'], name='textsync_change_set_cursor'),
+        ]
+        verbose_name = 'Shortcut Change'
+        verbose_name_plural = 'Shortcut Changes'
+
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.key} (set {self.shortcut_set_id})"
+
+
+class ShortcutSetBundle(models.Model):
+    """
+    Pre-rendered rows of one set (sync.shortcut_rows output as gzip-compressed JSON),
+    materialised after every change to the set (see bundles.py). Current while `version`
+    equals the set's version; the sync API merges the bundles of the requested sets.
+    """
+
+    shortcut_set = models.OneToOneField(ShortcutSet, on_delete=models.CASCADE, primary_key=True,
+                                        related_name='bundle')
+    version = models.PositiveIntegerField(help_text='ShortcutSet.version the bundle was built from.')
+    content_hash = models.CharField(max_length=64, help_text='SHA-256 of the uncompressed JSON.')
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(help_text='Uncompressed size in bytes.')
+    row_count = models.PositiveIntegerField()
+    built_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Shortcut Set Bundle'
+        verbose_name_plural = 'Shortcut Set Bundles'
+
+    def __str__(self):
+        return f"Bundle of set {self.shortcut_set_id} v{self.version} ({self.row_count} rows)"
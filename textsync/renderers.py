@@ -0,0 +1,25 @@
+"""
+Renderers for the sync API.
+"""
+
+from rest_framework.renderers import BaseRenderer
+
+from .sync import render_json
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON: one object per line (?format=ndjson or Accept: application/x-ndjson).
+
+    ShortcutViewSet.list streams this format itself (see ShortcutViewSet.stream);
+    the renderer covers everything else, e.g. error responses and single objects.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        return b''.join(render_json(item) + b'\n' for item in items)
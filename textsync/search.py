@@ -0,0 +1,207 @@
+"""
+Full-text search over shortcuts.
+
+The index holds key, value and the tag-stripped text of html_value per shortcut:
+- SQLite: an FTS5 table (textsync_shortcut_fts, rowid = shortcut id), ranked with bm25()
+- PostgreSQL: a tsvector table (textsync_shortcut_search) with a GIN index, ranked with ts_rank_cd()
+Both are created by migration 0010. Keys weigh more than the text in the ranking.
+On other databases, or before that migration ran, nothing is indexed and searches fall
+back to unranked icontains matches on key, value and html_value.
+
+The shortcut signals keep the index current for single saves/deletes; bulk writes
+(importer, copy_from_sqlite) call index_shortcuts() themselves.
+Every search term is matched as a prefix, so results update as the user types.
+"""
+
+import html
+import re
+from itertools import islice
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+
+from .models import Shortcut
+
+ShortcutSets = Shortcut.sets.through
+
+FTS_TABLE = 'textsync_shortcut_fts'
+TSVECTOR_TABLE = 'textsync_shortcut_search'
+
+# bm25() weights for the key, value and html_text columns (SQLite)
+BM25_WEIGHTS = (10.0, 1.0, 1.0)
+
+TERM = re.compile(r'\w+')
+
+# (alias, database name) of the databases whose index table exists; it isn't dropped at runtime
+_indexed_databases = set()
+
+
+def html_text(html_value):
+    """Searchable text of an html_value: tags stripped, entities decoded"""
+    return html.unescape(strip_tags(html_value)) if html_value else ''
+
+
+def search_terms(query):
+    """Words of a user query; everything else (FTS operators, quotes, ...) is dropped"""
+    return TERM.findall(query or '')
+
+
+def index_table(db=None):
+    """The index table of a database connection, or None if its vendor has none or migration 0010 hasn't run"""
+    db = db or connection
+    table = {'postgresql': TSVECTOR_TABLE, 'sqlite': FTS_TABLE}.get(db.vendor)
+    if table is None:
+        return None
+    key = (db.alias, db.settings_dict['NAME'])
+    if key not in _indexed_databases:
+        if table not in db.introspection.table_names():
+            return None
+        _indexed_databases.add(key)
+    return table
+
+
+def match_expression(terms):
+    """Prefix query for all terms: FTS5 MATCH syntax on SQLite, to_tsquery() syntax on PostgreSQL"""
+    if connection.vendor == 'postgresql':
+        return ' & '.join(f"{term}:*" for term in terms)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def index_shortcuts(shortcut_ids, batch_size=1000):
+    """(Re)index the given shortcuts; ids that no longer exist are removed from the index"""
+    if index_table() is None:
+        return
+    shortcut_ids = iter(shortcut_ids)
+    while batch := list(islice(shortcut_ids, batch_size)):
+        with transaction.atomic():
+            unindex_shortcuts(batch)
+            insert_rows(Shortcut.objects.filter(id__in=batch).order_by())
+
+
+def unindex_shortcuts(shortcut_ids):
+    shortcut_ids = list(shortcut_ids)
+    if not shortcut_ids or index_table() is None:
+        return
+    placeholders = ', '.join(['%s'] * len(shortcut_ids))
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"DELETE FROM {TSVECTOR_TABLE} WHERE shortcut_id IN ({placeholders})", shortcut_ids)
+        else:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", shortcut_ids)
+
+
+def rebuild_index(batch_size=1000, using=DEFAULT_DB_ALIAS):
+    """
+    Empty and refill the whole index in one transaction; returns the number of shortcuts
+    indexed, or None if the database has no index (see index_table).
+    """
+    table = index_table(connections[using])
+    if table is None:
+        return None
+    shortcuts = Shortcut.objects.using(using)
+    count, last_id = 0, 0
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        while batch := list(shortcuts.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]):
+            insert_rows(shortcuts.filter(id__in=batch).order_by())
+            count += len(batch)
+            last_id = batch[-1]
+    return count
+
+
+def insert_rows(queryset):
+    rows = [
+        (shortcut_id, key, value or '', html_text(html_value))
+        for shortcut_id, key, value, html_value in queryset.values_list('id', 'key', 'value', 'html_value')
+    ]
+    db = connections[queryset.db]
+    with db.cursor() as cursor:
+        if db.vendor == 'postgresql':
+            cursor.executemany(
+                f"INSERT INTO {TSVECTOR_TABLE} (shortcut_id, document) VALUES "
+                "(%s, setweight(to_tsvector('simple', %s::text), 'A') || "
+                "setweight(to_tsvector('simple', %s::text || ' ' || %s::text), 'B'))",
+                rows,
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, key, value, html_text) VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+
+def search_sql(terms, set_ids=None, ranked=True):
+    """
+    (sql, params) selecting the ids of shortcuts matching all terms, best match first if ranked.
+    set_ids limits the results to shortcuts in those sets.
+    """
+    expression = match_expression(terms)
+    members_sql, members_params = '', []
+    if set_ids is not None:
+        members_sql, members_params = (
+            ShortcutSets.objects.filter(shortcutset_id__in=list(set_ids))
+            .values('shortcut_id').query.sql_with_params()
+        )
+
+    if connection.vendor == 'postgresql':
+        sql = f"SELECT shortcut_id FROM {TSVECTOR_TABLE} WHERE document @@ to_tsquery('simple', %s::text)"
+        params = [expression]
+        if members_sql:
+            sql += f" AND shortcut_id IN ({members_sql})"
+            params += members_params
+        if ranked:
+            sql += " ORDER BY ts_rank_cd(document, to_tsquery('simple', %s::text)) DESC, shortcut_id"
+            params.append(expression)
+        return sql, params
+
+    if not ranked and not members_sql:
+        return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression]
+    # Run MATCH once up front: with "rowid IN (...)" next to it SQLite looks up each
+    # member rowid and re-runs the full-text query for it (seconds instead of milliseconds)
+    sql = (
+        f"WITH hits AS MATERIALIZED (SELECT rowid AS id, bm25({FTS_TABLE}, {', '.join(map(str, BM25_WEIGHTS))}) AS rank "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s) SELECT id FROM hits"
+    )
+    if members_sql:
+        sql += f" WHERE id IN ({members_sql})"
+    if ranked:
+        sql += " ORDER BY rank, id"
+    return sql, [expression, *members_params]
+
+
+def contains_filter(terms):
+    """Q for shortcuts containing every term in key, value or html_value (no index: no prefixes or ranking)"""
+    q = Q()
+    for term in terms:
+        q &= Q(key__icontains=term) | Q(value__icontains=term) | Q(html_value__icontains=term)
+    return q
+
+
+def search_ids(query, set_ids=None, limit=50, offset=0):
+    """Ids of the shortcuts matching query (see search_terms), best match first"""
+    terms = search_terms(query)
+    if not terms or set_ids is not None and not set_ids:
+        return []
+    if index_table() is None:
+        queryset = Shortcut.objects.filter(contains_filter(terms))
+        if set_ids is not None:
+            queryset = queryset.filter(
+                id__in=ShortcutSets.objects.filter(shortcutset_id__in=list(set_ids)).values('shortcut_id')
+            )
+        return list(queryset.order_by('key', 'id').values_list('id', flat=True)[offset:offset + limit])
+    sql, params = search_sql(terms, set_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f"{sql} LIMIT %s OFFSET %s", [*params, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def matching_filter(query):
+    """Q for the shortcuts matching query (on a Shortcut queryset); None without terms"""
+    terms = search_terms(query)
+    if not terms:
+        return None
+    if index_table() is None:
+        return contains_filter(terms)
+    return Q(pk__in=RawSQL(*search_sql(terms, ranked=False)))
@@ -1,11 +1,15 @@
 from rest_framework import serializers
 
+from .caching import CachedValue, get_many, set_many, set_namespace
 from .models import Shortcut, ShortcutSet
 
 
 class ShortcutSetSerializer(serializers.ModelSerializer):
-    """Serializer for ShortcutSet model"""
-    shortcut_count = serializers.SerializerMethodField()
+    """
+    Serializer for ShortcutSet model.
+    Expects the queryset to be annotated with shortcut_count and to preload owner/visible_to.
+    """
+    shortcut_count = serializers.IntegerField(read_only=True)
     owner_username = serializers.SerializerMethodField()
     visible_to_usernames = serializers.SerializerMethodField()
 
@@ -13,9 +17,6 @@ class ShortcutSetSerializer(serializers.ModelSerializer):
         model = ShortcutSet
         fields = ["id", "name", "set_type", "description", "owner_username", "visible_to_usernames", "shortcut_count", "created_at"]
 
-    def get_shortcut_count(self, obj):
-        return obj.shortcuts.count()
-
     def get_owner_username(self, obj):
         """Return owner username if exists"""
         return obj.owner.username if obj.owner else None
@@ -24,9 +25,27 @@ class ShortcutSetSerializer(serializers.ModelSerializer):
         """Return list of usernames who can see this set"""
         return [u.username for u in obj.visible_to.all()]
 
+    @classmethod
+    def cached_data(cls, set_ids, load):
+        """
+        Serialized sets in set_ids order, each cached in its set's namespace (see caching.py).
+        load(missing ids) returns the sets that weren't cached, prepared as described above.
+        """
+        values = [CachedValue('set', [set_namespace(set_id)], set_id) for set_id in set_ids]
+        data = get_many(values)
+        missing = {set_id: value for set_id, value, item in zip(set_ids, values, data) if item is None}
+        if missing:
+            built = {obj.pk: dict(cls(obj).data) for obj in load(list(missing))}
+            set_many({missing[set_id]: item for set_id, item in built.items()})
+            data = [built.get(set_id) if item is None else item for set_id, item in zip(set_ids, data)]
+        return [item for item in data if item is not None]
+
 
 class ShortcutSerializer(serializers.ModelSerializer):
-    """Serializer for Shortcut model with set information"""
+    """
+    Serializer for Shortcut model with set information.
+    Expects owner and sets to be preloaded (see sync.with_sync_relations).
+    """
     set_names = serializers.SerializerMethodField()
     set_types = serializers.SerializerMethodField()
     owner_username = serializers.SerializerMethodField()
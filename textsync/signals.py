@@ -0,0 +1,246 @@
+"""
+Signal handlers that keep sync metadata in step with shortcut edits.
+
+Every change that can alter what a client downloads is written to the
+ShortcutChange log (one row per affected shortcut/set pair) and bumps the
+affected sets' versions (see ShortcutSet.bump_versions). A shortcut row lists
+the names and types of *all* its sets, so every set containing it is affected.
+
+Shortcut saves and deletes also update the full-text search index (search.py).
+
+Every bump also invalidates the sets' cache namespaces (caching.py) and schedules a
+rebuild of their bundles (bundles.py). Set changes also drop the cached per-user set
+access maps (sync.set_access), username changes the cached values showing that user,
+and token/user changes evict cached authentications (authentication.token_cache).
+"""
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .authentication import token_cache
+from .bundles import rebuilder
+from .caching import bump_namespaces, set_namespaces
+from .events import broker
+from .models import ExpiringToken, Shortcut, ShortcutChange, ShortcutSet
+from .search import index_shortcuts, unindex_shortcuts
+from .sync import invalidate_set_access, lock_change_log
+
+ShortcutSets = Shortcut.sets.through
+
+
+def memberships(shortcut_ids):
+    """
+    (shortcut_id, key, set_id) for every set membership of the given shortcuts.
+    shortcut_ids may be a list or a values() subquery.
+    """
+    return list(
+        ShortcutSets.objects.filter(shortcut_id__in=shortcut_ids)
+        .values_list('shortcut_id', 'shortcut__key', 'shortcutset_id')
+    )
+
+
+def set_members(set_id):
+    """Subquery of the shortcut ids in a set"""
+    return ShortcutSets.objects.filter(shortcutset_id=set_id).values('shortcut_id')
+
+
+def bump_sets(set_ids):
+    """Bump the versions and cache namespaces of the given sets and schedule their bundle rebuilds"""
+    set_ids = set(set_ids)
+    lock_change_log()  # Before the set row locks, like every other writer
+    ShortcutSet.bump_versions(set_ids)
+    bump_namespaces(set_namespaces(set_ids))
+    rebuilder.schedule(set_ids)
+
+
+def record_changes(rows, action='update'):
+    """Log (shortcut_id, key, set_id) rows and bump the versions of their sets"""
+    changes = [
+        ShortcutChange(shortcut_id=shortcut_id, key=key, shortcut_set_id=set_id, action=action)
+        for shortcut_id, key, set_id in rows
+    ]
+    if changes:
+        # Held until the surrounding transaction commits, so ids become visible in order
+        with transaction.atomic():
+            lock_change_log()
+            ShortcutChange.objects.bulk_create(changes)
+            bump_sets(c.shortcut_set_id for c in changes)
+        # Tell /api/events/ clients of this process right away (others see it at the next poll)
+        transaction.on_commit(broker.notify)
+
+
+@receiver(pre_save, sender=Shortcut)
+def shortcut_saving(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    lock_change_log()
+    if instance.pk is None:
+        return
+    # Clients index shortcuts by key, so a renamed shortcut must also be logged under its old key
+    old_key = Shortcut.objects.filter(pk=instance.pk).values_list('key', flat=True).first()
+    instance._old_key = old_key if old_key != instance.key else None
+
+
+@receiver(post_save, sender=Shortcut)
+def shortcut_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return  # loaddata: run rebuild_search_index afterwards
+    index_shortcuts([instance.pk])
+    rows = memberships([instance.pk])
+    old_key = getattr(instance, '_old_key', None)
+    if old_key:
+        rows += [(shortcut_id, old_key, set_id) for shortcut_id, _, set_id in rows]
+    record_changes(rows)
+
+
+@receiver(pre_delete, sender=Shortcut)
+def shortcut_deleting(sender, instance, **kwargs):
+    lock_change_log()
+    # Through rows are gone by post_delete, so remember the memberships now
+    instance._deleted_memberships = memberships([instance.pk])
+
+
+@receiver(post_delete, sender=Shortcut)
+def shortcut_deleted(sender, instance, **kwargs):
+    unindex_shortcuts([instance.pk])
+    record_changes(getattr(instance, '_deleted_memberships', ()), action='delete')
+
+
+@receiver(pre_save, sender=ShortcutSet)
+def shortcut_set_saving(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    lock_change_log()
+    if instance.pk is None:
+        return
+    # Only the name and type show up in shortcut rows; description/owner edits don't touch them
+    old = ShortcutSet.objects.filter(pk=instance.pk).values_list('name', 'set_type').first()
+    instance._rows_changed = old is not None and old != (instance.name, instance.set_type)
+
+
+@receiver(post_save, sender=ShortcutSet)
+def shortcut_set_saved(sender, instance, raw=False, **kwargs):
+    invalidate_set_access()
+    if raw:
+        return
+    if not getattr(instance, '_rows_changed', False):
+        # The serialized set (description, owner, ...) may still have changed
+        bump_namespaces(set_namespaces([instance.pk]))
+        return
+    # Name/type changes show up in every row of this set (and of sets sharing its shortcuts)
+    bump_sets([instance.pk])
+    record_changes(memberships(set_members(instance.pk)))
+
+
+@receiver(pre_delete, sender=ShortcutSet)
+def shortcut_set_deleting(sender, instance, **kwargs):
+    lock_change_log()
+    # This set's own log rows cascade away; the other sets' rows lose a set name
+    record_changes(
+        row for row in memberships(set_members(instance.pk)) if row[2] != instance.pk
+    )
+
+
+@receiver(post_delete, sender=ShortcutSet)
+def shortcut_set_deleted(sender, instance, **kwargs):
+    invalidate_set_access()
+    # Shortcut lists cached under this set's namespace are stale: drop them now, not when they expire
+    bump_namespaces(set_namespaces([instance.pk]))
+
+
+@receiver(m2m_changed, sender=ShortcutSet.visible_to.through)
+def set_visibility_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # instance is a User; remember which sets it is about to leave
+        instance._cleared_visible_sets = list(instance.visible_sets.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    invalidate_set_access()
+    # Serialized sets list the usernames they are shared with
+    if not reverse:
+        bump_namespaces(set_namespaces([instance.pk]))
+    elif action == 'post_clear':
+        bump_namespaces(set_namespaces(getattr(instance, '_cleared_visible_sets', ())))
+    else:
+        bump_namespaces(set_namespaces(pk_set or ()))
+
+
+@receiver(m2m_changed, sender=ShortcutSets)
+def shortcut_sets_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('pre_'):
+        lock_change_log()
+    if action == 'pre_clear':
+        # Remember what is about to be unlinked; the log is written on post_clear
+        if reverse:
+            rows = memberships(set_members(instance.pk))
+            instance._cleared_rows = (
+                [row for row in rows if row[2] == instance.pk],
+                [row for row in rows if row[2] != instance.pk],
+            )
+        else:
+            instance._cleared_rows = (memberships([instance.pk]), [])
+        return
+
+    if action == 'post_clear':
+        removed, updated = getattr(instance, '_cleared_rows', ([], []))
+        record_changes(removed, action='remove')
+        record_changes(updated)
+        return
+
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+
+    if reverse:
+        # instance is a ShortcutSet, pk_set holds shortcut ids
+        shortcut_ids = list(pk_set)
+        removed_set_ids = [instance.pk]
+    else:
+        # instance is a Shortcut, pk_set holds set ids
+        shortcut_ids = [instance.pk]
+        removed_set_ids = list(pk_set)
+
+    record_changes(memberships(shortcut_ids))
+
+    if action == 'post_remove':
+        keys = Shortcut.objects.filter(pk__in=shortcut_ids).values_list('id', 'key')
+        record_changes(
+            ((shortcut_id, key, set_id) for shortcut_id, key in keys for set_id in removed_set_ids),
+            action='remove',
+        )
+
+
+@receiver(post_delete, sender=ExpiringToken)
+def token_deleted(sender, instance, **kwargs):
+    # Logout, admin deletion and expired-token replacement on login
+    token_cache.invalidate(instance.key)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, raw=False, **kwargs):
+    instance._renamed = False
+    if raw or instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        return  # e.g. last_login on every admin login
+    # Password, email, is_active, groups, ... edits don't show up in any set or shortcut row
+    old = User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+    instance._renamed = old is not None and old != instance.username
+    if instance._renamed:
+        lock_change_log()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created=False, raw=False, **kwargs):
+    # Deactivation, permission changes, ... must not be served from a stale cache entry
+    token_cache.invalidate_user(instance.pk)
+
+    if not getattr(instance, '_renamed', False):
+        return
+    # Usernames show up in serialized sets (owner, shared with) and shortcut rows (owner):
+    # log the rows so delta clients get the new owner_username too
+    set_ids = ShortcutSet.objects.filter(Q(owner=instance) | Q(visible_to=instance)).values_list('id', flat=True)
+    bump_namespaces(set_namespaces(set_ids))
+    record_changes(memberships(Shortcut.objects.filter(owner=instance).values('id')))
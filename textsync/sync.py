@@ -0,0 +1,476 @@
+"""
+Sync helpers shared by the shortcuts API.
+
+Resolves which sets a user may read, builds the pre-rendered snapshot
+served by ShortcutViewSet.snapshot and computes delta sync responses from
+the ShortcutChange log.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+from itertools import groupby, islice
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import Max, Min, Prefetch, Q
+from django.utils import timezone
+
+from .caching import SETS_NAMESPACE, CachedValue, bump_namespaces
+from .models import Shortcut, ShortcutChange, ShortcutSet
+
+SNAPSHOT_FORMAT = 'v1'
+CURSOR_FORMAT = 'c1'
+PAGE_FORMAT = 'p1'
+SNAPSHOT_CACHE_TIMEOUT = 60 * 60 * 24  # Keys are content-addressed, so this only bounds memory
+CHANGE_LOG_LOCK = 0x74787463  # PostgreSQL advisory lock key of the ShortcutChange writers
+
+ShortcutSets = Shortcut.sets.through
+
+
+def accessible_sets(user):
+    """
+    Sets the user can sync from.
+    Superusers: all sets. Everyone else: general sets + their own personal sets.
+    """
+    if user.is_superuser:
+        return ShortcutSet.objects.all()
+    return ShortcutSet.objects.filter(Q(set_type='general') | Q(owner=user))
+
+
+def invalidate_set_access():
+    """Drop every user's cached set access map (a set was added, changed or deleted)"""
+    bump_namespaces([SETS_NAMESPACE])
+
+
+def set_access(user):
+    """
+    Cached {lowercase set name: set id} map of the sets the user can sync from, in ShortcutSet ordering.
+    Invalidated by the ShortcutSet / visible_to signals (see signals.py).
+    """
+    cached = CachedValue('access', [SETS_NAMESPACE], user.pk, int(user.is_superuser))
+    names = cached.get()
+    if names is None:
+        names = {name.lower(): set_id for set_id, name in accessible_sets(user).values_list('id', 'name')}
+        cached.set(names)
+    return names
+
+
+def accessible_set_ids(user):
+    """Ids of the sets the user can sync from (cached, see set_access)"""
+    return sorted(set(set_access(user).values()))
+
+
+def with_sync_relations(queryset):
+    """
+    Preload everything ShortcutSerializer reads (owner, sets),
+    so serializing any number of shortcuts costs a fixed number of queries.
+    """
+    return queryset.select_related('owner').prefetch_related(
+        Prefetch('sets', queryset=ShortcutSet.objects.only('id', 'name', 'set_type'))
+    )
+
+
+SHORTCUT_VALUES = ('id', 'key', 'value', 'html_value', 'owner__username', 'updated_at')
+
+
+def set_name_rows(shortcut_ids):
+    """(shortcut_id, set name, set type) rows in ShortcutSet ordering"""
+    return (
+        ShortcutSets.objects.filter(shortcut_id__in=shortcut_ids)
+        .order_by(*[f"shortcutset__{field}" for field in ShortcutSet._meta.ordering])
+        .values_list('shortcut_id', 'shortcutset__name', 'shortcutset__set_type')
+    )
+
+
+def shortcut_set_names(shortcut_ids):
+    """
+    {shortcut_id: ([set names], [set types])} in ShortcutSet ordering.
+    shortcut_ids may be a list or a values() subquery.
+    """
+    sets_by_shortcut = {}
+    for row in set_name_rows(shortcut_ids):
+        add_set_name(sets_by_shortcut, *row)
+    return sets_by_shortcut
+
+
+def add_set_name(sets_by_shortcut, shortcut_id, name, set_type):
+    names, types = sets_by_shortcut.setdefault(shortcut_id, ([], []))
+    names.append(name)
+    types.append(set_type)
+
+
+def build_rows(values, sets_by_shortcut):
+    """Turn SHORTCUT_VALUES tuples into shortcut_rows() dicts"""
+    # Same output as DRF's DateTimeField: ISO 8601 in the current timezone, 'Z' for UTC
+    tz = timezone.get_current_timezone()
+    no_sets = ([], [])
+    for shortcut_id, key, value, html_value, owner_username, updated_at in values:
+        if updated_at:
+            updated_at = updated_at.astimezone(tz).isoformat()
+            if updated_at.endswith('+00:00'):
+                updated_at = updated_at[:-6] + 'Z'
+        set_names, set_types = sets_by_shortcut.get(shortcut_id, no_sets)
+        yield {
+            'id': shortcut_id,
+            'key': key,
+            'value': value,
+            'html_value': html_value,
+            'owner_username': owner_username,
+            'set_names': set_names,
+            'set_types': set_types,
+            'updated_at': updated_at,
+        }
+
+
+def shortcut_rows(queryset):
+    """
+    Plain-dict equivalent of ShortcutSerializer(queryset, many=True).data for the list endpoint.
+
+    Reads columns with values_list() and all set names/types with one extra query,
+    so no model instances or serializer fields are built per row.
+    """
+    queryset = queryset.prefetch_related(None).select_related(None)
+    sets_by_shortcut = shortcut_set_names(queryset.values('id'))
+    return list(build_rows(queryset.values_list(*SHORTCUT_VALUES), sets_by_shortcut))
+
+
+async def ashortcut_rows(queryset):
+    """Async shortcut_rows(), for the async views (both queries in one sync_to_async call)"""
+    return await sync_to_async(shortcut_rows)(queryset)
+
+
+def iter_shortcut_rows(queryset, chunk_size=2000):
+    """
+    Streaming variant of shortcut_rows(): the queryset is read with .iterator(chunk_size)
+    and set names are fetched per chunk, so memory is bounded by chunk_size, not by the set size.
+    """
+    queryset = queryset.prefetch_related(None).select_related(None)
+    values = queryset.values_list(*SHORTCUT_VALUES).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(values, chunk_size)):
+        yield from build_rows(chunk, shortcut_set_names([row[0] for row in chunk]))
+
+
+async def achunks(iterator, chunk_size=2000):
+    """
+    Lists of up to chunk_size items of a sync iterator that reads the database, e.g.
+    iter_shortcut_rows() or iter_resolved() of it, each read in one sync_to_async call.
+    QuerySet.aiterator() can't be used here: for values_list() it runs the query in the event loop.
+    """
+    while chunk := await sync_to_async(lambda: list(islice(iterator, chunk_size)))():
+        yield chunk
+
+
+def iter_resolved(rows):
+    """
+    Streaming variant of resolved_map() for rows ordered by key:
+    yields one {key, value, html_value, id} entry per key.
+    """
+    for key, group in groupby(rows, key=itemgetter('key')):
+        yield resolved_entry(key, group)
+
+
+def resolved_entry(key, rows):
+    row = resolve_priority(rows)[key]
+    return {'key': key, 'value': row['value'], 'html_value': row['html_value'], 'id': row['id']}
+
+
+async def akeyset_page(queryset, limit, after=None):
+    """
+    One page of a queryset ordered by (key, id), seeking past `after` = (key, id) of the
+    previous page's last row instead of using OFFSET, so every page costs the same.
+
+    A page never splits a key (it's extended to the key's last row), so resolving
+    personal-over-general priority per page gives the same result as on the whole list.
+    Returns (page queryset, (key, id) to continue after or None on the last page).
+    """
+    if after is not None:
+        key, shortcut_id = after
+        queryset = queryset.filter(Q(key__gt=key) | Q(key=key, id__gt=shortcut_id))
+
+    positions = [row async for row in queryset.values_list('key', 'id')[:limit + 1]]
+    has_next = len(positions) > limit
+    positions = positions[:limit]
+    if has_next and positions:
+        last_key, last_id = positions[-1]
+        rest = [row async for row in queryset.filter(key=last_key, id__gt=last_id).values_list('key', 'id')]
+        if rest:
+            positions += rest
+            has_next = await queryset.filter(key__gt=last_key).aexists()
+
+    page = queryset.filter(id__in=[shortcut_id for _, shortcut_id in positions])
+    return page, positions[-1] if has_next else None
+
+
+SHORTCUT_COLUMNS = ['id', 'key', 'value', 'html_value', 'owner', 'sets', 'updated_at']
+
+
+def columnar_rows(rows):
+    """
+    Dictionary-encoded variant of shortcut_rows() output for ?layout=columnar.
+    Owners and sets are listed once; each row is an array referencing them by index:
+
+    { "columns": ["id", "key", "value", "html_value", "owner", "sets", "updated_at"],
+      "owners": ["cosmin"], "sets": [["Birou", "general"], ...],
+      "rows": [[12, "b", "Buna ziua", null, 0, [0, 2], "2025-10-30T16:03:00Z"], ...] }
+    """
+    owners, owner_index = [], {}
+    sets, set_index = [], {}
+    encoded = []
+    for row in rows:
+        owner = row['owner_username']
+        if owner is not None and owner not in owner_index:
+            owner_index[owner] = len(owners)
+            owners.append(owner)
+
+        row_sets = []
+        for name, set_type in zip(row['set_names'], row['set_types']):
+            if name not in set_index:
+                set_index[name] = len(sets)
+                sets.append([name, set_type])
+            row_sets.append(set_index[name])
+
+        encoded.append([
+            row['id'], row['key'], row['value'], row['html_value'],
+            owner_index.get(owner), row_sets, row['updated_at'],
+        ])
+    return {'columns': SHORTCUT_COLUMNS, 'owners': owners, 'sets': sets, 'rows': encoded}
+
+
+def render_json(data):
+    """
+    JSON bytes byte-identical to DRF's JSONRenderer output
+    (compact separators, unicode, U+2028/U+2029 escaped).
+    """
+    body = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    return body.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def requested_set_ids(user, sets_param):
+    """
+    Resolve a ?sets=birou,cosmin parameter (case-insensitive) to set ids.
+
+    Without a parameter, all accessible sets are returned.
+    Returns None if any requested set doesn't exist or isn't accessible to the user.
+    """
+    names = set_access(user)
+    if not sets_param:
+        return sorted(set(names.values()))
+
+    set_ids = set()
+    for name in sets_param.split(','):
+        set_id = names.get(name.strip().lower())
+        if set_id is None:
+            return None
+        set_ids.add(set_id)
+    return sorted(set_ids)
+
+
+def snapshot_etag(sets):
+    """Strong ETag derived from the (id, version) of every set in the snapshot"""
+    parts = ','.join(f"{s.id}:{s.version}" for s in sorted(sets, key=lambda s: s.id))
+    digest = hashlib.sha1(f"{SNAPSHOT_FORMAT}|{parts}".encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def resolve_priority(rows):
+    """
+    Pick one row per key from shortcut_rows() output (ordered by key, id).
+    Same rule the extension used: personal sets take priority over general sets,
+    otherwise the first row wins.
+    """
+    resolved = {}
+    for row in rows:
+        existing = resolved.get(row['key'])
+        if existing is None or ('personal' in row['set_types'] and 'personal' not in existing['set_types']):
+            resolved[row['key']] = row
+    return resolved
+
+
+def resolved_map(rows):
+    """Compact {key: {value, html_value, id}} map of the winning rows"""
+    return {
+        key: {'value': row['value'], 'html_value': row['html_value'], 'id': row['id']}
+        for key, row in resolve_priority(rows).items()
+    }
+
+
+def set_rows(set_ids):
+    """shortcut_rows() of every shortcut in any of the sets, ordered by (key, id)"""
+    return shortcut_rows(Shortcut.objects.filter(sets__in=set_ids).distinct().order_by('key', 'id'))
+
+
+def resolve_shortcuts(rows):
+    """Build the snapshot {key: shortcut} map from the rows of its sets"""
+    return {
+        key: {
+            'value': row['value'],
+            'html_value': row['html_value'],
+            'id': row['id'],
+            'sets': row['set_names'],
+            'is_personal': 'personal' in row['set_types'],
+        }
+        for key, row in resolve_priority(rows).items()
+    }
+
+
+def get_snapshot(sets, etag, load_rows=set_rows):
+    """
+    Return the rendered JSON snapshot for the given sets, from cache when possible.
+    load_rows(set ids) returns their rows like set_rows() (the views use bundles.bundle_rows).
+    """
+    # The ETag already covers every set's version, so the entry needs no namespaces
+    cached = CachedValue('snapshot', (), etag.strip('"'), timeout=SNAPSHOT_CACHE_TIMEOUT)
+    body = cached.get()
+    if body is None:
+        data = {
+            'sets': sorted(s.name for s in sets),
+            'shortcuts': resolve_shortcuts(load_rows([s.id for s in sets])) if sets else {},
+        }
+        body = render_json(data)
+        cached.set(body)
+    return body
+
+
+def lock_change_log():
+    """
+    Make the current transaction the only ShortcutChange writer until it ends.
+
+    Cursors are log ids, so a change must never commit after a higher id is visible.
+    PostgreSQL hands out ids when rows are inserted, not when they commit: without the
+    lock a client could read cursor N+1 while id N is still in flight and skip it for good.
+    Writers take the lock before touching shortcut rows (see signals) so that they
+    queue up here instead of deadlocking on each other's row locks.
+    SQLite runs one write transaction at a time anyway; outside a transaction there is
+    nothing to hold the lock for.
+    """
+    if connection.vendor == 'postgresql' and connection.in_atomic_block:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CHANGE_LOG_LOCK])
+
+
+def current_cursor():
+    """Id of the latest ShortcutChange (0 if the log is empty); every lower id is committed (lock_change_log)"""
+    return ShortcutChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+async def acurrent_cursor():
+    """Async current_cursor()"""
+    return await ShortcutChange.objects.order_by('-id').values_list('id', flat=True).afirst() or 0
+
+
+def log_bounds():
+    """
+    (horizon, cursor): current_cursor() and the oldest cursor delta sync can still serve.
+    prune_changes deletes the oldest part of the log (never the latest entry), so every
+    change after the id before the oldest remaining entry is still logged.
+    """
+    bounds = ShortcutChange.objects.aggregate(oldest=Min('id'), latest=Max('id'))
+    return (bounds['oldest'] or 1) - 1, bounds['latest'] or 0
+
+
+async def alog_bounds():
+    """Async log_bounds()"""
+    bounds = await ShortcutChange.objects.aaggregate(oldest=Min('id'), latest=Max('id'))
+    return (bounds['oldest'] or 1) - 1, bounds['latest'] or 0
+
+
+def prune_point(before):
+    """Id of the newest change log entry prune_changes(before) deletes, or None"""
+    return (
+        ShortcutChange.objects.filter(created_at__lt=before, id__lt=current_cursor())
+        .order_by('-id').values_list('id', flat=True).first()
+    )
+
+
+def prune_changes(before, batch_size=10000):
+    """
+    Delete the change log entries created before `before`, oldest first. The log stays
+    a contiguous range (everything up to the newest pruned id goes) and keeps its latest
+    entry, which is the current cursor. Returns (entries deleted, new horizon).
+    """
+    last_id = prune_point(before)
+    deleted = 0
+    while last_id is not None:
+        ids = list(ShortcutChange.objects.filter(id__lte=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += ShortcutChange.objects.filter(id__in=ids).delete()[0]
+    return deleted, log_bounds()[0]
+
+
+class CursorExpired(ValueError):
+    """A cursor older than the pruned part of the change log: the client must do a full sync"""
+
+
+def encode_cursor(cursor):
+    """Opaque cursor token handed to clients"""
+    return base64.urlsafe_b64encode(f"{CURSOR_FORMAT}:{cursor}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, horizon=0):
+    """
+    Inverse of encode_cursor(). Raises ValueError for anything we didn't issue and
+    CursorExpired for cursors before horizon (see log_bounds).
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {token!r}")
+
+    prefix, _, cursor = raw.partition(':')
+    if prefix != CURSOR_FORMAT or not cursor.isdigit():
+        raise ValueError(f"Invalid cursor: {token!r}")
+    if int(cursor) < horizon:
+        raise CursorExpired(f"Cursor {token!r} is older than the change log")
+    return int(cursor)
+
+
+def encode_page_token(cursor, position):
+    """
+    Opaque ?after= token for the next keyset page. It carries the sync cursor read
+    for the first page, so every page of one listing reports the same X-Sync-Cursor.
+    """
+    key, shortcut_id = position
+    raw = f"{PAGE_FORMAT}:{cursor}:{shortcut_id}:{key}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_page_token(token):
+    """Inverse of encode_page_token(): (cursor, (key, id)). Raises ValueError for anything we didn't issue."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError(f"Invalid page token: {token!r}")
+
+    parts = raw.split(':', 3)
+    if len(parts) != 4 or parts[0] != PAGE_FORMAT or not (parts[1].isdigit() and parts[2].isdigit()):
+        raise ValueError(f"Invalid page token: {token!r}")
+    return int(parts[1]), (parts[3], int(parts[2]))
+
+
+def changes_since(set_ids, since, cursor):
+    """
+    Delta between cursors `since` (exclusive) and `cursor` (inclusive) for the given set ids.
+
+    Returns (upserts, deleted_ids):
+    - upserts: shortcut_rows() with the current state of every changed shortcut still in
+      one of the sets, plus every shortcut sharing a changed key (so the personal-over-general
+      priority for that key can be re-applied)
+    - deleted_ids: changed shortcut ids that are no longer in any of the sets
+    """
+    changes = ShortcutChange.objects.filter(shortcut_set__in=set_ids, id__gt=since, id__lte=cursor).order_by()
+    changed_ids = set(changes.values_list('shortcut_id', flat=True))
+    if not changed_ids:
+        return [], []
+
+    upserts = shortcut_rows(
+        Shortcut.objects.filter(sets__in=set_ids)
+        .filter(Q(id__in=changes.values('shortcut_id')) | Q(key__in=changes.values('key')))
+        .distinct()
+        .order_by('key', 'id')
+    )
+    present = {row['id'] for row in upserts}
+    return upserts, sorted(changed_ids - present)
@@ -1,3 +1,1777 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+from contextlib import ExitStack, nullcontext
+from datetime import timedelta
+from io import StringIO
+from itertools import product
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth.models import Permission, User
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core import serializers
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.utils import ConnectionHandler
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from unittest import mock, skipUnless
+
+from rest_framework import permissions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from config.asgi import application as asgi_application
+
+from . import bundles, middleware, search, sync
+from .authentication import TokenCache, token_cache
+from .events import ChangeBroker, TooManyConnections, broker
+from .formats import iter_json_array, read_shortcuts
+from .importer import import_shortcuts
+from .metrics import MetricsRegistry
+from .models import ExpiringToken, Shortcut, ShortcutChange, ShortcutSet, ShortcutSetBundle
+from .serializers import ShortcutSerializer
+from .sync import current_cursor, encode_cursor, render_json, set_rows, shortcut_rows, with_sync_relations
+from .throttling import LoginRateThrottle, SlidingWindowRateThrottle, UserSlidingWindowThrottle
+from .views import ShortcutSetViewSet, ShortcutViewSet, VerifyTokenView
+
+
+class SyncQueryCountTests(TestCase):
+    """The sync endpoints must run a fixed number of queries, however many rows they return"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('cosmin', password='secret')
+        self.sharer = User.objects.create_user('aura', password='secret')
+        token = ExpiringToken.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def add_sets(self, count):
+        for _ in range(count):
+            shortcut_set = ShortcutSet.objects.create(
+                name=f'set{ShortcutSet.objects.count()}', set_type='general', owner=self.sharer
+            )
+            shortcut_set.visible_to.add(self.user, self.sharer)
+            self.add_shortcuts(shortcut_set, 2)
+
+    def add_shortcuts(self, shortcut_set, count):
+        for _ in range(count):
+            shortcut = Shortcut.objects.create(
+                key=f'k{Shortcut.objects.count()}', value='text', owner=self.sharer
+            )
+            shortcut.sets.add(shortcut_set)
+
+    def count_queries(self, url, **headers):
+        self.client.get(url, **headers)  # Warm the token cache
+        cache.clear()  # Measure the response being built, not served from the cache
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_shortcut_list_query_count_is_constant(self):
+        birou = ShortcutSet.objects.create(name='Birou', set_type='general', owner=self.sharer)
+        personal = ShortcutSet.objects.create(name='cosmin', set_type='personal', owner=self.user)
+        self.add_shortcuts(birou, 3)
+        self.add_shortcuts(personal, 1)
+        small_queries, small = self.count_queries('/api/shortcuts/?sets=birou,cosmin')
+
+        self.add_shortcuts(birou, 30)
+        self.add_shortcuts(personal, 10)
+        big_queries, big = self.count_queries('/api/shortcuts/?sets=birou,cosmin')
+
+        self.assertEqual(len(small), 4)
+        self.assertEqual(len(big), 44)
+        self.assertEqual(small_queries, big_queries)
+
+    def test_serialized_shortcut_list_query_count_is_constant(self):
+        """Lists that skip the cache and bundles: the serializer and paged row paths"""
+        birou = ShortcutSet.objects.create(name='Birou', set_type='general', owner=self.sharer)
+        self.add_shortcuts(birou, 3)
+        indented = {'HTTP_ACCEPT': 'application/json; indent=2'}
+        small_queries, small = self.count_queries('/api/shortcuts/?sets=birou', **indented)
+        small_page_queries, _ = self.count_queries('/api/shortcuts/?sets=birou&limit=100')
+
+        self.add_shortcuts(birou, 30)
+        ShortcutSetBundle.objects.all().delete()
+        with mock.patch('textsync.views.bundle_json') as bundle_json:
+            big_queries, big = self.count_queries('/api/shortcuts/?sets=birou', **indented)
+            big_page_queries, page = self.count_queries('/api/shortcuts/?sets=birou&limit=100')
+        bundle_json.assert_not_called()
+
+        self.assertEqual(len(small), 3)
+        self.assertEqual(len(big), 33)
+        self.assertEqual(len(page['results']), 33)
+        self.assertEqual(small_queries, big_queries)
+        self.assertEqual(small_page_queries, big_page_queries)
+        self.assertFalse(ShortcutSetBundle.objects.exists())
+
+    def test_set_list_query_count_is_constant(self):
+        self.add_sets(2)
+        small_queries, small = self.count_queries('/api/sets/')
+
+        self.add_sets(20)
+        big_queries, big = self.count_queries('/api/sets/')
+
+        self.assertEqual(len(small), 2)
+        self.assertEqual(len(big), 22)
+        self.assertEqual(big[0]['shortcut_count'], 2)
+        self.assertEqual(sorted(big[0]['visible_to_usernames']), ['aura', 'cosmin'])
+        self.assertEqual(small_queries, big_queries)
+
+
+class FastPathTests(TestCase):
+    """The values()-based rows must render to exactly the bytes of ShortcutSerializer + JSONRenderer"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('cosmin', password='secret')
+        token = ExpiringToken.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        birou = ShortcutSet.objects.create(name='Birou', set_type='general', owner=self.user)
+        personal = ShortcutSet.objects.create(name='cosmin', set_type='personal', owner=self.user)
+        shared = Shortcut.objects.create(key='adr', value='Strada Ştefan cel Mare', owner=self.user)
+        shared.sets.add(personal, birou)
+        Shortcut.objects.create(
+            key='html', value='Bună ziua\n\u2028"citat"', html_value='<b>Bună</b> ziua'
+        ).sets.add(birou)
+        Shortcut.objects.create(key='emoji', value='Mulțumesc 🙏', html_value='').sets.add(personal)
+        # Whole seconds: DRF leaves out the fraction, like isoformat()
+        Shortcut.objects.filter(key='emoji').update(updated_at=timezone.now().replace(microsecond=0))
+
+    def serializer_bytes(self):
+        queryset = with_sync_relations(Shortcut.objects.order_by('key', 'id'))
+        return JSONRenderer().render(ShortcutSerializer(queryset, many=True).data)
+
+    def test_rows_render_like_the_serializer(self):
+        expected = self.serializer_bytes()
+        self.assertIn(b'\\u2028', expected)
+        self.assertEqual(render_json(shortcut_rows(Shortcut.objects.order_by('key', 'id'))), expected)
+
+    def test_list_responses_are_byte_identical(self):
+        expected = self.serializer_bytes()
+        # Bundled and cached, then straight from the database
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/shortcuts/?sets=birou,cosmin').content, expected)
+        self.assertEqual(self.client.get('/api/shortcuts/?sets=birou,cosmin&updated_after=2000-01-01').content, expected)
+
+
+class SyncCacheTests(TestCase):
+    """Cached sync reads are served without queries and invalidated by every kind of write"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cosmin', password='secret')
+        token = ExpiringToken.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.birou = ShortcutSet.objects.create(name='Birou', set_type='general', owner=self.user)
+        self.shortcut = Shortcut.objects.create(key='b', value='Buna ziua', owner=self.user)
+        self.shortcut.sets.add(self.birou)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cached_list_runs_no_queries(self):
+        for url in ('/api/shortcuts/?sets=birou', '/api/shortcuts/?sets=birou&resolved=1', '/api/sets/'):
+            first = self.get(url)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get(url), first)
+
+    def test_writes_invalidate_cached_lists(self):
+        self.get('/api/shortcuts/?sets=birou&resolved=1')
+        self.get('/api/sets/')
+
+        self.shortcut.value = 'Buna'
+        self.shortcut.save()
+        self.assertEqual(self.get('/api/shortcuts/?sets=birou&resolved=1')['b']['value'], 'Buna')
+
+        other = Shortcut.objects.create(key='m', value='Multumesc')
+        other.sets.add(self.birou)
+        self.assertIn('m', self.get('/api/shortcuts/?sets=birou&resolved=1'))
+        self.assertEqual(self.get('/api/sets/')[0]['shortcut_count'], 2)
+
+        self.birou.shortcuts.remove(other)
+        self.assertNotIn('m', self.get('/api/shortcuts/?sets=birou&resolved=1'))
+
+        self.birou.name = 'Office'
+        self.birou.save()
+        self.assertEqual(self.get('/api/shortcuts/?sets=office')[0]['set_names'], ['Office'])
+
+        aura = User.objects.create_user('aura', password='secret')
+        self.birou.visible_to.add(aura)
+        self.assertEqual(self.get('/api/sets/')[0]['visible_to_usernames'], ['aura'])
+
+        self.user.username = 'cosmin2'
+        self.user.save()
+        self.assertEqual(self.get('/api/sets/')[0]['owner_username'], 'cosmin2')
+        self.assertEqual(self.get('/api/shortcuts/?sets=office')[0]['owner_username'], 'cosmin2')
+
+    def test_user_edits_without_a_rename_keep_set_versions(self):
+        version = ShortcutSet.objects.get(pk=self.birou.pk).version
+        self.user.email = 'cosmin@example.com'
+        self.user.set_password('other')
+        self.user.save()
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertEqual(ShortcutSet.objects.get(pk=self.birou.pk).version, version)
+
+        since = encode_cursor(current_cursor())
+        self.user.username = 'cosmin2'
+        self.user.is_active = True
+        self.user.save()
+        self.assertGreater(ShortcutSet.objects.get(pk=self.birou.pk).version, version)
+        delta = self.get(f'/api/shortcuts/delta/?sets=birou&since={since}')
+        self.assertEqual([row['owner_username'] for row in delta['upserts']], ['cosmin2'])
+
+
+class BundleTests(TestCase):
+    """Per-set bundles merge to the same rows as the database and are rebuilt once per change"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user('cosmin', password='secret')
+        with self.captureOnCommitCallbacks(execute=True):  # "Commit", building the bundles
+            self.birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+            self.personal = ShortcutSet.objects.create(name='cosmin', set_type='personal', owner=self.owner)
+            for key in ('b', 'm', 'sal'):
+                Shortcut.objects.create(key=key, value=f'{key} birou', owner=self.owner).sets.add(self.birou)
+            shared = Shortcut.objects.create(key='adr', value='Strada 1')
+            shared.sets.add(self.birou, self.personal)
+            Shortcut.objects.create(key='b', value='b personal').sets.add(self.personal)
+
+    def test_merged_bundles_match_the_database(self):
+        set_ids = [self.birou.id, self.personal.id]
+        self.assertEqual(bundles.bundle_rows(set_ids), set_rows(set_ids))
+        self.assertEqual(bundles.bundle_json([self.birou.id]), render_json(set_rows([self.birou.id])))
+
+        # Stored bundles are reused until their set changes
+        expected = set_rows(set_ids)
+        with self.assertNumQueries(2 if connection.vendor == 'postgresql' else 1):  # + key order on PostgreSQL
+            self.assertEqual(bundles.bundle_rows(set_ids), expected)
+        Shortcut.objects.get(key='sal').delete()
+        self.assertEqual(bundles.bundle_rows(set_ids), set_rows(set_ids))
+
+    def test_a_transaction_rebuilds_each_set_once(self):
+        with mock.patch.object(bundles, 'build_bundle', wraps=bundles.build_bundle) as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                for shortcut in Shortcut.objects.filter(sets=self.birou):
+                    shortcut.value += '!'
+                    shortcut.save()
+        self.assertEqual(sorted(call.args[0] for call in build.call_args_list), [self.birou.id, self.personal.id])
+
+        bundle = ShortcutSetBundle.objects.get(shortcut_set=self.birou)
+        self.assertEqual(bundle.version, ShortcutSet.objects.get(pk=self.birou.pk).version)
+        self.assertEqual(bundles.rows_of(bundle), set_rows([self.birou.id]))
+
+    def test_reads_never_write(self):
+        set_ids = [self.birou.id, self.personal.id]
+        Shortcut.objects.filter(key='sal').update(value='Salut')  # Outside Django's signals
+        ShortcutSet.bump_versions(set_ids)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(bundles.bundle_rows(set_ids), set_rows(set_ids))
+            self.assertEqual(bundles.bundle_json([self.birou.id]), render_json(set_rows([self.birou.id])))
+        self.assertFalse([q for q in queries if not q['sql'].lstrip().upper().startswith('SELECT')])
+        self.assertEqual(ShortcutSetBundle.objects.filter(version=F('shortcut_set__version')).count(), 0)
+
+        call_command('rebuild_bundles', stdout=StringIO())
+        expected = render_json(set_rows([self.birou.id]))
+        with self.assertNumQueries(1):
+            self.assertEqual(bundles.bundle_json([self.birou.id]), expected)
+
+    def test_a_failed_rebuild_falls_back_to_the_database(self):
+        with mock.patch.object(bundles, 'build_bundle', side_effect=RuntimeError), \
+                self.assertLogs('textsync.bundles', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            Shortcut.objects.filter(key='sal').get().delete()
+        self.assertEqual(bundles.bundle_rows([self.birou.id]), set_rows([self.birou.id]))
+
+    def test_merged_keys_follow_the_database_collation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, key in enumerate(('Zi', 'ana', 'Ana', 'ăla', 'zi', '_x', 'B2')):
+                Shortcut.objects.create(key=key, value=str(i)).sets.add((self.birou, self.personal)[i % 2])
+        set_ids = [self.birou.id, self.personal.id]
+        self.assertEqual(bundles.bundle_rows(set_ids), set_rows(set_ids))
+
+    def test_changes_after_a_rolled_back_savepoint_are_rebuilt(self):
+        with mock.patch.object(bundles, 'build_bundle', wraps=bundles.build_bundle) as build:
+            with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        Shortcut.objects.filter(key='m').get().save()
+                        raise ValueError
+                except ValueError:
+                    pass
+                Shortcut.objects.get(key='b', sets=self.personal).save()
+        self.assertEqual([call.args[0] for call in build.call_args_list], [self.personal.id])
+
+
+class SnapshotTests(TestCase):
+    """The snapshot ETag changes with the content of its sets, and a matching If-None-Match gets a 304"""
+
+    url = '/api/shortcuts/snapshot/?sets=birou,cosmin'
+
+    def setUp(self):
+        self.user = User.objects.create_user('cosmin', password='secret')
+        token = ExpiringToken.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+        self.personal = ShortcutSet.objects.create(name='cosmin', set_type='personal', owner=self.user)
+        for i in range(10):
+            Shortcut.objects.create(key=f'k{i}', value=f'Text birou {i}').sets.add(self.birou)
+        self.override = Shortcut.objects.create(key='k1', value='Text personal', owner=self.user)
+        self.override.sets.add(self.personal)
+
+    def test_unchanged_snapshot_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['sets'], ['Birou', 'cosmin'])
+        self.assertEqual(response.json()['shortcuts']['k1']['value'], 'Text personal')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        # Only the set versions are read
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other", ' + etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_unknown_or_inaccessible_set_is_rejected(self):
+        ShortcutSet.objects.create(name='aura', set_type='personal', owner=User.objects.create_user('aura'))
+        for sets in ('birou,nu-exista', 'birou,aura'):
+            response = self.client.get(f'/api/shortcuts/snapshot/?sets={sets}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'Unknown set.'})
+            self.assertNotIn('ETag', response)
+
+    def test_edits_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.override.value = 'Text nou'
+        self.override.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['shortcuts']['k1']['value'], 'Text nou')
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        self.override.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['shortcuts']['k1']['value'], 'Text birou 1')
+        etag = response['ETag']
+
+        # Set names are part of the snapshot
+        self.birou.name = 'Office'
+        self.birou.save()
+        response = self.client.get('/api/shortcuts/snapshot/?sets=office,cosmin', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['shortcuts']['k0']['sets'], ['Office'])
+
+        # Another set selection is another snapshot
+        self.assertNotEqual(self.client.get('/api/shortcuts/snapshot/?sets=cosmin')['ETag'], response['ETag'])
+
+    def test_weak_etag_of_compressed_snapshot_matches(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 304)
+
+
+class CompressionTests(TestCase):
+    """Sync payloads are compressed when the client accepts it; auth responses never are"""
+
+    url = '/api/shortcuts/?sets=birou'
+
+    def setUp(self):
+        user = User.objects.create_user('cosmin', password='secret')
+        token = ExpiringToken.objects.create(user=user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+        for i in range(20):
+            Shortcut.objects.create(key=f'k{i}', value=f'Text birou {i}').sets.add(birou)
+
+    def test_gzip(self):
+        plain = self.client.get(self.url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['X-Sync-Cursor'], plain['X-Sync-Cursor'])
+
+    @skipUnless(middleware.brotli, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(middleware.brotli.decompress(response.content), plain.content)
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_refused_encodings_are_not_used(self):
+        for header in ('gzip;q=0', 'identity', 'deflate'):
+            self.assertFalse(self.client.get(self.url, HTTP_ACCEPT_ENCODING=header).has_header('Content-Encoding'))
+
+    def test_streamed_ndjson(self):
+        plain = b''.join(self.client.get(self.url, HTTP_ACCEPT='application/x-ndjson').streaming_content)
+        response = self.client.get(self.url, HTTP_ACCEPT='application/x-ndjson', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(body, plain)
+        self.assertEqual(len(body.splitlines()), 20)
+
+    def test_only_sync_paths_are_compressed(self):
+        compress = middleware.SyncCompressionMiddleware(lambda request: HttpResponse(b'{"token":"%s"}' % (b'x' * 500)))
+        factory = RequestFactory()
+        for path in ('/api/auth/login/', '/api/auth/verify/', '/admin/'):
+            response = compress(factory.get(path, HTTP_ACCEPT_ENCODING='gzip'))
+            self.assertFalse(response.has_header('Content-Encoding'), path)
+        response = compress(factory.get('/api/sets/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        # Too small to be worth it
+        compress = middleware.SyncCompressionMiddleware(lambda request: HttpResponse(b'[]'))
+        self.assertFalse(compress(factory.get('/api/sets/', HTTP_ACCEPT_ENCODING='gzip')).has_header('Content-Encoding'))
+
+
+class TokenCacheTests(TestCase):
+    """Cached token lookups must stop working as soon as the token or its user is revoked"""
+
+    url = '/api/auth/verify/'
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user('cosmin', password='secret')
+        self.token = ExpiringToken.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def status(self):
+        return self.client.get(self.url).status_code
+
+    def test_cached_lookups_skip_the_database(self):
+        self.assertEqual(self.status(), 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.status(), 200)
+
+    def test_logout(self):
+        self.assertEqual(self.status(), 200)
+        self.assertEqual(self.client.post('/api/auth/logout/').status_code, 200)
+        self.assertEqual(self.status(), 401)
+
+    def test_token_deleted_in_the_admin(self):
+        self.assertEqual(self.status(), 200)
+        ExpiringToken.objects.filter(user=self.user).delete()  # What the admin delete action runs
+        self.assertEqual(self.status(), 401)
+
+    def test_user_deactivated(self):
+        self.assertEqual(self.status(), 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.status(), 401)
+
+    def test_entries_expire_after_the_ttl_and_with_the_token(self):
+        cached = TokenCache(ttl=60)
+        now = timezone.now().timestamp()
+        cached.set(ExpiringToken.objects.select_related('user').get())
+        with mock.patch('textsync.authentication.time.time', return_value=now + 59):
+            self.assertIsNotNone(cached.get(self.token.key))
+        with mock.patch('textsync.authentication.time.time', return_value=now + 61):
+            self.assertIsNone(cached.get(self.token.key))
+
+        # A token expiring before the ttl is over isn't served from the cache after expires_at
+        ExpiringToken.objects.update(expires_at=timezone.now() + timedelta(seconds=10))
+        self.assertEqual(self.status(), 200)
+        later = timezone.now() + timedelta(seconds=11)
+        with mock.patch('textsync.authentication.time.time', return_value=later.timestamp()), \
+                mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertEqual(self.status(), 401)
+
+    def test_other_workers_see_revocations_in_a_shared_cache(self):
+        other_user = User.objects.create_user('aura', password='secret')
+        other_token = ExpiringToken.objects.create(user=other_user)
+        with mock.patch('textsync.authentication.is_shared', return_value=True):
+            worker = TokenCache()  # Another process's cache, which the signals don't reach
+            for token in ExpiringToken.objects.select_related('user'):
+                worker.set(token)
+            self.assertIsNotNone(worker.get(self.token.key))
+            self.assertIsNotNone(worker.get(other_token.key))
+
+            self.token.delete()
+            self.assertIsNone(worker.get(self.token.key))
+            self.assertIsNotNone(worker.get(other_token.key))
+
+            other_user.is_active = False
+            other_user.save()
+            self.assertIsNone(worker.get(other_token.key))
+
+
+class ThrottleTests(TestCase):
+    """Sliding-window counters: the previous window counts for the part still inside the last minute"""
+
+    def throttle_caches(self, tmp):
+        return {
+            'locmem': {**settings.CACHES, 'throttle': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            'file': {**settings.CACHES, 'throttle': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmp,
+            }},
+        }
+
+    def make_throttle(self, clock):
+        throttle = SlidingWindowRateThrottle.__new__(SlidingWindowRateThrottle)
+        throttle.rate = '3/minute'
+        throttle.num_requests, throttle.duration = throttle.parse_rate(throttle.rate)
+        throttle.cache = caches['throttle']
+        throttle.cache.clear()
+        throttle.wait_seconds = None
+        throttle.timer = lambda: clock[0]
+        return throttle
+
+    def hits(self, throttle, clock, at, count=1):
+        clock[0] = at
+        return [throttle.hit('client') for _ in range(count)]
+
+    def test_window_slides(self):
+        start = 60 * 1000
+        with tempfile.TemporaryDirectory() as tmp:
+            for backend, caches_setting in self.throttle_caches(tmp).items():
+                with self.subTest(backend), override_settings(CACHES=caches_setting):
+                    clock = [start]
+                    throttle = self.make_throttle(clock)
+                    self.assertEqual(self.hits(throttle, clock, start, 4), [True, True, True, False])
+                    self.assertFalse(self.hits(throttle, clock, start + 59)[0])
+                    # Half of the previous window (3 requests) still counts: 1.5 + 1 < 3, 1.5 + 2 >= 3
+                    self.assertEqual(self.hits(throttle, clock, start + 90, 3), [True, True, False])
+                    # Two windows later only the last window's 2 requests count, weighted by 1/2 at +150
+                    self.assertEqual(self.hits(throttle, clock, start + 150, 3), [True, True, False])
+                    self.assertEqual(self.hits(throttle, clock, start + 240, 4), [True, True, True, False])
+
+    @override_settings(CACHES={**settings.CACHES, 'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_retry_after_is_when_the_next_request_is_allowed(self):
+        start = 60 * 1000
+        clock = [start]
+        throttle = self.make_throttle(clock)
+        self.hits(throttle, clock, start, 3)
+
+        # Full current window: wait for the next one (and the previous count to slide out a bit)
+        self.assertFalse(self.hits(throttle, clock, start + 30)[0])
+        self.assertEqual(throttle.wait(), 31)
+        self.assertFalse(self.hits(throttle, clock, start + 60)[0])
+        self.assertTrue(self.hits(throttle, clock, start + 61)[0])
+
+        # Current window under the limit: wait until enough of the previous one has slid out
+        self.assertTrue(self.hits(throttle, clock, start + 90)[0])
+        self.assertFalse(self.hits(throttle, clock, start + 90)[0])
+        wait = throttle.wait()
+        self.assertEqual(wait, 11)
+        self.assertFalse(self.hits(throttle, clock, start + 90 + wait - 1)[0])
+        self.assertTrue(self.hits(throttle, clock, start + 90 + wait)[0])
+
+    @override_settings(CACHES={**settings.CACHES, 'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_login_throttled_per_ip_and_per_username(self):
+        caches['throttle'].clear()
+        client = APIClient()
+        with mock.patch.dict(LoginRateThrottle.THROTTLE_RATES, {'login': '2/minute'}):
+            for _ in range(2):
+                response = client.post('/api/auth/login/', {'username': 'ana', 'password': 'x'}, REMOTE_ADDR='10.0.0.1')
+                self.assertEqual(response.status_code, 401)
+
+            response = client.post('/api/auth/login/', {'username': 'ana', 'password': 'x'}, REMOTE_ADDR='10.0.0.1')
+            self.assertEqual(response.status_code, 429)
+            self.assertTrue(1 <= int(response['Retry-After']) <= 61)
+
+            # Same username from another address, another username from the same address
+            response = client.post('/api/auth/login/', {'username': 'ana', 'password': 'x'}, REMOTE_ADDR='10.0.0.2')
+            self.assertEqual(response.status_code, 429)
+            response = client.post('/api/auth/login/', {'username': 'ion', 'password': 'x'}, REMOTE_ADDR='10.0.0.1')
+            self.assertEqual(response.status_code, 429)
+            response = client.post('/api/auth/login/', {'username': 'ion', 'password': 'x'}, REMOTE_ADDR='10.0.0.2')
+            self.assertEqual(response.status_code, 401)
+
+
+class SqliteTuningTests(TestCase):
+    """SQLITE_TUNING connections get the configured pragmas, and sqlite_maintenance runs on them"""
+
+    def tuned_connection(self, tmp):
+        # A handler of its own: the test database may be in memory or PostgreSQL
+        handler = ConnectionHandler({'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(tmp, 'db.sqlite3'),
+            'OPTIONS': settings.SQLITE_OPTIONS,
+        }})
+        tuned = handler['default']
+        self.addCleanup(tuned.close)
+        return tuned
+
+    def test_new_connections_are_tuned(self):
+        pragmas = settings.SQLITE_PRAGMAS
+        with tempfile.TemporaryDirectory() as tmp:
+            tuned = self.tuned_connection(tmp)
+            with tuned.cursor() as cursor:
+                values = {
+                    name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'temp_store')
+                }
+            tuned.close()
+        self.assertEqual(values, {
+            'journal_mode': pragmas['journal_mode'].lower(),
+            'synchronous': {'OFF': 0, 'NORMAL': 1, 'FULL': 2}[pragmas['synchronous']],
+            'busy_timeout': pragmas['busy_timeout'],
+            'cache_size': pragmas['cache_size'],
+            'temp_store': 2,  # MEMORY
+        })
+        self.assertEqual(tuned.transaction_mode, 'IMMEDIATE')
+
+    def test_maintenance_checkpoints_the_wal(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tuned = self.tuned_connection(tmp)
+            with tuned.cursor() as cursor:
+                cursor.execute('CREATE TABLE t (x TEXT)')
+                cursor.executemany('INSERT INTO t VALUES (%s)', [('x' * 100,)] * 1000)
+            wal = os.path.join(tmp, 'db.sqlite3-wal')
+            self.assertGreater(os.path.getsize(wal), 0)
+
+            with mock.patch('textsync.management.commands.sqlite_maintenance.connection', tuned):
+                for args in ([], ['--full-analyze', '--checkpoint', 'truncate']):
+                    out = StringIO()
+                    call_command('sqlite_maintenance', *args, stdout=out)
+                    self.assertIn('journal_mode=wal', out.getvalue())
+                    self.assertIn('✅ Checkpoint', out.getvalue())
+            self.assertIn('ANALYZE done', out.getvalue())
+            self.assertEqual(os.path.getsize(wal), 0)
+            tuned.close()
+
+    def test_maintenance_on_the_test_database(self):
+        out = StringIO()
+        if connection.vendor != 'sqlite':
+            with self.assertRaisesMessage(CommandError, 'not SQLite'):
+                call_command('sqlite_maintenance', stdout=out)
+            return
+        call_command('sqlite_maintenance', stdout=out)
+        self.assertIn('PRAGMA optimize done', out.getvalue())
+
+
+class MetricsTests(TestCase):
+    """Per-view request metrics in the Prometheus text format"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='secret', is_staff=True)
+        token = ExpiringToken.objects.create(user=self.admin)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+        Shortcut.objects.create(key='adr', value='Strada 1').sets.add(birou)
+
+    def scrape(self):
+        """{series: value} of /api/metrics/"""
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        series = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                series[name] = float(value)
+        return series
+
+    def test_requests_are_recorded_per_view(self):
+        view = 'view="ShortcutViewSet.list"'
+        before = self.scrape()
+        self.client.get('/api/shortcuts/?sets=birou&layout=columnar')
+        APIClient().get('/api/shortcuts/?sets=birou')
+        after = self.scrape()
+
+        def delta(name):
+            return after.get(name, 0) - before.get(name, 0)
+
+        self.assertEqual(delta(f'textsync_requests_total{{status="200",{view}}}'), 1)
+        self.assertEqual(delta(f'textsync_requests_total{{status="401",{view}}}'), 1)
+        self.assertEqual(delta(f'textsync_request_duration_seconds_count{{{view}}}'), 2)
+        self.assertEqual(delta(f'textsync_db_queries_bucket{{{view},le="+Inf"}}'), 2)
+        self.assertEqual(delta(f'textsync_phase_duration_seconds_count{{phase="serialize",{view}}}'), 1)
+        self.assertEqual(delta(f'textsync_response_bytes_count{{{view}}}'), 2)
+        self.assertGreater(delta(f'textsync_db_queries_sum{{{view}}}'), 0)
+
+    def test_staff_only(self):
+        user = User.objects.create_user('cosmin', password='secret')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {ExpiringToken.objects.create(user=user).key}')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('textsync.metrics', 'WARNING') as logs:
+            self.client.get('/api/sets/')
+        self.assertIn('Slow request: GET /api/sets/ view=ShortcutSetViewSet.list status=200', logs.output[0])
+
+    def test_histograms_and_labels(self):
+        registry = MetricsRegistry()
+        registry.record('a"b\\c', 200, 0.02, 3, 0.001, {'serialize': 0.01}, 300)
+        registry.record('a"b\\c', 200, 7.0, 3, 0.001, {}, None)
+        lines = registry.render().splitlines()
+        label = 'view="a\\"b\\\\c"'
+        self.assertIn(f'textsync_requests_total{{status="200",{label}}} 2', lines)
+        # Buckets are cumulative
+        self.assertIn(f'textsync_request_duration_seconds_bucket{{{label},le="0.01"}} 0', lines)
+        self.assertIn(f'textsync_request_duration_seconds_bucket{{{label},le="0.025"}} 1', lines)
+        self.assertIn(f'textsync_request_duration_seconds_bucket{{{label},le="10.0"}} 2', lines)
+        self.assertIn(f'textsync_request_duration_seconds_bucket{{{label},le="+Inf"}} 2', lines)
+        self.assertIn(f'textsync_request_duration_seconds_sum{{{label}}} 7.02', lines)
+        self.assertIn(f'textsync_db_queries_bucket{{{label},le="3"}} 2', lines)
+        # Streamed responses (size None) have no size observation
+        self.assertIn(f'textsync_response_bytes_count{{{label}}} 1', lines)
+        self.assertIn('# TYPE textsync_phase_duration_seconds histogram', lines)
+
+
+class LargeListTests(TestCase):
+    """Keyset pages and NDJSON streams return the same rows as the whole list"""
+
+    url = '/api/shortcuts/?sets=birou,cosmin'
+
+    def setUp(self):
+        self.user = User.objects.create_user('cosmin', password='secret')
+        self.token = ExpiringToken.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+        personal = ShortcutSet.objects.create(name='cosmin', set_type='personal', owner=self.user)
+        for i in range(7):
+            Shortcut.objects.create(key=f'k{i}', value=f'Text birou {i}').sets.add(birou)
+        # Three rows of k3 and two of k5, so pages and stream chunks can end inside a key
+        for key in ('k3', 'k3', 'k5'):
+            Shortcut.objects.create(key=key, value=f'{key} personal', owner=self.user).sets.add(personal)
+
+    def pages(self, url):
+        """(rows of each page, cursors reported), following the next links"""
+        pages, cursors = [], set()
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            cursors.add(response['X-Sync-Cursor'])
+            pages.append(response.json()['results'])
+            url = response.json()['next']
+        return pages, cursors
+
+    def test_pages_cover_the_list_without_splitting_keys(self):
+        whole = self.client.get(self.url).json()
+        pages, cursors = self.pages(self.url + '&limit=3')
+        self.assertEqual([row for page in pages for row in page], whole)
+        self.assertEqual(len(cursors), 1)
+        for page, next_page in zip(pages, pages[1:]):
+            self.assertNotEqual(page[-1]['key'], next_page[0]['key'])
+
+        resolved = self.client.get(self.url + '&resolved=1').json()
+        pages, _ = self.pages(self.url + '&resolved=1&limit=2')
+        merged = {key: entry for page in pages for key, entry in page.items()}
+        self.assertEqual(merged, resolved)
+        self.assertEqual(merged['k3']['value'], 'k3 personal')
+
+    def test_later_pages_keep_the_first_cursor(self):
+        first = self.client.get(self.url + '&limit=4')
+        Shortcut.objects.filter(key='k6').get().save()
+        second = self.client.get(first.json()['next'])
+        self.assertEqual(second['X-Sync-Cursor'], first['X-Sync-Cursor'])
+        self.assertNotEqual(self.client.get(self.url)['X-Sync-Cursor'], first['X-Sync-Cursor'])
+
+    @override_settings(SHORTCUT_PAGE_MAX_SIZE=2)
+    def test_page_size_is_capped(self):
+        pages, _ = self.pages(self.url + '&limit=1000')
+        self.assertEqual([len(page) for page in pages], [2, 4, 3, 1])
+        self.assertEqual(self.client.get(self.url + '&after=bm90LWEtdG9rZW4').status_code, 400)
+
+    @override_settings(SHORTCUT_STREAM_CHUNK_SIZE=2)
+    def test_ndjson_stream(self):
+        whole = self.client.get(self.url).json()
+        response = self.client.get(self.url, HTTP_ACCEPT='application/x-ndjson')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        body = b''.join(response.streaming_content)
+        self.assertEqual([json.loads(line) for line in body.splitlines()], whole)
+        self.assertEqual(response['X-Sync-Cursor'], self.client.get(self.url)['X-Sync-Cursor'])
+
+        resolved = self.client.get(self.url + '&resolved=1').json()
+        body = b''.join(self.client.get(self.url + '&resolved=1&format=ndjson').streaming_content)
+        entries = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual({entry.pop('key'): entry for entry in entries}, resolved)
+
+    @override_settings(SHORTCUT_STREAM_CHUNK_SIZE=2)
+    async def test_ndjson_stream_under_asgi(self):
+        headers = {'Authorization': f'Token {self.token.key}', 'Accept': 'application/x-ndjson'}
+        response = await self.async_client.get(self.url + '&resolved=1', headers=headers)
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        keys = [json.loads(line)['key'] for line in body.splitlines()]
+        self.assertEqual(keys, [f'k{i}' for i in range(7)])
+
+
+class ImportTests(TestCase):
+    """Bulk imports upsert by key within the set and log their changes like regular edits"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('cosmin', password='secret')
+        self.birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+        self.other = ShortcutSet.objects.create(name='Alt', set_type='general')
+
+    def contents(self, shortcut_set):
+        return dict(shortcut_set.shortcuts.values_list('key', 'value'))
+
+    def test_round_trip(self):
+        items = [{'key': f'k{i}', 'value': f'Text {i}'} for i in range(5)]
+        counts = import_shortcuts(self.birou, items, owner=self.user, batch_size=2)
+        self.assertEqual(counts, {'created': 5, 'updated': 0, 'unchanged': 0, 'removed': 0})
+        self.assertEqual(self.contents(self.birou), {f'k{i}': f'Text {i}' for i in range(5)})
+        self.assertEqual(set(Shortcut.objects.values_list('owner__username', flat=True)), {'cosmin'})
+
+        # Importing the same items again changes nothing and logs nothing
+        since, version = current_cursor(), ShortcutSet.objects.get(pk=self.birou.pk).version
+        counts = import_shortcuts(self.birou, items, batch_size=2)
+        self.assertEqual(counts, {'created': 0, 'updated': 0, 'unchanged': 5, 'removed': 0})
+        self.assertEqual(current_cursor(), since)
+        self.assertEqual(ShortcutSet.objects.get(pk=self.birou.pk).version, version)
+
+        items[1] = {'key': 'k1', 'value': 'Text nou', 'html_value': '<b>Text nou</b>'}
+        counts = import_shortcuts(self.birou, items + [{'key': 'k9', 'value': 'Nou'}], batch_size=2)
+        self.assertEqual(counts, {'created': 1, 'updated': 1, 'unchanged': 4, 'removed': 0})
+        self.assertEqual(
+            set(ShortcutChange.objects.filter(id__gt=since).values_list('key', flat=True)), {'k1', 'k9'}
+        )
+        self.assertGreater(ShortcutSet.objects.get(pk=self.birou.pk).version, version)
+        self.assertEqual(Shortcut.objects.get(key='k1').html_value, '<b>Text nou</b>')
+
+    def test_repeated_keys_keep_the_last_item(self):
+        counts = import_shortcuts(self.birou, [{'key': 'a', 'value': '1'}, {'key': ' a ', 'value': '2'}])
+        self.assertEqual(counts['created'], 1)
+        self.assertEqual(self.contents(self.birou), {'a': '2'})
+
+    def test_prune(self):
+        import_shortcuts(self.birou, [{'key': key, 'value': key} for key in ('a', 'b', 'c')])
+        shared = Shortcut.objects.get(key='c')
+        shared.sets.add(self.other)
+        since = current_cursor()
+
+        counts = import_shortcuts(self.birou, [{'key': 'a', 'value': 'a'}], prune=True)
+        self.assertEqual(counts, {'created': 0, 'updated': 0, 'unchanged': 1, 'removed': 2})
+        self.assertEqual(self.contents(self.birou), {'a': 'a'})
+        # Shortcuts still in another set are only unlinked
+        self.assertFalse(Shortcut.objects.filter(key='b').exists())
+        self.assertEqual(self.contents(self.other), {'c': 'c'})
+        removed = ShortcutChange.objects.filter(id__gt=since, shortcut_set=self.birou)
+        self.assertEqual(set(removed.values_list('key', 'action')), {('b', 'remove'), ('c', 'remove')})
+
+    def test_invalid_items_roll_the_import_back(self):
+        since = current_cursor()
+        for item in ({'key': ''}, {'key': 'x' * 1000}, {'key': 'a', 'content_type': 'pdf'}):
+            with self.assertRaises(ValueError):
+                import_shortcuts(self.birou, [{'key': 'ok', 'value': 'ok'}, item], batch_size=1)
+        self.assertFalse(Shortcut.objects.exists())
+        self.assertEqual(current_cursor(), since)
+
+
+class FormatTests(TestCase):
+    """Import/export file formats, read incrementally"""
+
+    def read(self, fmt, text, **kwargs):
+        return list(read_shortcuts(StringIO(text), fmt, **kwargs))
+
+    def test_json(self):
+        text = json.dumps([
+            {'key': 'a', 'value': 'x, ] "} [', 'html_value': None},
+            {'model': 'textsync.shortcut', 'pk': 3, 'fields': {'key': 'b', 'value': 'Ştefan', 'owner': 1}},
+            {'model': 'textsync.shortcutset', 'pk': 1, 'fields': {'name': 'Birou'}},
+        ], ensure_ascii=False)
+        expected = [{'key': 'a', 'value': 'x, ] "} [', 'html_value': None}, {'key': 'b', 'value': 'Ştefan'}]
+        self.assertEqual(self.read('json', text), expected)
+        # Elements split across read chunks
+        self.assertEqual(len(list(iter_json_array(StringIO(text), chunk_size=3))), 3)
+        self.assertEqual(self.read('json', ' [ ] '), [])
+        for bad in ('{"key": "a"}', '[{"key": "a"} {"key": "b"}]', '[{"key": "a"'):
+            with self.assertRaises(ValueError):
+                self.read('json', bad)
+
+    def test_ndjson(self):
+        text = '{"key": "a", "value": "1"}\n\n{"key": "b", "value": "2", "extra": true}\n'
+        self.assertEqual(self.read('ndjson', text), [{'key': 'a', 'value': '1'}, {'key': 'b', 'value': '2'}])
+        with self.assertRaisesMessage(ValueError, 'line 2'):
+            self.read('ndjson', '{"key": "a"}\n{"key":\n')
+
+    def test_csv(self):
+        text = 'key,value,html_value,content_type\na,"Strada 1, et. 2\nBucureşti",,\nb,B,<b>B</b>,html\n'
+        self.assertEqual(self.read('csv', text), [
+            {'key': 'a', 'value': 'Strada 1, et. 2\nBucureşti', 'html_value': ''},
+            {'key': 'b', 'value': 'B', 'html_value': '<b>B</b>', 'content_type': 'html'},
+        ])
+        self.assertEqual(self.read('csv', 'key,value\na,1\n'), [{'key': 'a', 'value': '1'}])
+        with self.assertRaises(ValueError):
+            self.read('csv', 'name,value\na,1\n')
+
+    def test_espanso(self):
+        text = """
+global_vars:
+  - name: data
+    type: date
+matches:
+  - trigger: ":adr"
+    replace: "Strada 1"
+  - triggers: [":sal", ":buna"]
+    html: "<b>Bună</b> ziua"
+  - trigger: ":form"
+    form: "Hello [[name]]"
+  - trigger: ":nr"
+    replace: 42
+"""
+        self.assertEqual(self.read('espanso', text, trigger_prefix=':'), [
+            {'key': 'adr', 'value': 'Strada 1', 'html_value': None, 'content_type': 'text'},
+            {'key': 'sal', 'value': 'Bună ziua', 'html_value': '<b>Bună</b> ziua', 'content_type': 'html'},
+            {'key': 'buna', 'value': 'Bună ziua', 'html_value': '<b>Bună</b> ziua', 'content_type': 'html'},
+            {'key': 'nr', 'value': '42', 'html_value': None, 'content_type': 'text'},
+        ])
+        self.assertEqual(self.read('espanso', ''), [])
+        for bad in ('- a\n- b\n', 'matches:\n  - trigger: [\n'):
+            with self.assertRaises(ValueError):
+                self.read('espanso', bad)
+
+    def test_export_import_round_trip(self):
+        birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+        Shortcut.objects.create(key='adr', value='Strada 1, et. 2\n"Bucureşti"').sets.add(birou)
+        Shortcut.objects.create(
+            key='sal', value='Bună ziua', html_value='<b>Bună</b> ziua', content_type='html'
+        ).sets.add(birou)
+        expected = dict(birou.shortcuts.values_list('key', 'value'))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for extension in ('json', 'ndjson', 'csv', 'yml'):
+                path = os.path.join(tmp, f'birou.{extension}')
+                call_command('shortcuts_export', 'birou', path, '--trigger-prefix=:', stdout=StringIO())
+                out = StringIO()
+                call_command(
+                    'shortcuts_import', f'copie-{extension}', path, '--create-set=general',
+                    '--trigger-prefix=:', stdout=out,
+                )
+                self.assertIn('2 new', out.getvalue())
+                copy = ShortcutSet.objects.get(name=f'copie-{extension}')
+                self.assertEqual(dict(copy.shortcuts.values_list('key', 'value')), expected, extension)
+                self.assertEqual(copy.shortcuts.get(key='sal').html_value, '<b>Bună</b> ziua')
+
+            # A dry run or a bad file changes nothing
+            path = os.path.join(tmp, 'birou.json')
+            call_command('shortcuts_import', 'nou', path, '--create-set=general', '--dry-run', stdout=StringIO())
+            self.assertFalse(ShortcutSet.objects.filter(name='nou').exists())
+            with open(path, 'r+') as f:
+                f.truncate(len(f.read()) // 2)
+            with self.assertRaises(CommandError):
+                call_command('shortcuts_import', 'birou', path, '--prune', stdout=StringIO())
+            self.assertEqual(dict(birou.shortcuts.values_list('key', 'value')), expected)
+
+
+class FixCommandTests(TestCase):
+    """fix_shortcut_sets and fix_owners write in bulk but keep the sync metadata in step"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        token = ExpiringToken.objects.create(user=self.admin)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command(*args, stdout=out)
+        return out.getvalue()
+
+    def test_fix_shortcut_sets(self):
+        linked = Shortcut.objects.create(key='adr', value='Strada 1')
+        linked.sets.add(self.birou)
+        for i in range(5):
+            Shortcut.objects.create(key=f'k{i}', value=f'Text {i}')
+        since = encode_cursor(current_cursor())
+
+        self.assertIn('Would link 5 shortcuts', self.run_command('fix_shortcut_sets', '--dry-run'))
+        self.assertIn("Set 'Office' not found", self.run_command('fix_shortcut_sets', '--set-name=Office'))
+        self.assertEqual(self.birou.shortcuts.count(), 1)
+
+        output = self.run_command('fix_shortcut_sets', '--batch-size=2')
+        self.assertIn('Successfully linked 5 shortcuts', output)
+        self.assertIn('Total shortcuts in Birou: 6', output)
+        self.assertFalse(Shortcut.objects.filter(sets=None).exists())
+        self.assertIn('already linked', self.run_command('fix_shortcut_sets'))
+
+        response = self.client.get(f'/api/shortcuts/delta/?sets=birou&since={since}')
+        self.assertEqual(sorted(row['key'] for row in response.json()['upserts']), [f'k{i}' for i in range(5)])
+
+    def test_fix_owners(self):
+        Shortcut.objects.create(key='adr', value='Strada 1').sets.add(self.birou)
+        # Cache both lists before the fix
+        self.assertIsNone(self.client.get('/api/sets/').json()[0]['owner_username'])
+        self.assertIsNone(self.client.get('/api/shortcuts/?sets=birou').json()[0]['owner_username'])
+
+        since = encode_cursor(current_cursor())
+
+        self.assertIn("User 'nobody' not found", self.run_command('fix_owners', '--owner=nobody'))
+        self.assertIn('Would update 1 Shortcut(s)', self.run_command('fix_owners', '--dry-run'))
+        self.assertFalse(Shortcut.objects.filter(owner__isnull=False).exists())
+
+        output = self.run_command('fix_owners')
+        self.assertIn('Updated 1 ShortcutSet(s)', output)
+        self.assertIn('Updated 1 Shortcut(s)', output)
+        self.assertEqual(self.client.get('/api/sets/').json()[0]['owner_username'], 'admin')
+        self.assertEqual(self.client.get('/api/shortcuts/?sets=birou').json()[0]['owner_username'], 'admin')
+        delta = self.client.get(f'/api/shortcuts/delta/?sets=birou&since={since}').json()
+        self.assertEqual([row['owner_username'] for row in delta['upserts']], ['admin'])
+        self.assertIn('All Shortcuts have owners', self.run_command('fix_owners'))
+
+
+class AdminChangelistTests(TestCase):
+    """Admin changelists read counts, set badges and sharing from annotations, not per-row queries"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.staff = User.objects.create_user('cosmin', password='secret', is_staff=True)
+        self.staff.user_permissions.set(Permission.objects.filter(codename__in=['view_shortcut', 'view_shortcutset']))
+        self.other = User.objects.create_user('aura', password='secret')
+        self.birou = ShortcutSet.objects.create(name='Birou', set_type='general', owner=self.admin)
+        self.birou.visible_to.add(self.staff, self.other)
+        self.personal = ShortcutSet.objects.create(name='cosmin', set_type='personal', owner=self.staff)
+
+    def add_shortcuts(self, count, owner=None):
+        for _ in range(count):
+            shortcut = Shortcut.objects.create(key=f'k{Shortcut.objects.count():03}', value='text', owner=owner)
+            shortcut.sets.add(self.birou, self.personal)
+
+    def changelist(self, url, user=None):
+        self.client.force_login(user or self.admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def count_queries(self, url):
+        self.changelist(url)
+        cache.clear()  # The set filter choices are cached
+        with CaptureQueriesContext(connection) as ctx:
+            self.changelist(url)
+        return len(ctx.captured_queries)
+
+    def test_query_counts_are_constant(self):
+        self.add_shortcuts(2)
+        small = [self.count_queries(url) for url in ('/admin/textsync/shortcut/', '/admin/textsync/shortcutset/')]
+        self.add_shortcuts(30, owner=self.staff)
+        for i in range(10):
+            ShortcutSet.objects.create(name=f'set{i}', owner=self.staff).visible_to.add(self.other)
+        big = [self.count_queries(url) for url in ('/admin/textsync/shortcut/', '/admin/textsync/shortcutset/')]
+        self.assertEqual(small, big)
+
+    def test_shortcut_rows(self):
+        self.add_shortcuts(1, owner=self.staff)
+        Shortcut.objects.create(key='fara', value='No sets')
+        response = self.changelist('/admin/textsync/shortcut/')
+        self.assertContains(response, '🏢 Birou</span><span', html=False)
+        self.assertContains(response, '👤 cosmin')
+        self.assertContains(response, 'No sets')
+
+        # Staff see their own shortcuts only; the filter lists their sets
+        response = self.changelist('/admin/textsync/shortcut/', self.staff)
+        self.assertEqual([row.key for row in response.context['cl'].result_list], ['k000'])
+        filter_choices = [choice['display'] for spec in response.context['cl'].filter_specs
+                          if spec.title == 'Shortcut Set' for choice in spec.choices(response.context['cl'])]
+        self.assertEqual(filter_choices, ['All', 'Birou (General (Birou))', 'cosmin (Personal (Utilizator))'])
+        response = self.changelist(f'/admin/textsync/shortcut/?set={self.personal.pk}', self.staff)
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_set_rows(self):
+        self.add_shortcuts(3)
+        response = self.changelist('/admin/textsync/shortcutset/')
+        rows = {s.name: s for s in response.context['cl'].result_list}
+        self.assertEqual(rows['Birou'].shortcut_count, 3)
+        self.assertContains(response, 'aura, cosmin')
+
+        # Shared and own sets once each, with counts not multiplied by the sharing join
+        response = self.changelist('/admin/textsync/shortcutset/', self.staff)
+        rows = [(s.name, s.shortcut_count) for s in response.context['cl'].result_list]
+        self.assertEqual(sorted(rows), [('Birou', 3), ('cosmin', 3)])
+
+
+class SearchTests(TestCase):
+    """Shortcut search: the full-text index when the database has one, icontains otherwise"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+        self.contabilitate = ShortcutSet.objects.create(name='Contabilitate', set_type='general')
+        self.shortcuts = {}
+        for key, value, shortcut_set in (
+            ('adresa', 'Strada Lunga 1', self.birou),
+            ('firma', 'Adresa firmei: Strada Scurta 2', self.birou),
+            ('iban', 'RO49 AAAA 1B31', self.contabilitate),
+        ):
+            self.shortcuts[key] = Shortcut.objects.create(key=key, value=value)
+            self.shortcuts[key].sets.add(shortcut_set)
+
+    def ids(self, *keys):
+        return [self.shortcuts[key].id for key in keys]
+
+    def admin_search(self, query):
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/textsync/shortcut/', {'q': query})
+        return sorted(shortcut.key for shortcut in response.context['cl'].result_list)
+
+    def test_index(self):
+        if search.index_table() is None:
+            self.skipTest('no search index on this database (migration 0010)')
+        # Prefixes of every term; keys rank first
+        self.assertEqual(search.search_ids('adr'), self.ids('adresa', 'firma'))
+        self.assertEqual(search.search_ids('adr scurta'), self.ids('firma'))
+        self.assertEqual(search.search_ids('strada', [self.contabilitate.id]), [])
+        self.assertEqual(search.search_ids('AND OR "'), [])
+        self.assertEqual(search.search_ids('adr', limit=1, offset=1), self.ids('firma'))
+
+        # Saves and deletes keep the index current
+        self.shortcuts['iban'].value = 'Cont: RO49 AAAA'
+        self.shortcuts['iban'].save()
+        self.assertEqual(search.search_ids('cont'), self.ids('iban'))
+        self.shortcuts['firma'].delete()
+        self.assertEqual(search.search_ids('scurta'), [])
+
+        # Shortcut ids are 64-bit
+        big = Shortcut.objects.create(id=2 ** 31 + 5, key='mare', value='Id mare')
+        self.assertEqual(search.search_ids('mare'), [big.id])
+
+        # loaddata (raw saves) leaves indexing to rebuild_search_index
+        data = serializers.serialize('json', [Shortcut(id=999, key='fixture', value='Din fixture', updated_at=timezone.now())])
+        for obj in serializers.deserialize('json', data):
+            obj.save()
+        self.assertEqual(search.search_ids('fixture'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(search.search_ids('fixture'), [999])
+
+        self.assertEqual(self.admin_search('strada'), ['adresa'])
+        self.assertEqual(self.admin_search('contab'), ['iban'])  # Part of a set name
+
+    def test_unknown_set_is_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/shortcuts/search/', {'q': 'strada', 'sets': 'birou'})
+        self.assertEqual(sorted(row['key'] for row in response.json()['results']), ['adresa', 'firma'])
+        response = client.get('/api/shortcuts/search/', {'q': 'strada', 'sets': 'birou,nu-exista'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Unknown set.'})
+
+    def test_without_index(self):
+        with mock.patch('textsync.search.index_table', return_value=None):
+            with self.assertNumQueries(0):
+                search.index_shortcuts(self.ids('adresa'))
+                search.unindex_shortcuts(self.ids('adresa'))
+            # Substrings instead of prefixes, ordered by key
+            self.assertEqual(search.search_ids('TRADA'), self.ids('adresa', 'firma'))
+            self.assertEqual(search.search_ids('adr scurta'), self.ids('firma'))
+            self.assertEqual(search.search_ids('strada', [self.contabilitate.id]), [])
+            self.assertEqual(search.search_ids('strada', limit=1, offset=1), self.ids('firma'))
+            self.assertEqual(self.admin_search('lunga'), ['adresa'])
+            self.assertEqual(self.admin_search('contab'), ['iban'])
+            with self.assertRaises(CommandError):
+                call_command('rebuild_search_index', stdout=StringIO())
+
+    def test_api(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {ExpiringToken.objects.create(user=self.admin).key}')
+        self.assertEqual(client.get('/api/shortcuts/search/?q=%20').status_code, 400)
+        with mock.patch('textsync.search.index_table', return_value=None):
+            response = client.get('/api/shortcuts/search/?q=strada&sets=birou&limit=1')
+        self.assertEqual([row['key'] for row in response.json()['results']], ['adresa'])
+        self.assertIn('offset=1', response.json()['next'])
+
+
+class AsyncViewTests(TestCase):
+    """The async views (AsyncAPIViewMixin.adispatch) fail like the sync ones: 401/403, 404 and 429"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('cosmin', password='secret')
+        self.headers = {'Authorization': f'Token {ExpiringToken.objects.create(user=self.user).key}'}
+        self.birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+        self.shortcut = Shortcut.objects.create(key='adr', value='Strada 1')
+        self.shortcut.sets.add(self.birou)
+        other = User.objects.create_user('aura', password='secret')
+        self.hidden = ShortcutSet.objects.create(name='aura', set_type='personal', owner=other)
+        self.async_urls = ['/api/sets/', f'/api/sets/{self.birou.id}/', '/api/shortcuts/', '/api/auth/verify/']
+        self.sync_url = f'/api/shortcuts/{self.shortcut.id}/'
+        caches['throttle'].clear()
+
+    def assertSameResponse(self, response, expected, status):
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(response.json(), expected.json())
+        for header in ('WWW-Authenticate', 'Retry-After'):
+            self.assertEqual(response.headers.get(header), expected.headers.get(header))
+
+    def test_routes_are_async(self):
+        for url in self.async_urls:
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func), url)
+        self.assertFalse(asyncio.iscoroutinefunction(resolve(self.sync_url).func))
+
+    async def test_authentication_errors(self):
+        for headers in ({}, {'Authorization': 'Token nope'}):
+            expected = await self.async_client.get(self.sync_url, headers=headers)
+            self.assertEqual(expected.status_code, 401)
+            for url in self.async_urls:
+                with self.subTest(url, headers=headers):
+                    self.assertSameResponse(await self.async_client.get(url, headers=headers), expected, 401)
+
+    async def test_permission_denied(self):
+        denied = [permissions.IsAdminUser]
+        with mock.patch.object(ShortcutSetViewSet, 'permission_classes', denied), \
+                mock.patch.object(ShortcutViewSet, 'permission_classes', denied), \
+                mock.patch.object(VerifyTokenView, 'permission_classes', denied):
+            expected = await self.async_client.get(self.sync_url, headers=self.headers)
+            self.assertEqual(expected.status_code, 403)
+            for url in self.async_urls:
+                with self.subTest(url):
+                    self.assertSameResponse(await self.async_client.get(url, headers=self.headers), expected, 403)
+
+    async def test_missing_objects(self):
+        expected = await self.async_client.get('/api/shortcuts/0/', headers=self.headers)
+        self.assertEqual(expected.json(), {'detail': 'No Shortcut matches the given query.'})
+        for set_id in (0, self.hidden.id, 'abc'):
+            with self.subTest(set_id):
+                response = await self.async_client.get(f'/api/sets/{set_id}/', headers=self.headers)
+                self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(f'/api/sets/{self.hidden.id}/', headers=self.headers)
+        self.assertEqual(response.json(), {'detail': 'No ShortcutSet matches the given query.'})
+
+    async def test_throttled(self):
+        with mock.patch.dict(UserSlidingWindowThrottle.THROTTLE_RATES, {'user': f'{len(self.async_urls)}/minute'}):
+            for url in self.async_urls:
+                self.assertEqual((await self.async_client.get(url, headers=self.headers)).status_code, 200, url)
+            expected = await self.async_client.get(self.sync_url, headers=self.headers)
+            self.assertEqual(expected.status_code, 429)
+            self.assertGreater(int(expected.headers['Retry-After']), 0)
+            for url in self.async_urls:
+                with self.subTest(url):
+                    self.assertSameResponse(await self.async_client.get(url, headers=self.headers), expected, 429)
+
+
+class EventsTests(TransactionTestCase):
+    """/api/events/ reports changes of the requested sets right after they commit"""
+
+    def setUp(self):
+        user = User.objects.create_user('cosmin', password='secret')
+        self.token = ExpiringToken.objects.create(user=user)
+        self.headers = {'Authorization': f'Token {self.token.key}'}
+        self.birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+        self.alt = ShortcutSet.objects.create(name='Alt', set_type='general')
+        self.shortcut = Shortcut.objects.create(key='adr', value='Strada 1')
+        self.shortcut.sets.add(self.birou)
+        self.other = Shortcut.objects.create(key='x', value='Alt set')
+        self.other.sets.add(self.alt)
+
+    def url(self, since=None, sets='birou'):
+        since = encode_cursor(current_cursor()) if since is None else since
+        return f'/api/events/?sets={sets}&since={since}'
+
+    def edit(self, shortcut):
+        shortcut.value += '!'
+        shortcut.save()
+        return encode_cursor(current_cursor())
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url()).status_code, 401)
+        self.client.defaults['HTTP_AUTHORIZATION'] = self.headers['Authorization']
+        self.assertEqual(self.client.get(self.url(sets='nope')).status_code, 400)
+        for since in ('garbage', encode_cursor(current_cursor() + 10)):
+            response = self.client.get(self.url(since))
+            self.assertEqual(response.status_code, 400)
+            self.assertTrue(response.json()['resync'])
+
+        old = self.url()
+        self.edit(self.shortcut)
+        self.edit(self.shortcut)
+        ShortcutChange.objects.filter(id__lt=current_cursor()).delete()  # What prune_changes does
+        response = self.client.get(old)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['resync'])
+
+    @override_settings(EVENTS_LONGPOLL_TIMEOUT=0.2)
+    def test_long_poll(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = self.headers['Authorization']
+        since = self.url()
+        self.edit(self.other)
+        self.assertEqual(self.client.get(since).status_code, 204)
+
+        # Changes committed before the request are reported at once
+        cursor = self.edit(self.shortcut)
+        response = self.client.get(since)
+        self.assertEqual(response.json(), {'cursor': cursor, 'sets': ['birou']})
+        self.assertEqual(self.client.get(self.url(sets='birou,alt')).status_code, 204)
+
+    async def waiting_threads(self, application, clients=5):
+        """Threads started while `clients` long-polls wait in the ASGI application"""
+        since = await sync_to_async(self.url)()
+        path, query = since.split('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'client': ('127.0.0.1', 1000), 'server': ('testserver', 80),
+            'headers': [(b'host', b'testserver'), (b'authorization', self.headers['Authorization'].encode())],
+        }
+        threads = threading.active_count()
+        communicators = [ApplicationCommunicator(application, scope) for _ in range(clients)]
+        for communicator in communicators:
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+        await asyncio.sleep(0.5)
+        started = threading.active_count() - threads
+        for communicator in communicators:
+            self.assertEqual((await communicator.receive_output(5))['status'], 204)
+            await communicator.wait(5)
+        return started
+
+    @override_settings(EVENTS_LONGPOLL_TIMEOUT=1)
+    async def test_waiting_clients_hold_no_thread(self):
+        self.assertGreaterEqual(await self.waiting_threads(ASGIHandler()), 5)  # Django's own handler
+        self.assertEqual(await self.waiting_threads(asgi_application), 0)
+
+    async def test_long_poll_wakes_up_on_commit(self):
+        url = await sync_to_async(self.url)()
+        # A poll interval far beyond the test: only the commit notification can wake the broker
+        with mock.patch.object(broker, 'poll_interval', 60):
+            request = asyncio.ensure_future(self.async_client.get(url, headers=self.headers))
+            await asyncio.sleep(0.3)
+            await sync_to_async(self.edit)(self.other)
+            await asyncio.sleep(0.3)
+            self.assertFalse(request.done())
+            cursor = await sync_to_async(self.edit)(self.shortcut)
+            response = await asyncio.wait_for(request, 5)
+        self.assertEqual(response.json(), {'cursor': cursor, 'sets': ['birou']})
+
+    @override_settings(EVENTS_HEARTBEAT=0.1, EVENTS_STREAM_TIMEOUT=0.5)
+    async def test_event_stream(self):
+        url = await sync_to_async(self.url)()
+        cursor = await sync_to_async(self.edit)(self.shortcut)
+        headers = {**self.headers, 'Accept': 'text/event-stream'}
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = body.split('\n\n')
+        self.assertEqual(events[0], 'retry: 5000')
+        self.assertEqual(
+            events[1], f'id: {cursor}\nevent: changed\ndata: {{"cursor":"{cursor}","sets":["birou"]}}'
+        )
+        self.assertIn(': ping', events[2:])
+
+        # Reconnecting with Last-Event-ID picks up where the stream left off
+        headers['Last-Event-ID'] = cursor
+        response = await self.async_client.get('/api/events/?sets=birou', headers=headers)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertNotIn('event: changed', body)
+
+    @override_settings(CACHES={**settings.CACHES, 'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_throttled_like_the_api(self):
+        caches['throttle'].clear()
+        self.client.defaults['HTTP_AUTHORIZATION'] = self.headers['Authorization']
+        with mock.patch.dict(UserSlidingWindowThrottle.THROTTLE_RATES, {'user': '2/minute'}):
+            self.assertEqual(self.client.get(self.url(sets='nope')).status_code, 400)
+            self.assertEqual(self.client.get('/api/sets/').status_code, 200)  # Same budget
+            response = self.client.get(self.url(sets='nope'))
+            self.assertEqual(response.status_code, 429)
+            self.assertTrue(1 <= int(response['Retry-After']) <= 61)
+
+    @override_settings(EVENTS_LONGPOLL_TIMEOUT=0.2)
+    async def test_open_connections_per_user_are_capped(self):
+        url = await sync_to_async(self.url)()
+        user_id = self.token.user_id
+        with mock.patch.object(broker, 'max_per_user', 2):
+            held = [await broker.subscribe([self.birou.id], user_id) for _ in range(2)]
+            response = await self.async_client.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '1')
+            with self.assertRaises(TooManyConnections):
+                await broker.subscribe([self.birou.id], user_id)
+
+            broker.unsubscribe(held.pop())
+            self.assertEqual((await self.async_client.get(url, headers=self.headers)).status_code, 204)
+            broker.unsubscribe(held.pop())
+        self.assertEqual(broker.per_user[user_id], 0)
+
+    async def test_broker_fans_out_per_set(self):
+        changes = ChangeBroker(poll_interval=60)
+        birou = await changes.subscribe([self.birou.id])
+        both = await changes.subscribe([self.birou.id, self.alt.id])
+
+        await sync_to_async(self.edit)(self.other)
+        await sync_to_async(self.edit)(self.shortcut)
+        await changes.publish_new_changes()
+        cursor = await sync_to_async(current_cursor)()
+        self.assertEqual(changes.last_id, cursor)
+        self.assertEqual(birou.queue.get_nowait(), (cursor, {self.birou.id}))
+        self.assertEqual(both.queue.get_nowait(), (cursor, {self.birou.id, self.alt.id}))
+
+        # Nothing new: nobody is notified again
+        await changes.publish_new_changes()
+        self.assertTrue(birou.queue.empty() and both.queue.empty())
+
+        changes.unsubscribe(birou)
+        changes.unsubscribe(both)
+        changes.notify()
+        await asyncio.wait_for(changes.task, 5)  # The reader stops without subscribers
+        self.assertIsNone(changes.task)
+
+
+class DeltaSyncTests(TestCase):
+    """Delta sync reports every change, deletion and set removal since a cursor"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('cosmin', password='secret')
+        token = ExpiringToken.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.birou = ShortcutSet.objects.create(name='Birou', set_type='general')
+        self.personal = ShortcutSet.objects.create(name='cosmin', set_type='personal', owner=self.user)
+        self.shortcuts = {}
+        for key in ('adr', 'b', 'sal'):
+            self.shortcuts[key] = Shortcut.objects.create(key=key, value=f'{key} birou')
+            self.shortcuts[key].sets.add(self.birou)
+        self.mine = Shortcut.objects.create(key='b', value='b personal', owner=self.user)
+        self.mine.sets.add(self.personal)
+
+    def cursor(self):
+        return encode_cursor(current_cursor())
+
+    def delta(self, since, sets='birou,cosmin'):
+        """({upserted keys}, [deleted ids]) since the cursor"""
+        response = self.client.get(f'/api/shortcuts/delta/?sets={sets}&since={since}')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return {row['key'] for row in data['upserts']}, sorted(data['deleted'])
+
+    def resolved_delta(self, since, sets='birou,cosmin'):
+        response = self.client.get(f'/api/shortcuts/delta/?sets={sets}&since={since}&resolved=1')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_no_changes(self):
+        since = self.cursor()
+        response = self.client.get(f'/api/shortcuts/delta/?sets=birou,cosmin&since={since}')
+        self.assertEqual(response.json(), {'cursor': since, 'upserts': [], 'deleted': []})
+
+    def test_unknown_or_inaccessible_set_is_rejected(self):
+        since = self.cursor()
+        ShortcutSet.objects.create(name='aura', set_type='personal', owner=User.objects.create_user('aura'))
+        for sets in ('birou,nu-exista', 'birou,aura'):
+            response = self.client.get(f'/api/shortcuts/delta/?sets={sets}&since={since}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'Unknown set.'})
+
+    def test_edits_upsert_every_shortcut_with_the_key(self):
+        since = self.cursor()
+        self.shortcuts['adr'].value = 'Strada 2'
+        self.shortcuts['adr'].save()
+        Shortcut.objects.create(key='m', value='Multumesc').sets.add(self.birou)
+        Shortcut.objects.create(key='x', value='Alt set').sets.add(ShortcutSet.objects.create(name='Alt'))
+        self.assertEqual(self.delta(since), ({'adr', 'm'}, []))
+
+        # Both rows of key "b", so the client can apply personal-over-general priority again
+        since = self.cursor()
+        self.shortcuts['b'].save()
+        response = self.client.get(f'/api/shortcuts/delta/?sets=birou,cosmin&since={since}')
+        self.assertEqual(sorted(row['value'] for row in response.json()['upserts']), ['b birou', 'b personal'])
+        self.assertEqual(self.resolved_delta(since)['upserts']['b']['value'], 'b personal')
+
+    def test_removal_from_a_set_is_a_tombstone(self):
+        shared = self.shortcuts['adr']
+        shared.sets.add(self.personal)
+        since = self.cursor()
+
+        self.birou.shortcuts.remove(self.shortcuts['sal'])
+        self.assertEqual(self.delta(since), (set(), [self.shortcuts['sal'].id]))
+
+        # Still in one of the requested sets: upserted with its new set names, not deleted
+        shared.sets.remove(self.birou)
+        self.assertEqual(self.delta(since), ({'adr'}, [self.shortcuts['sal'].id]))
+        self.assertEqual(self.resolved_delta(since)['upserts']['adr']['id'], shared.id)
+        self.assertEqual(self.delta(since, 'birou'), (set(), [shared.id, self.shortcuts['sal'].id]))
+
+    def test_clear_in_both_directions(self):
+        since = self.cursor()
+        self.mine.sets.clear()
+        self.assertEqual(self.delta(since), ({'b'}, [self.mine.id]))
+        self.assertEqual(self.resolved_delta(since)['upserts']['b']['value'], 'b birou')
+
+        since = self.cursor()
+        self.birou.shortcuts.clear()
+        self.assertEqual(self.delta(since), (set(), sorted(s.id for s in self.shortcuts.values())))
+
+    def test_deleted_shortcuts_leave_tombstones(self):
+        since = self.cursor()
+        sal_id, mine_id = self.shortcuts['sal'].id, self.mine.id
+        self.shortcuts['sal'].delete()
+        self.mine.delete()
+
+        self.assertEqual(self.delta(since), ({'b'}, sorted([sal_id, mine_id])))
+        delta = self.resolved_delta(since)
+        self.assertEqual(delta['upserts'], {'b': {'value': 'b birou', 'html_value': None, 'id': self.shortcuts['b'].id}})
+        self.assertEqual(sorted(delta['deleted']), sorted([sal_id, mine_id]))
+
+    def test_renamed_shortcut_is_also_reported_under_its_old_key(self):
+        since = self.cursor()
+        self.mine.key = 'bp'
+        self.mine.save()
+
+        # "b" falls back to the general row; clients drop the old "b" entry by id
+        delta = self.resolved_delta(since)
+        self.assertEqual(delta['upserts']['b']['value'], 'b birou')
+        self.assertEqual(delta['upserts']['bp']['id'], self.mine.id)
+        self.assertEqual(delta['deleted'], [])
+
+    def test_deleting_a_set_updates_the_rows_of_shortcuts_also_in_other_sets(self):
+        shared = self.shortcuts['adr']
+        shared.sets.add(self.personal)
+        since = self.cursor()
+
+        self.personal.delete()
+        response = self.client.get(f'/api/shortcuts/delta/?sets=birou&since={since}')
+        self.assertEqual(response.json()['upserts'], set_rows([self.birou.id])[:1])
+        self.assertEqual(response.json()['upserts'][0]['set_names'], ['Birou'])
+        self.assertEqual(response.json()['deleted'], [])
+
+    def test_unknown_cursors_must_resync(self):
+        for since in ('x', encode_cursor(current_cursor() + 1), ''):
+            response = self.client.get(f'/api/shortcuts/delta/?sets=birou&since={since}')
+            self.assertEqual(response.status_code, 400)
+            self.assertTrue(response.json()['resync'])
+
+    def test_pruned_cursors_must_resync(self):
+        old = self.cursor()
+        self.shortcuts['sal'].delete()
+        ShortcutChange.objects.update(created_at=timezone.now() - timedelta(days=100))
+        kept = self.cursor()
+        self.shortcuts['adr'].save()
+        latest = self.cursor()
+
+        out = StringIO()
+        call_command('prune_changes', '--days=90', stdout=out)
+        self.assertIn('Deleted', out.getvalue())
+        self.assertEqual(self.cursor(), latest)
+
+        response = self.client.get(f'/api/shortcuts/delta/?sets=birou,cosmin&since={old}')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Sync cursor expired. Do a full sync.', 'resync': True})
+        response = self.client.get(f'/api/events/?sets=birou&since={old}')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['resync'])
+
+        # Cursors after the pruned entries still get every change
+        self.assertEqual(self.delta(kept), ({'adr'}, []))
+
+        # The latest entry is kept, so the cursor never goes back
+        ShortcutChange.objects.update(created_at=timezone.now() - timedelta(days=100))
+        call_command('prune_changes', '--days=90', stdout=StringIO())
+        self.assertEqual(ShortcutChange.objects.count(), 1)
+        self.assertEqual(self.cursor(), latest)
+        self.assertEqual(self.delta(latest), (set(), []))
+
+    def test_set_saves_without_row_changes_are_not_logged(self):
+        since, changes = self.cursor(), ShortcutChange.objects.count()
+        version = ShortcutSet.objects.get(pk=self.birou.pk).version
+        self.client.get('/api/sets/')
+
+        self.birou.description = 'Shortcut-uri comune'
+        self.birou.save()
+        self.birou.save()
+        self.assertEqual(ShortcutChange.objects.count(), changes)
+        self.assertEqual(ShortcutSet.objects.get(pk=self.birou.pk).version, version)
+        self.assertEqual(self.delta(since), (set(), []))
+        self.assertEqual(self.client.get('/api/sets/').json()[0]['description'], 'Shortcut-uri comune')
+
+        self.birou.name = 'Office'
+        self.birou.save()
+        self.assertEqual(ShortcutChange.objects.count(), changes + 3)
+        self.assertEqual(self.delta(since, 'office,cosmin'), ({'adr', 'b', 'sal'}, []))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite runs one write transaction at a time')
+class ConcurrentWriterTests(TransactionTestCase):
+    """A cursor must never pass a change that commits later (ids are allocated before commit)"""
+
+    def setUp(self):
+        # Different sets, so the edits don't queue up on the same set row
+        self.first = Shortcut.objects.create(key='adr', value='Strada 1')
+        self.first.sets.add(ShortcutSet.objects.create(name='Birou', set_type='general'))
+        self.second = Shortcut.objects.create(key='sal', value='Salut')
+        self.second.sets.add(ShortcutSet.objects.create(name='Contabilitate', set_type='general'))
+
+    def snapshot(self):
+        """(cursor, log ids) read in one query, as a syncing client would see them"""
+        ids = set(ShortcutChange.objects.values_list('id', flat=True))
+        return max(ids, default=0), ids
+
+    def edit(self, shortcut, written=None, hold=None):
+        """Edit shortcut in its own connection, keeping the transaction open until hold is set"""
+        try:
+            with transaction.atomic():
+                shortcut.value += '!'
+                shortcut.save()
+                if written:
+                    written.set()
+                if hold:
+                    hold.wait(timeout=1)
+        finally:
+            connections.close_all()
+
+    def test_cursor_does_not_skip_uncommitted_changes(self):
+        first_written, second_done = threading.Event(), threading.Event()
+
+        def second_writer():
+            first_written.wait(timeout=5)
+            self.edit(self.second)
+            second_done.set()
+
+        threads = [
+            threading.Thread(target=self.edit, args=(self.first, first_written, second_done)),
+            threading.Thread(target=second_writer),
+        ]
+        for thread in threads:
+            thread.start()
+        # Without the change log lock the second edit commits while the first is still open
+        first_written.wait(timeout=5)
+        second_done.wait(timeout=0.5)
+        snapshots = [self.snapshot()]
+        for thread in threads:
+            thread.join()
+        snapshots.append(self.snapshot())
+
+        final_ids = self.snapshot()[1]
+        self.assertEqual(len(final_ids), 4)  # setUp's two additions and the two edits
+        for cursor, ids in snapshots:
+            self.assertEqual({i for i in final_ids if i <= cursor}, ids)
+
+
+class ChangeLogLockTests(TransactionTestCase):
+    """
+    Every writer takes the change log lock (sync.lock_change_log) before it writes.
+
+    ConcurrentWriterTests needs PostgreSQL; this checks the call order on any backend:
+    in a transaction no shortcut, set, membership or log row is written before the lock,
+    and log rows are never written outside a transaction holding it.
+    """
+
+    LOCK_CALLERS = [
+        'textsync.signals', 'textsync.importer',
+        'textsync.management.commands.fix_owners', 'textsync.management.commands.fix_shortcut_sets',
+    ]
+    WRITE = re.compile(r'\s*(?:INSERT INTO|UPDATE|DELETE FROM)\s+"(\w+)"', re.IGNORECASE)
+    TABLES = {model._meta.db_table for model in (Shortcut, ShortcutSet, Shortcut.sets.through, ShortcutChange)}
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+
+    def fixture(self, n):
+        birou = ShortcutSet.objects.create(name=f'Birou {n}', set_type='general')
+        alt = ShortcutSet.objects.create(name=f'Alt {n}', set_type='general')
+        shortcut = Shortcut.objects.create(key=f'adr{n}', value='Strada 1')
+        shortcut.sets.add(birou, alt)
+        return birou, alt, shortcut
+
+    def watch(self, db, events):
+        """Record lock calls, transaction ends and writes to the sync tables in events"""
+        def lock_change_log():
+            events.append(('lock', db.in_atomic_block))
+            sync.lock_change_log()
+
+        def execute(execute, sql, params, many, context):
+            if (match := self.WRITE.match(sql)) and match[1] in self.TABLES:
+                events.append(('write', match[1], db.in_atomic_block))
+            return execute(sql, params, many, context)
+
+        def ending(method):
+            def end():
+                events.append(('end',))
+                method()
+            return end
+
+        stack = ExitStack()
+        for module in self.LOCK_CALLERS:
+            stack.enter_context(mock.patch(f'{module}.lock_change_log', lock_change_log))
+        stack.enter_context(mock.patch.object(db, 'commit', ending(db.commit)))
+        stack.enter_context(mock.patch.object(db, 'rollback', ending(db.rollback)))
+        stack.enter_context(db.execute_wrapper(execute))
+        return stack
+
+    def unlocked_writes(self, events):
+        locked, unlocked = False, []
+        for event, *args in events:
+            if event == 'end':
+                locked = False
+            elif event == 'lock':
+                locked = locked or args[0]  # Outside a transaction the lock is a no-op
+            elif args[1]:
+                if not locked:
+                    unlocked.append(args[0])
+            else:
+                locked = False  # An autocommit statement is a transaction of its own
+                if args[0] == ShortcutChange._meta.db_table:
+                    unlocked.append(args[0])
+        return unlocked
+
+    def test_writers_lock_first(self):
+        def unlinked(birou, alt, shortcut):
+            Shortcut.objects.create(key='nou', value='Fără set')
+            call_command('fix_shortcut_sets', f'--set-name={birou.name}', stdout=StringIO())
+
+        def rename_user(birou, alt, shortcut):
+            shortcut.owner = User.objects.create_user(f'cosmin{shortcut.pk}')
+            shortcut.save()
+            shortcut.owner.username += '2'
+            shortcut.owner.save()
+
+        writers = {
+            'edit': lambda b, a, s: s.save(),
+            'rename key': lambda b, a, s: setattr(s, 'key', s.key + '2') or s.save(),
+            'delete shortcut': lambda b, a, s: s.delete(),
+            'add to set': lambda b, a, s: s.sets.add(ShortcutSet.objects.create(name=f'Nou {s.pk}')),
+            'remove from set': lambda b, a, s: s.sets.remove(a),
+            'clear sets': lambda b, a, s: s.sets.clear(),
+            'set members add': lambda b, a, s: b.shortcuts.add(Shortcut.objects.create(key=f'x{s.pk}')),
+            'set members clear': lambda b, a, s: b.shortcuts.clear(),
+            'rename set': lambda b, a, s: setattr(b, 'name', b.name + '2') or b.save(),
+            'delete set': lambda b, a, s: a.delete(),
+            'rename user': rename_user,
+            'import': lambda b, a, s: import_shortcuts(b, [{'key': 'k', 'value': 'v'}], prune=True),
+            'fix_shortcut_sets': unlinked,
+            'fix_owners': lambda b, a, s: call_command('fix_owners', stdout=StringIO()),
+        }
+        db = connections['default']
+        for n, (name, in_transaction) in enumerate(product(writers, (False, True))):
+            with self.subTest(name, in_transaction=in_transaction):
+                fixture = self.fixture(n)
+                since, events = current_cursor(), []
+                with self.watch(db, events), (transaction.atomic() if in_transaction else nullcontext()):
+                    writers[name](*fixture)
+                self.assertGreater(current_cursor(), since)  # Something was logged
+                self.assertEqual(self.unlocked_writes(events), [])
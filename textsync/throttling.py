@@ -0,0 +1,134 @@
+"""
+API throttles with O(1) state per client, kept in the shared "throttle" cache.
+
+DRF's SimpleRateThrottle stores the timestamp of every request in the window and
+rewrites that list on each request (up to 1000 entries per user at 1000/hour).
+These throttles use a sliding-window counter instead: one integer per fixed window,
+with the previous window's count weighted by how much of it still overlaps the last
+`duration` seconds. That is two small cache values per client, read with one
+get_many() and updated with one incr() (atomic on Redis and LocMem; the file cache
+has no atomic increment, so concurrent requests of one client may occasionally count once).
+
+The "throttle" cache must be shared by all worker processes (see CACHES in settings),
+otherwise every worker enforces the limit on its own.
+"""
+
+import hashlib
+import math
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from rest_framework.throttling import SimpleRateThrottle
+
+from .metrics import phase
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """SimpleRateThrottle with a sliding-window counter instead of a request history"""
+
+    cache_alias = 'throttle'
+
+    def __init__(self):
+        super().__init__()
+        self.cache = caches[self.cache_alias]
+        self.wait_seconds = None
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        with phase(request, 'throttle'):
+            return self.hit(self.key)
+
+    def hit(self, key):
+        """Count one request for key if it is under the limit; returns whether it is"""
+        now = self.timer()
+        window, elapsed = divmod(now, self.duration)
+        current_key, previous_key = f"{key}:{int(window)}", f"{key}:{int(window) - 1}"
+
+        counts = self.cache.get_many([current_key, previous_key])
+        current, previous = counts.get(current_key, 0), counts.get(previous_key, 0)
+        if previous * (1 - elapsed / self.duration) + current >= self.num_requests:
+            self.wait_seconds = self.retry_after(current, previous, elapsed)
+            return False
+
+        # The counter must outlive the next window too (it is that window's "previous")
+        if type(self.cache).incr is BaseCache.incr:
+            # Generic incr() is get + set without a timeout (file cache): set it ourselves
+            self.cache.set(current_key, current + 1, 2 * self.duration)
+            return True
+        try:
+            self.cache.incr(current_key)
+        except ValueError:
+            # First request of the window
+            if not self.cache.add(current_key, 1, 2 * self.duration):
+                self.cache.incr(current_key)
+        return True
+
+    def retry_after(self, current, previous, elapsed):
+        """Seconds until the weighted count drops below the limit again (it is still at it then)"""
+        limit, duration = self.num_requests, self.duration
+        if current < limit:
+            # Still in this window, once enough of the previous window has slid out
+            return duration * (1 - (limit - current) / previous) - elapsed
+        # Next window: the current count becomes the previous one and slides out
+        return duration - elapsed + max(0.0, duration * (1 - limit / current))
+
+    def wait(self):
+        if self.wait_seconds is None:
+            return None
+        # Strictly past retry_after(): a client retrying right on time is let through
+        return max(math.floor(self.wait_seconds) + 1, 1)
+
+
+class AnonSlidingWindowThrottle(SlidingWindowRateThrottle):
+    """Anonymous requests, per client IP (rate "anon")"""
+
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None  # Only throttle unauthenticated requests.
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class UserSlidingWindowThrottle(SlidingWindowRateThrottle):
+    """Authenticated requests per user, anonymous ones per client IP (rate "user")"""
+
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class LoginRateThrottle(SlidingWindowRateThrottle):
+    """
+    Login attempts (rate "login"), counted per client IP and per username, so guessing
+    passwords is slowed down whether it targets one account or comes from one address.
+    Used instead of the default throttles on login_view: logins and sync requests
+    don't share a budget.
+    """
+
+    scope = 'login'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+    def allow_request(self, request, view):
+        if not super().allow_request(request, view):
+            return False
+
+        username = request.data.get('username') if hasattr(request, 'data') else None
+        if not username or self.rate is None:
+            return True
+        ident = hashlib.sha1(str(username).lower().encode()).hexdigest()  # Safe as a cache key
+        with phase(request, 'throttle'):
+            return self.hit(self.cache_format % {'scope': f"{self.scope}_user", 'ident': ident})
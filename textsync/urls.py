@@ -1,7 +1,9 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from .views import ShortcutViewSet, ShortcutSetViewSet, login_view, logout_view, verify_token_view
+from .views import (
+    ShortcutViewSet, ShortcutSetViewSet, events_view, login_view, logout_view, metrics_view, verify_token_view,
+)
 
 router = DefaultRouter()
 router.register(r"sets", ShortcutSetViewSet, basename="shortcutset")
@@ -12,4 +14,8 @@ urlpatterns = [
     path('auth/login/', login_view, name='login'),
     path('auth/logout/', logout_view, name='logout'),
     path('auth/verify/', verify_token_view, name='verify_token'),
+    # Change notifications (ASGI)
+    path('events/', events_view, name='events'),
+    # Monitoring
+    path('metrics/', metrics_view, name='metrics'),
 ] + router.urls
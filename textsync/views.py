@@ -1,101 +1,407 @@
-from rest_framework import permissions, viewsets, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework import exceptions, permissions, viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes, throttle_classes
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
 from django.contrib.auth import authenticate
-from django.db.models import Q
+from django.db.models import Count, Prefetch
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.http import parse_etags
+from django.contrib.auth.models import User
 from django.shortcuts import render
+from asgiref.sync import sync_to_async
 from datetime import timedelta
-
+from itertools import islice
+import asyncio
+import math
+
+from .asyncviews import AsyncAPIViewMixin
+from .authentication import ExpiringTokenAuthentication
+from .bundles import bundle_json, bundle_rows
+from .caching import CachedValue, set_namespaces
+from .events import TooManyConnections, broker, changed_set_ids
+from .metrics import phase, registry
 from .models import Shortcut, ShortcutSet, ExpiringToken
+from .renderers import NDJSONRenderer
+from .search import search_ids, search_terms
 from .serializers import ShortcutSerializer, ShortcutSetSerializer
+from .sync import (
+    CursorExpired, accessible_set_ids, achunks, acurrent_cursor, akeyset_page, alog_bounds,
+    ashortcut_rows, changes_since, columnar_rows, decode_cursor, decode_page_token, encode_cursor,
+    encode_page_token, get_snapshot, iter_resolved, iter_shortcut_rows, log_bounds, render_json,
+    requested_set_ids, resolved_map, set_access, shortcut_rows, snapshot_etag, with_sync_relations,
+)
+from .throttling import LoginRateThrottle
+
+UNKNOWN_CURSOR = 'Unknown sync cursor. Do a full sync.'
+EXPIRED_CURSOR = 'Sync cursor expired. Do a full sync.'
+UNKNOWN_SET = 'Unknown set.'
+TOO_MANY_CONNECTIONS = 'Too many open connections.'
 
 
-class ShortcutSetViewSet(viewsets.ReadOnlyModelViewSet):
+class ShortcutSetViewSet(AsyncAPIViewMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for listing available shortcut sets.
     Read-only - sets are managed via Django admin.
     Staff users see only their own sets + sets shared with them.
     Superusers see all sets.
+    Async (see asyncviews.py): under ASGI requests wait on the event loop, not a worker.
     """
     serializer_class = ShortcutSetSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
-        if user.is_superuser:
+        return self.visible_sets(None if user.is_superuser else accessible_set_ids(user))
+
+    async def aget_queryset(self):
+        user = self.request.user
+        return self.visible_sets(None if user.is_superuser else await sync_to_async(accessible_set_ids)(user))
+
+    def visible_sets(self, set_ids):
+        # Preload everything ShortcutSetSerializer reads: one query for sets, one for visible_to
+        queryset = ShortcutSet.objects.select_related('owner').prefetch_related(
+            Prefetch('visible_to', queryset=User.objects.only('id', 'username'))
+        ).annotate(
+            shortcut_count=Count('shortcuts', distinct=True)
+        ).order_by('set_type', 'name')
+
+        if set_ids is None:
             # Superusers see all sets
-            return ShortcutSet.objects.all().order_by('set_type', 'name')
+            return queryset
 
-        # Business rule:
+        # Business rule (cached per user, see sync.set_access):
         # - General sets: visible to everyone (no filter)
         # - Personal sets: visible only to owner
-        return ShortcutSet.objects.filter(
-            Q(set_type='general') | Q(owner=user)
-        ).distinct().order_by('set_type', 'name')
+        return queryset.filter(pk__in=set_ids)
+
+    async def list(self, request, *args, **kwargs):
+        # set_access() is in ShortcutSet ordering; only sets missing from the cache are queried
+        set_ids = await sync_to_async(lambda: list(set_access(request.user).values()))()
+        data = await sync_to_async(ShortcutSetSerializer.cached_data)(set_ids, self.visible_sets)
+        return Response(data)
+
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object(self.filter_queryset(await self.aget_queryset()))
+        return Response(self.get_serializer(instance).data)
 
 
-class ShortcutViewSet(viewsets.ReadOnlyModelViewSet):
+class ShortcutViewSet(AsyncAPIViewMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for shortcuts (READ-ONLY).
     Shortcuts can only be created/edited via Django Admin.
     Supports filtering by sets: /api/shortcuts/?sets=birou,cosmin
 
+    The list response carries an opaque X-Sync-Cursor header; pass it back as ?since=
+    (here or on /api/shortcuts/delta/) to fetch only what changed afterwards, including deletions.
+
+    With ?resolved=1 the personal-over-general priority is applied on the server and a
+    compact { key: {value, html_value, id} } map is returned instead of raw rows.
+    With ?layout=columnar raw rows are sent dictionary-encoded (see sync.columnar_rows).
+    Whole (unpaginated) plain-JSON lists are merged from pre-rendered per-set bundles and
+    served from the cache until one of their sets changes.
+
+    Large sets:
+    - ?limit=N returns keyset pages { "next": url|null, "results": ... }; follow "next" (?after=)
+      until it is null. Every page carries the X-Sync-Cursor of the first one.
+    - ?format=ndjson (or Accept: application/x-ndjson) streams one row per line
+      (one resolved entry per key with ?resolved=1) with flat memory on the server.
+
+    Full-text search: /api/shortcuts/search/?q=...
+
+    The list is async (see asyncviews.py); the other actions are regular sync views.
+
     Security: Only returns shortcuts that the authenticated user has access to.
     """
     serializer_class = ShortcutSerializer
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
 
     def get_queryset(self):
-        user = self.request.user
-        queryset = Shortcut.objects.prefetch_related('sets').order_by("key")
-
-        # Get sets that user has access to (same logic as ShortcutSetViewSet)
-        if user.is_superuser:
-            accessible_sets = ShortcutSet.objects.all()
-        else:
-            # User can access: general sets + their own personal sets
-            accessible_sets = ShortcutSet.objects.filter(
-                Q(set_type='general') | Q(owner=user)
-            )
-
-        # Filter by sets parameter (if provided)
-        sets_param = self.request.query_params.get('sets', None)
-
-        if sets_param:
-            # User specified which sets they want
-            requested_set_names = [s.strip() for s in sets_param.split(',')]
-
-            # Validate: user can only request sets they have access to (case-insensitive)
-            # Build Q filter for case-insensitive matching
-            q_filters = Q()
-            for name in requested_set_names:
-                q_filters |= Q(name__iexact=name)
+        return self.shortcuts(requested_set_ids(self.request.user, self.request.query_params.get('sets', None)))
 
-            requested_sets = accessible_sets.filter(q_filters)
+    async def aget_queryset(self):
+        return self.shortcuts(
+            await sync_to_async(requested_set_ids)(self.request.user, self.request.query_params.get('sets', None))
+        )
 
-            # Security check: if user requested sets they don't have access to, return empty
-            if requested_sets.count() != len(requested_set_names):
-                # Some requested sets don't exist or user doesn't have access
-                return queryset.none()
+    def shortcuts(self, set_ids):
+        """
+        Shortcuts of the sets the user asked for (or all accessible sets if no ?sets= given).
+        set_ids None means some requested set doesn't exist or the user has no access to it.
+        """
+        queryset = with_sync_relations(Shortcut.objects.order_by("key", "id"))
+        if set_ids is None:
+            return queryset.none()
 
-            # Return shortcuts from the validated requested sets
-            queryset = queryset.filter(sets__in=requested_sets).distinct()
-        else:
-            # No sets param provided: return shortcuts from ALL accessible sets
-            # This prevents exposing all shortcuts - only those in accessible sets
-            queryset = queryset.filter(sets__in=accessible_sets).distinct()
+        queryset = queryset.filter(sets__in=set_ids).distinct()
 
-        # Delta sync: filter by updated_after timestamp
+        # Legacy delta sync by client timestamp (kept for old extension versions, prefer ?since=)
         updated_after = self.request.query_params.get('updated_after', None)
         if updated_after:
             queryset = queryset.filter(updated_at__gt=updated_after)
 
         return queryset
 
+    def wants_resolved(self, request):
+        return request.query_params.get('resolved', '').lower() in ('1', 'true', 'yes')
+
+    def wants_columnar(self, request):
+        return request.query_params.get('layout', '') == 'columnar'
+
+    def page_limit(self, request):
+        """?limit= clamped to SHORTCUT_PAGE_MAX_SIZE, or None for an unpaginated list"""
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            return None
+        return min(max(limit, 1), settings.SHORTCUT_PAGE_MAX_SIZE)
+
+    async def list(self, request, *args, **kwargs):
+        if 'since' in request.query_params:
+            return await sync_to_async(self.delta)(request)
+
+        if isinstance(request.accepted_renderer, NDJSONRenderer):
+            return await self.stream(request)
+
+        set_ids = await sync_to_async(requested_set_ids)(request.user, request.query_params.get('sets', None))
+        cached = self.cached_list(request, set_ids)
+        if cached is not None:
+            if (hit := await cached.aget()) is not None:
+                return self.json_response(*hit)
+            # Read the cursor first: anything committed while we merge is re-sent next time
+            cursor = await acurrent_cursor()
+            with phase(request, 'serialize'):
+                body = await sync_to_async(self.bundled_list)(request, set_ids)
+            await cached.aset((cursor, body))
+            return self.json_response(cursor, body)
+
+        queryset = self.filter_queryset(self.shortcuts(set_ids))
+        limit = self.page_limit(request)
+        after = request.query_params.get('after')
+        next_position = None
+
+        if after:
+            try:
+                cursor, position = decode_page_token(after)
+            except ValueError:
+                return Response({'error': 'Invalid page token.'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            # Read the cursor first: anything committed while we serialize is re-sent next time
+            cursor, position = await acurrent_cursor(), None
+
+        if limit is None and position is not None:
+            limit = settings.SHORTCUT_PAGE_MAX_SIZE
+        if limit is not None:
+            queryset, next_position = await akeyset_page(queryset, limit, position)
+
+        if self.wants_resolved(request):
+            with phase(request, 'serialize'):
+                data = resolved_map(await ashortcut_rows(queryset))
+        elif self.wants_columnar(request):
+            with phase(request, 'serialize'):
+                data = columnar_rows(await ashortcut_rows(queryset))
+        elif self.wants_plain_json(request):
+            # Fast path for plain JSON (what the extension asks for): same bytes as the
+            # serializer would produce, built from values() without model instances
+            with phase(request, 'serialize'):
+                data = await ashortcut_rows(queryset)
+        else:
+            with phase(request, 'serialize'):
+                data = self.get_serializer([shortcut async for shortcut in queryset], many=True).data
+
+        if limit is None and self.wants_plain_json(request):
+            with phase(request, 'serialize'):
+                return self.json_response(cursor, render_json(data))
+
+        if limit is not None:
+            next_url = None
+            if next_position is not None:
+                next_url = replace_query_param(
+                    request.build_absolute_uri(), 'after', encode_page_token(cursor, next_position)
+                )
+            data = {'next': next_url, 'results': data}
+
+        response = Response(data)
+        response['X-Sync-Cursor'] = encode_cursor(cursor)
+        return response
+
+    def wants_plain_json(self, request):
+        return isinstance(request.accepted_renderer, JSONRenderer) and 'indent' not in request.accepted_media_type
+
+    def cached_list(self, request, set_ids):
+        """
+        CachedValue for the rendered body of a whole plain-JSON list (what the extension
+        fetches), kept in the namespaces of the listed sets; None if the request isn't cacheable.
+        Cacheable lists are built from the set bundles (bundled_list).
+        """
+        params = request.query_params
+        if not set_ids or not self.wants_plain_json(request) or {'limit', 'after', 'updated_after'} & set(params):
+            return None
+        layout = 'resolved' if self.wants_resolved(request) else 'columnar' if self.wants_columnar(request) else 'rows'
+        return CachedValue('shortcuts', set_namespaces(set_ids), layout)
+
+    def bundled_list(self, request, set_ids):
+        """Rendered whole list of the sets, merged from their pre-rendered bundles (see bundles.py)"""
+        if self.wants_resolved(request):
+            return render_json(resolved_map(bundle_rows(set_ids)))
+        if self.wants_columnar(request):
+            return render_json(columnar_rows(bundle_rows(set_ids)))
+        return bundle_json(set_ids)
+
+    def json_response(self, cursor, body):
+        response = HttpResponse(body, content_type='application/json')
+        response['X-Sync-Cursor'] = encode_cursor(cursor)
+        return response
+
+    async def stream(self, request):
+        """
+        NDJSON list: rows are read with .iterator() in SHORTCUT_STREAM_CHUNK_SIZE chunks and
+        written as they are produced, so worker memory stays flat however large the sets are.
+        """
+        cursor = await acurrent_cursor()
+        chunk_size = settings.SHORTCUT_STREAM_CHUNK_SIZE
+        queryset = self.filter_queryset(await self.aget_queryset())
+        resolved = self.wants_resolved(request)
+
+        rows = iter_shortcut_rows(queryset, chunk_size)
+        if resolved:
+            rows = iter_resolved(rows)
+
+        # Django collects the whole body first when the iterator doesn't match the server
+        # (sync under ASGI, async under WSGI), so stream with the kind the server consumes
+        if isinstance(request._request, ASGIRequest):
+            async def body():
+                # One write per chunk of rows rather than per row
+                async for chunk in achunks(rows, chunk_size):
+                    yield b'\n'.join(render_json(row) for row in chunk) + b'\n'
+        else:
+            def body():
+                # One write per chunk of rows rather than per row
+                while lines := [render_json(row) for row in islice(rows, chunk_size)]:
+                    yield b'\n'.join(lines) + b'\n'
+
+        response = StreamingHttpResponse(body(), content_type=NDJSONRenderer.media_type)
+        response['X-Sync-Cursor'] = encode_cursor(cursor)
+        return response
+
+    @action(detail=False, methods=['get'])
+    def delta(self, request):
+        """
+        Changes since a previously issued sync cursor.
+
+        GET /api/shortcuts/delta/?sets=birou,cosmin&since=<cursor>
+        Returns: { "cursor": "...", "upserts": [...shortcuts...], "deleted": [ids] }
+
+        "deleted" lists shortcut ids that were deleted or removed from the requested sets.
+        With ?resolved=1, "upserts" is the resolved { key: {value, html_value, id} } map
+        for every key touched since the cursor.
+        An unknown cursor, or one older than the pruned change log (prune_changes), returns
+        400 with "resync": true - the client should fall back to a full sync.
+        An unknown or inaccessible set in ?sets= returns 400 "Unknown set.".
+        """
+        horizon, cursor = log_bounds()
+        try:
+            since = decode_cursor(request.query_params.get('since', ''), horizon)
+        except CursorExpired:
+            return Response({'error': EXPIRED_CURSOR, 'resync': True}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            since = None
+
+        if since is None or since > cursor:
+            return Response({'error': UNKNOWN_CURSOR, 'resync': True}, status=status.HTTP_400_BAD_REQUEST)
+
+        set_ids = requested_set_ids(request.user, request.query_params.get('sets', None))
+        if set_ids is None:
+            return Response({'error': UNKNOWN_SET}, status=status.HTTP_400_BAD_REQUEST)
+        with phase(request, 'serialize'):
+            upserts, deleted = changes_since(set_ids, since, cursor)
+            if self.wants_resolved(request):
+                upserts = resolved_map(upserts)
+            elif self.wants_columnar(request):
+                upserts = columnar_rows(upserts)
+
+        return Response({
+            'cursor': encode_cursor(cursor),
+            'upserts': upserts,
+            'deleted': deleted,
+        })
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over key, value and the text of html_value, best match first.
+
+        GET /api/shortcuts/search/?q=adresa firma&sets=birou,cosmin&limit=20
+        Returns: { "next": url|null, "results": [...shortcuts...] }
+
+        Every word must match the start of a word; keys weigh more than the text.
+        Follow "next" (?offset=) for more results. An unknown or inaccessible set returns 400.
+        """
+        query = request.query_params.get('q', '')
+        if not search_terms(query):
+            return Response({'error': 'Search query (?q=) required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        set_ids = requested_set_ids(request.user, request.query_params.get('sets', None))
+        if set_ids is None:
+            return Response({'error': UNKNOWN_SET}, status=status.HTTP_400_BAD_REQUEST)
+        limit = self.page_limit(request) or settings.SHORTCUT_SEARCH_PAGE_SIZE
+        try:
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            offset = 0
+
+        with phase(request, 'search'):
+            # One extra id tells whether there is a next page
+            ids = search_ids(query, set_ids, limit + 1, offset)
+        with phase(request, 'serialize'):
+            rows = {row['id']: row for row in shortcut_rows(Shortcut.objects.filter(id__in=ids[:limit]))}
+
+        next_url = None
+        if len(ids) > limit:
+            next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + limit)
+        return Response({'next': next_url, 'results': [rows[i] for i in ids[:limit] if i in rows]})
+
+    @action(detail=False, methods=['get'])
+    def snapshot(self, request):
+        """
+        Whole resolved shortcut map for the requested sets as one pre-rendered blob.
+
+        GET /api/shortcuts/snapshot/?sets=birou,cosmin
+        Returns: { "sets": [...], "shortcuts": { key: {value, html_value, id, sets, is_personal} } }
+
+        The ETag changes only when one of the sets changes, so clients should send
+        If-None-Match and get a 304 (no Shortcut queries) when nothing changed.
+        An unknown or inaccessible set returns 400 rather than an empty snapshot.
+        """
+        set_ids = requested_set_ids(request.user, request.query_params.get('sets', None))
+        if set_ids is None:
+            return Response({'error': UNKNOWN_SET}, status=status.HTTP_400_BAD_REQUEST)
+        sets = list(ShortcutSet.objects.filter(pk__in=set_ids).only('id', 'name', 'version').order_by())
+        etag = snapshot_etag(sets)
+
+        # Weak comparison: compressed responses carry W/"..." (see SyncCompressionMiddleware)
+        if etag in [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            with phase(request, 'serialize'):
+                body = get_snapshot(sets, etag, bundle_rows)
+            response = HttpResponse(body, content_type='application/json')
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([LoginRateThrottle])
 def login_view(request):
     """
     Login endpoint. Returns auth token on success.
@@ -163,27 +469,186 @@ def logout_view(request):
         return Response({'message': 'No active session'})
 
 
+class VerifyTokenView(AsyncAPIViewMixin, APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request):
+        """
+        Verify if token is still valid.
+
+        GET /api/auth/verify/
+        Headers: Authorization: Token abc123...
+        Returns: { "valid": true, "user": {...}, "expires_at": "..." }
+        """
+        token = request.auth  # The user's ExpiringToken, already loaded by authentication
+
+        return Response({
+            'valid': not token.is_expired(),
+            'expires_at': token.expires_at.isoformat(),
+            'user': {
+                'id': request.user.id,
+                'username': request.user.username,
+                'email': request.user.email,
+            }
+        })
+
+
+verify_token_view = VerifyTokenView.as_view()
+
+
 @api_view(['GET'])
-@permission_classes([permissions.IsAuthenticated])
-def verify_token_view(request):
+@permission_classes([permissions.IsAdminUser])
+def metrics_view(request):
     """
-    Verify if token is still valid.
+    Per-view request metrics of this worker process in the Prometheus text format.
 
-    GET /api/auth/verify/
-    Headers: Authorization: Token abc123...
-    Returns: { "valid": true, "user": {...}, "expires_at": "..." }
+    GET /api/metrics/
+    Headers: Authorization: Token abc123... (staff user)
     """
-    token = request.user.auth_token
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-    return Response({
-        'valid': not token.is_expired(),
-        'expires_at': token.expires_at.isoformat(),
-        'user': {
-            'id': request.user.id,
-            'username': request.user.username,
-            'email': request.user.email,
-        }
-    })
+
+async def release_connections():
+    """
+    Close this request's database connections before waiting, so a waiting client holds none
+    (under Django's own ASGI handler each request also has a thread, and with it a connection).
+    The broker reads the change log on its own connection (see events.py).
+    """
+    await sync_to_async(connections.close_all)()
+
+
+def throttle_wait(request):
+    """DRF's check_throttles for a plain Django view: seconds to wait, or None if allowed"""
+    waits = [
+        throttle.wait() for throttle in (cls() for cls in api_settings.DEFAULT_THROTTLE_CLASSES)
+        if not throttle.allow_request(request, None)
+    ]
+    if not waits:
+        return None
+    return max((wait for wait in waits if wait is not None), default=None) or 1
+
+
+def too_many_requests(detail, wait):
+    response = JsonResponse({'detail': str(detail)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(max(math.ceil(wait), 1))
+    return response
+
+
+async def events_view(request):
+    """
+    Change notifications, so clients fetch /api/shortcuts/delta/ only when something changed.
+
+    GET /api/events/?sets=birou,cosmin&since=<X-Sync-Cursor or delta cursor>
+    Headers: Authorization: Token abc123...
+
+    - Accept: text/event-stream: Server-Sent Events. One "changed" event per change,
+      data: { "cursor": "...", "sets": ["birou"] } (the cursor is also the event id),
+      ": ping" comments in between. The stream ends after EVENTS_STREAM_TIMEOUT seconds;
+      reconnect with the last cursor (?since= or Last-Event-ID).
+    - Otherwise long-poll: 200 with one such object as soon as a requested set changed
+      after ?since=, or 204 after EVENTS_LONGPOLL_TIMEOUT seconds.
+
+    Without ?since= only changes from now on are reported. An unknown or expired cursor
+    returns 400 (do a full sync). Needs an ASGI server with config/asgi.py, which runs these
+    requests without a thread each: a waiting client is a coroutine.
+
+    Counted by the API throttles like every other request; a user may keep at most
+    EVENTS_MAX_CONNECTIONS_PER_USER connections open per worker process (429 beyond that).
+    """
+    try:
+        authenticated = await sync_to_async(ExpiringTokenAuthentication().authenticate)(request)
+    except exceptions.AuthenticationFailed as e:
+        authenticated, error = None, str(e.detail)
+    else:
+        error = 'Authentication credentials were not provided.'
+    if authenticated is None:
+        response = JsonResponse({'detail': error}, status=status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = ExpiringTokenAuthentication.keyword
+        return response
+    user = request.user = authenticated[0]  # The throttles count authenticated requests per user
+
+    wait = await sync_to_async(throttle_wait)(request)
+    if wait is not None:
+        return too_many_requests(exceptions.Throttled(wait).detail, wait)
+    if broker.at_limit(user.pk):
+        return too_many_requests(TOO_MANY_CONNECTIONS, settings.EVENTS_LONGPOLL_TIMEOUT)
+
+    set_ids = await sync_to_async(requested_set_ids)(user, request.GET.get('sets'))
+    if set_ids is None:
+        return JsonResponse({'error': UNKNOWN_SET}, status=status.HTTP_400_BAD_REQUEST)
+    set_names = {set_id: name for name, set_id in (await sync_to_async(set_access)(user)).items()}
+
+    since = request.GET.get('since') or request.headers.get('Last-Event-ID')
+    if since:
+        horizon, cursor = await alog_bounds()
+        try:
+            since = decode_cursor(since, horizon)
+        except CursorExpired:
+            return JsonResponse({'error': EXPIRED_CURSOR, 'resync': True}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            since = None
+        if since is None or since > cursor:
+            return JsonResponse({'error': UNKNOWN_CURSOR, 'resync': True}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        since = await acurrent_cursor()
+
+    def changed(cursor, changed_ids):
+        return {'cursor': encode_cursor(cursor), 'sets': sorted(set_names[set_id] for set_id in changed_ids)}
+
+    # Subscribe before reading the log, so nothing committed in between is missed
+    if 'text/event-stream' not in request.headers.get('Accept', ''):
+        request.long_poll = True
+        try:
+            subscription = await broker.subscribe(set_ids, user.pk)
+        except TooManyConnections:
+            return too_many_requests(TOO_MANY_CONNECTIONS, settings.EVENTS_LONGPOLL_TIMEOUT)
+        try:
+            cursor, changed_ids = await changed_set_ids(set_ids, since)
+            if not changed_ids:
+                await release_connections()
+                cursor, changed_ids = await asyncio.wait_for(
+                    subscription.queue.get(), settings.EVENTS_LONGPOLL_TIMEOUT
+                )
+        except asyncio.TimeoutError:
+            return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+        finally:
+            broker.unsubscribe(subscription)
+        return JsonResponse(changed(cursor, changed_ids))
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.EVENTS_STREAM_TIMEOUT
+        sent = since
+        try:
+            subscription = await broker.subscribe(set_ids, user.pk)
+        except TooManyConnections:
+            return  # Opened concurrently with the connection that took the last slot
+        try:
+            yield b'retry: 5000\n\n'
+            cursor, changed_ids = await changed_set_ids(set_ids, since)
+            await release_connections()
+            while True:
+                if changed_ids and cursor > sent:
+                    sent = cursor
+                    event = changed(cursor, changed_ids)
+                    yield f"id: {event['cursor']}\nevent: changed\ndata: {render_json(event).decode()}\n\n".encode()
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                try:
+                    cursor, changed_ids = await asyncio.wait_for(
+                        subscription.queue.get(), min(settings.EVENTS_HEARTBEAT, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    changed_ids = None
+                    yield b': ping\n\n'
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: pass events through unbuffered
+    return response
 
 
 def privacy_view(request):